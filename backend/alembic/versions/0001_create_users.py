@@ -10,7 +10,7 @@ import sqlalchemy as sa
 
 revision = "0001_create_users"
 down_revision = None
-branch_labels = None
+branch_labels = ("main",)
 depends_on = None
 
 
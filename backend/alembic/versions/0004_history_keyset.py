@@ -0,0 +1,43 @@
+"""keyset pagination for query history
+
+Revision ID: 0004_history_keyset
+Revises: 0003_create_queries
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_history_keyset"
+down_revision = "0003_create_queries"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "queries",
+        sa.Column("latest_version_no", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.execute(
+        """
+        UPDATE queries
+        SET latest_version_no = COALESCE(
+            (SELECT MAX(version_no) FROM query_versions WHERE query_id = queries.id),
+            0
+        )
+        """
+    )
+    op.create_index(
+        "ix_queries_user_id_created_at",
+        "queries",
+        ["user_id", "created_at", "id"],
+        unique=False,
+    )
+    op.create_index("ix_queries_created_at", "queries", ["created_at", "id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_queries_created_at", table_name="queries")
+    op.drop_index("ix_queries_user_id_created_at", table_name="queries")
+    op.drop_column("queries", "latest_version_no")
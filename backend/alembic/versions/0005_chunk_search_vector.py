@@ -0,0 +1,39 @@
+"""full-text search vector on document chunks
+
+Revision ID: 0005_chunk_search_vector
+Revises: 0004_history_keyset
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+
+revision = "0005_chunk_search_vector"
+down_revision = "0004_history_keyset"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Used by LEXICAL_RETRIEVER=postgres; other databases keep BM25 only.
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    # A stored generated column is computed for existing rows when added, and
+    # kept current on every insert/update of the chunk text.
+    op.execute(
+        """
+        ALTER TABLE document_chunks
+        ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('russian', text)) STORED
+        """
+    )
+    op.execute(
+        "CREATE INDEX ix_document_chunks_search_vector "
+        "ON document_chunks USING gin (search_vector)"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_document_chunks_search_vector")
+    op.execute("ALTER TABLE document_chunks DROP COLUMN IF EXISTS search_vector")
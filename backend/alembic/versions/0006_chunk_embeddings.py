@@ -0,0 +1,60 @@
+"""pgvector table for chunk embeddings
+
+Revision ID: 0006_chunk_embeddings
+Revises:
+Create Date: 2026-10-19 00:00:00.000000
+
+Optional branch for VECTOR_BACKEND=pgvector, applied with
+``alembic upgrade pgvector@head``. The column dimension must match the
+embedding model (768 for multilingual-e5-base); pass
+``-x pgvector_dim=N`` for another model.
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0006_chunk_embeddings"
+down_revision = None
+branch_labels = ("pgvector",)
+depends_on = "0005_chunk_search_vector"
+
+DEFAULT_DIMENSION = 768
+
+
+def _dimension() -> int:
+    value = context.get_x_argument(as_dictionary=True).get("pgvector_dim", DEFAULT_DIMENSION)
+    return int(value)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        raise RuntimeError("chunk_embeddings needs PostgreSQL with the pgvector extension.")
+    available = bind.execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")
+    ).first()
+    if available is None:
+        raise RuntimeError(
+            "The pgvector extension is not installed on this server; "
+            "use the pgvector/pgvector image or keep VECTOR_BACKEND=faiss."
+        )
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    # IF NOT EXISTS: databases migrated before this revision left the main
+    # chain may already have the table.
+    op.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS chunk_embeddings (
+            chunk_id integer PRIMARY KEY REFERENCES document_chunks (id) ON DELETE CASCADE,
+            model varchar(255) NOT NULL,
+            embedding vector({_dimension()}) NOT NULL
+        )
+        """
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_chunk_embeddings_embedding "
+        "ON chunk_embeddings USING hnsw (embedding vector_ip_ops)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS chunk_embeddings")
@@ -0,0 +1,26 @@
+"""index document chunks by position
+
+Revision ID: 0007_chunk_index_order
+Revises: 0005_chunk_search_vector
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+
+revision = "0007_chunk_index_order"
+down_revision = "0005_chunk_search_vector"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_document_chunks_document_id_chunk_index",
+        "document_chunks",
+        ["document_id", "chunk_index"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_document_chunks_document_id_chunk_index", table_name="document_chunks")
@@ -0,0 +1,23 @@
+"""content hash of stored document files
+
+Revision ID: 0008_document_content_hash
+Revises: 0007_chunk_index_order
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008_document_content_hash"
+down_revision = "0007_chunk_index_order"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing files are not hashed here; their ETags fall back to file size and mtime.
+    op.add_column("documents", sa.Column("content_sha256", sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("documents", "content_sha256")
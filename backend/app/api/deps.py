@@ -1,13 +1,18 @@
+from typing import AsyncIterator
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.core import timing
 from app.core.config import settings
 from app.core.errors import AuthError
 from app.core.security import ALGORITHM
-from app.db.session import get_sessionmaker
+from app.db.session import get_async_sessionmaker, get_sessionmaker
 from app.models.user import User
+from app.services.user_cache import user_cache
 
 security = HTTPBearer(auto_error=False)
 
@@ -20,6 +25,11 @@ def get_db() -> Session:
         db.close()
 
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
 def _resolve_user(
     db: Session,
     credentials: HTTPAuthorizationCredentials | None,
@@ -39,9 +49,12 @@ def _resolve_user(
     subject = payload.get("sub")
     if subject is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user = db.query(User).filter(User.email == subject).first()
+    user = user_cache.get(db, subject)
     if user is None:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        user = db.query(User).filter(User.email == subject).first()
+        if user is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        user_cache.put(subject, user)
     if user.is_blocked:
         raise AuthError(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -62,12 +75,13 @@ def get_current_user(allow_must_change_password: bool = False):
         db: Session = Depends(get_db),
         credentials: HTTPAuthorizationCredentials | None = Depends(security),
     ) -> User:
-        user = _resolve_user(
-            db,
-            credentials,
-            allow_must_change_password=allow_must_change_password,
-            required=True,
-        )
+        with timing.stage("auth"):
+            user = _resolve_user(
+                db,
+                credentials,
+                allow_must_change_password=allow_must_change_password,
+                required=True,
+            )
         assert user is not None
         return user
 
@@ -79,12 +93,49 @@ def get_optional_user():
         db: Session = Depends(get_db),
         credentials: HTTPAuthorizationCredentials | None = Depends(security),
     ) -> User | None:
-        return _resolve_user(
-            db,
-            credentials,
-            allow_must_change_password=False,
-            required=False,
-        )
+        with timing.stage("auth"):
+            return _resolve_user(
+                db,
+                credentials,
+                allow_must_change_password=False,
+                required=False,
+            )
+
+    return _get_optional_user
+
+
+def get_current_user_async(allow_must_change_password: bool = False):
+    """``get_current_user`` for async routes: the lookup runs on the request's async session."""
+
+    async def _get_current_user(
+        db: AsyncSession = Depends(get_async_db),
+        credentials: HTTPAuthorizationCredentials | None = Depends(security),
+    ) -> User:
+        with timing.stage("auth"):
+            user = await db.run_sync(
+                _resolve_user,
+                credentials,
+                allow_must_change_password=allow_must_change_password,
+                required=True,
+            )
+        assert user is not None
+        return user
+
+    return _get_current_user
+
+
+def get_optional_user_async():
+    async def _get_optional_user(
+        db: AsyncSession = Depends(get_async_db),
+        credentials: HTTPAuthorizationCredentials | None = Depends(security),
+    ) -> User | None:
+        with timing.stage("auth"):
+            return await db.run_sync(
+                _resolve_user,
+                credentials,
+                allow_must_change_password=False,
+                required=False,
+            )
 
     return _get_optional_user
 
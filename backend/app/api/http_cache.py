@@ -0,0 +1,131 @@
+import hashlib
+from pathlib import Path
+from typing import Iterator
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+
+from app.core.config import settings
+
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+def make_etag(*parts: object) -> str:
+    """Strong ETag over the values that determine a response body."""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def cache_control(public: bool) -> str:
+    # Unpublished documents are only visible to admins: never share them.
+    if not public:
+        return "private, no-cache"
+    return f"public, max-age={settings.docs_cache_max_age_seconds}"
+
+
+def set_cache_headers(response: Response, etag: str, *, public: bool) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control(public)
+
+
+def not_modified(request: Request, etag: str, *, public: bool) -> Response | None:
+    """A 304 response when ``If-None-Match`` already names ``etag``."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return None
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    if etag not in candidates and "*" not in candidates:
+        return None
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_cache_headers(response, etag, public=public)
+    return response
+
+
+def parse_byte_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Inclusive (start, end) of a single ``bytes=`` range, or None for the whole file.
+
+    Malformed and multi-range headers are ignored, as RFC 9110 allows; a range
+    that starts past the end of the file is a 416.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header.removeprefix("bytes=").strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            start, end = max(0, size - suffix), size - 1
+            if suffix <= 0:
+                start = size
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if end < start and start < size:
+                return None
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def _read_range(path: Path, start: int, end: int) -> Iterator[bytes]:
+    with path.open("rb") as source:
+        source.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = source.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def file_response(
+    request: Request,
+    path: Path,
+    *,
+    media_type: str,
+    filename: str,
+    etag: str,
+    public: bool,
+) -> Response:
+    """Serve ``path`` with conditional GET and single byte-range support."""
+    cached = not_modified(request, etag, public=public)
+    if cached is not None:
+        cached.headers["Accept-Ranges"] = "bytes"
+        return cached
+    size = path.stat().st_size
+    byte_range = parse_byte_range(request.headers.get("range"), size)
+    # A resumed download must not splice bytes of a changed file.
+    if_range = request.headers.get("if-range")
+    if byte_range is not None and if_range is not None and if_range.strip() != etag:
+        byte_range = None
+    headers = {"ETag": etag, "Cache-Control": cache_control(public), "Accept-Ranges": "bytes"}
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+    start, end = byte_range
+    headers.update(
+        {
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": _content_disposition(filename),
+        }
+    )
+    return StreamingResponse(
+        _read_range(path, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=media_type,
+        headers=headers,
+    )
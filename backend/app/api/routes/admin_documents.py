@@ -1,4 +1,4 @@
-import shutil
+import hashlib
 import logging
 from pathlib import Path
 from uuid import uuid4
@@ -20,15 +20,20 @@ from app.services.storage import ensure_storage_dirs
 router = APIRouter(prefix="/admin/documents", tags=["admin-documents"])
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 def _save_upload(file):
     ensure_storage_dirs()
     extension = Path(file.filename or "").suffix
     stored_name = f"{uuid4().hex}{extension}"
     full_path = Path(settings.docs_path) / stored_name
+    digest = hashlib.sha256()
     with full_path.open("wb") as target:
-        shutil.copyfileobj(file.file, target)
-    return full_path
+        while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            target.write(chunk)
+    return full_path, digest.hexdigest()
 
 
 def _process_document(db, document, path):
@@ -53,11 +58,12 @@ async def upload_document(
     db: Session = Depends(get_db),
     _: User = Depends(get_admin_user),
 ) -> DocumentResponse:
-    stored_path = _save_upload(file)
+    stored_path, content_sha256 = _save_upload(file)
     document = Document(
         original_name=file.filename or stored_path.name,
         stored_filename=str(stored_path),
         mime_type=file.content_type or "application/octet-stream",
+        content_sha256=content_sha256,
         title=title,
         status="indexing",
     )
@@ -189,6 +195,7 @@ def delete_document(
     stored_path = Path(document.stored_filename)
     db.delete(document)
     db.commit()
+    mark_index_dirty()
 
     try:
         stored_path.unlink(missing_ok=True)
@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 from app.api.deps import get_admin_user, get_db
 from app.core.security import get_password_hash
 from app.models.user import User
+from app.services.user_cache import user_cache
 from app.schemas.user import ResetPasswordResponse, UserResponse, UserRoleUpdate
 
 router = APIRouter(prefix="/admin/users", tags=["admin-users"])
@@ -45,6 +46,7 @@ def update_user_role(
     user.is_admin = payload.is_admin
     db.add(user)
     db.commit()
+    user_cache.invalidate(user.email)
     db.refresh(user)
     return UserResponse.model_validate(user)
 
@@ -61,6 +63,7 @@ def block_user(
     user.is_blocked = True
     db.add(user)
     db.commit()
+    user_cache.invalidate(user.email)
     db.refresh(user)
     return UserResponse.model_validate(user)
 
@@ -77,6 +80,7 @@ def unblock_user(
     user.is_blocked = False
     db.add(user)
     db.commit()
+    user_cache.invalidate(user.email)
     db.refresh(user)
     return UserResponse.model_validate(user)
 
@@ -95,4 +99,5 @@ def reset_password(
     user.must_change_password = True
     db.add(user)
     db.commit()
+    user_cache.invalidate(user.email)
     return ResetPasswordResponse(temporary_password=temporary_password)
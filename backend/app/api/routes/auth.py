@@ -5,6 +5,7 @@ from app.api.deps import get_current_user, get_db
 from app.core.errors import AuthError
 from app.core.security import create_access_token, get_password_hash, verify_password
 from app.models.user import User
+from app.services.user_cache import user_cache
 from app.schemas.user import ChangePassword, TokenResponse, UserCreate, UserLogin, UserResponse
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -70,5 +71,6 @@ def change_password(
     user.must_change_password = False
     db.add(user)
     db.commit()
+    user_cache.invalidate(user.email)
     db.refresh(user)
     return UserResponse.model_validate(user)
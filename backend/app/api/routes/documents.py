@@ -1,10 +1,12 @@
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_db, get_optional_user
+from app.api.deps import get_async_db, get_db, get_optional_user, get_optional_user_async
+from app.api.http_cache import file_response, make_etag, not_modified, set_cache_headers
 from app.models.document import Document, DocumentChunk
 from app.models.user import User
 from app.schemas.document import DocumentPublic
@@ -18,46 +20,95 @@ from app.services.text_utils import make_snippet
 
 router = APIRouter(prefix="/docs", tags=["documents"])
 
+PREVIEW_PAGE_MAX = 500
+# Previews are cut to 200 characters after whitespace is collapsed, so a
+# prefix of the chunk is enough and the full text never leaves the database.
+PREVIEW_SOURCE_CHARS = 800
+_preview_text = func.substr(DocumentChunk.text, 1, PREVIEW_SOURCE_CHARS)
+
 
 def _is_admin(user):
     return bool(user and user.is_admin)
 
 
+def _document_etag(kind: str, document: Document, *extra: object) -> str:
+    # Reindexing replaces the chunks and touches the document row, so
+    # updated_at covers chunk changes; the hash covers the stored file.
+    return make_etag(
+        kind,
+        document.id,
+        document.status,
+        document.updated_at,
+        document.content_sha256,
+        *extra,
+    )
+
+
 @router.get("", response_model=list[DocumentPublic])
-def list_published_docs(db: Session = Depends(get_db)) -> list[DocumentPublic]:
+def list_published_docs(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+) -> list[DocumentPublic] | Response:
     documents = (
         db.query(Document)
         .filter(Document.status == "published")
         .order_by(Document.created_at.desc())
         .all()
     )
+    etag = make_etag(
+        "list",
+        *((doc.id, doc.updated_at, doc.content_sha256) for doc in documents),
+    )
+    cached = not_modified(request, etag, public=True)
+    if cached is not None:
+        return cached
+    set_cache_headers(response, etag, public=True)
     return [DocumentPublic.model_validate(doc) for doc in documents]
 
 
 @router.get("/{doc_id}", response_model=DocumentViewer)
-def get_document(
+async def get_document(
     doc_id: int,
-    db: Session = Depends(get_db),
-    user: User | None = Depends(get_optional_user()),
-) -> DocumentViewer:
-    document = db.query(Document).filter(Document.id == doc_id).first()
+    request: Request,
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=PREVIEW_PAGE_MAX),
+    cursor: int | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    user: User | None = Depends(get_optional_user_async()),
+) -> DocumentViewer | Response:
+    """Chunk previews in ``chunk_index`` order. Pass the ``X-Next-Cursor`` header
+    of a page as ``cursor`` to get the next one."""
+    document = await db.get(Document, doc_id)
     if document is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
     if document.status != "published" and not _is_admin(user):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
-    chunks = (
-        db.query(DocumentChunk)
-        .filter(DocumentChunk.document_id == document.id)
+    public = document.status == "published"
+    etag = _document_etag("viewer", document, cursor, limit)
+    cached = not_modified(request, etag, public=public)
+    if cached is not None:
+        return cached
+    statement = (
+        select(DocumentChunk.id, DocumentChunk.chunk_index, _preview_text)
+        .where(DocumentChunk.document_id == document.id)
         .order_by(DocumentChunk.chunk_index.asc())
-        .all()
     )
+    if cursor is not None:
+        statement = statement.where(DocumentChunk.chunk_index > cursor)
+    # One extra row tells whether another page exists.
+    rows = (await db.execute(statement.limit(limit + 1))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].chunk_index)
+    set_cache_headers(response, etag, public=public)
     preview = [
         DocChunkPreview(
-            chunk_id=chunk.id,
-            chunk_index=chunk.chunk_index,
-            snippet=make_snippet(chunk.text),
+            chunk_id=chunk_id,
+            chunk_index=chunk_index,
+            snippet=make_snippet(text),
         )
-        for chunk in chunks
+        for chunk_id, chunk_index, text in rows
     ]
     return DocumentViewer(
         doc_id=document.id,
@@ -74,14 +125,21 @@ def get_document(
 def get_document_chunk(
     doc_id: int,
     chunk_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     user: User | None = Depends(get_optional_user()),
-) -> DocumentChunkResponse:
+) -> DocumentChunkResponse | Response:
     document = db.query(Document).filter(Document.id == doc_id).first()
     if document is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
     if document.status != "published" and not _is_admin(user):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    public = document.status == "published"
+    etag = _document_etag("chunk", document, chunk_id)
+    cached = not_modified(request, etag, public=public)
+    if cached is not None:
+        return cached
     chunk = (
         db.query(DocumentChunk)
         .filter(DocumentChunk.id == chunk_id, DocumentChunk.document_id == doc_id)
@@ -90,7 +148,7 @@ def get_document_chunk(
     if chunk is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chunk not found")
     neighbors = (
-        db.query(DocumentChunk)
+        db.query(DocumentChunk.id, DocumentChunk.chunk_index, _preview_text.label("text"))
         .filter(DocumentChunk.document_id == doc_id)
         .filter(
             DocumentChunk.chunk_index.in_(
@@ -108,6 +166,7 @@ def get_document_chunk(
         )
         for neighbor in neighbors
     ]
+    set_cache_headers(response, etag, public=public)
     return DocumentChunkResponse(
         doc_id=doc_id,
         chunk_id=chunk.id,
@@ -121,9 +180,10 @@ def get_document_chunk(
 @router.get("/{doc_id}/download")
 def download_document(
     doc_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     user: User | None = Depends(get_optional_user()),
-) -> FileResponse:
+) -> Response:
     document = db.query(Document).filter(Document.id == doc_id).first()
     if document is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
@@ -132,4 +192,16 @@ def download_document(
     path = Path(document.stored_filename)
     if not path.exists():
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
-    return FileResponse(path, media_type=document.mime_type, filename=document.original_name)
+    if document.content_sha256 is None:
+        stat_result = path.stat()
+        etag = _document_etag("file", document, stat_result.st_size, stat_result.st_mtime_ns)
+    else:
+        etag = _document_etag("file", document)
+    return file_response(
+        request,
+        path,
+        media_type=document.mime_type,
+        filename=document.original_name,
+        etag=etag,
+        public=document.status == "published",
+    )
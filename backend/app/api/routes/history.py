@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+import base64
+from datetime import datetime
 
-from app.api.deps import get_current_user, get_db
+from fastapi import APIRouter, Depends, HTTPException, Query as FastAPIQuery, Response, status
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_async_db, get_current_user_async
 from app.models.document import Document
 from app.models.query import Citation, Query, QueryVersion
 from app.models.user import User
@@ -10,71 +13,90 @@ from app.schemas.rag import HistoryDetail, HistoryItem, HistoryVersion, RagSourc
 
 router = APIRouter(tags=["history"])
 
+HISTORY_PAGE_MAX = 100
+
+
+def _encode_cursor(created_at: datetime, query_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{query_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, query_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(query_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor") from exc
+
 
 @router.get("/history", response_model=list[HistoryItem])
-def list_history(
-    limit: int = 20,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user()),
+async def list_history(
+    response: Response,
+    limit: int = FastAPIQuery(default=20, ge=1, le=HISTORY_PAGE_MAX),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    user: User = Depends(get_current_user_async()),
 ) -> list[HistoryItem]:
-    latest_version_subq = (
-        db.query(
-            QueryVersion.query_id,
-            func.max(QueryVersion.version_no).label("latest_version_no"),
-        )
-        .group_by(QueryVersion.query_id)
-        .subquery()
-    )
-    query = (
-        db.query(Query, latest_version_subq.c.latest_version_no)
-        .outerjoin(latest_version_subq, Query.id == latest_version_subq.c.query_id)
-        .order_by(Query.created_at.desc())
-    )
+    """Newest first. Pass the ``X-Next-Cursor`` header of a page as ``cursor`` to get the next one."""
+    statement = select(Query).order_by(Query.created_at.desc(), Query.id.desc())
     if not user.is_admin:
-        query = query.filter(Query.user_id == user.id)
-    rows = query.limit(limit).all()
+        statement = statement.where(Query.user_id == user.id)
+    if cursor is not None:
+        statement = statement.where(tuple_(Query.created_at, Query.id) < _decode_cursor(cursor))
+    # One extra row tells whether another page exists.
+    records = (await db.scalars(statement.limit(limit + 1))).all()
+    if len(records) > limit:
+        records = records[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(records[-1].created_at, records[-1].id)
     return [
         HistoryItem(
             query_id=record.id,
             question=record.question,
             created_at=record.created_at,
-            latest_version_no=int(latest_version or 0),
+            latest_version_no=record.latest_version_no,
         )
-        for record, latest_version in rows
+        for record in records
     ]
 
 
 @router.get("/history/{query_id}", response_model=HistoryDetail)
-def get_history_detail(
+async def get_history_detail(
     query_id: int,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user()),
+    db: AsyncSession = Depends(get_async_db),
+    user: User = Depends(get_current_user_async()),
 ) -> HistoryDetail:
-    query = db.query(Query).filter(Query.id == query_id).first()
+    query = await db.get(Query, query_id)
     if query is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Query not found")
     if query.user_id != user.id and not user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
     versions = (
-        db.query(QueryVersion)
-        .filter(QueryVersion.query_id == query.id)
-        .order_by(QueryVersion.version_no.asc())
-        .all()
-    )
+        await db.scalars(
+            select(QueryVersion)
+            .where(QueryVersion.query_id == query.id)
+            .order_by(QueryVersion.version_no.asc())
+        )
+    ).all()
     version_ids = [version.id for version in versions]
     citations = (
-        db.query(Citation)
-        .filter(Citation.query_version_id.in_(version_ids))
-        .order_by(Citation.source_no.asc())
-        .all()
+        (
+            await db.scalars(
+                select(Citation)
+                .where(Citation.query_version_id.in_(version_ids))
+                .order_by(Citation.source_no.asc())
+            )
+        ).all()
         if version_ids
         else []
     )
     doc_ids = {citation.document_id for citation in citations}
     doc_titles = {
-        doc.id: doc.title
-        for doc in db.query(Document).filter(Document.id.in_(doc_ids)).all()
+        doc_id: title
+        for doc_id, title in (
+            await db.execute(select(Document.id, Document.title).where(Document.id.in_(doc_ids)))
+        ).all()
     }
     citation_map: dict[int, list[RagSource]] = {}
     for citation in citations:
@@ -3,55 +3,52 @@ from __future__ import annotations
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException, Query as FastAPIQuery, Response, status
-from sqlalchemy import func
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, update
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user, get_db
-from app.models.document import Document, DocumentChunk
+from app.api.deps import get_async_db, get_current_user, get_current_user_async, get_db
+from app.models.document import DocumentChunk
 from app.models.query import Citation, Query, QueryVersion
 from app.models.user import User
 from app.schemas.rag import RagAnswerResponse, RagAskRequest, RagSource
+from app.core import timing
 from app.core.config import settings
+from app.services.history_writer import HistoryRecord, HistoryWriter, get_history_writer
 from app.services.llm import LLMResult, SourceItem, generate_answer_with_meta
-from app.services.retrieval import search_chunks_with_meta
-from app.services.text_utils import make_llm_excerpt, make_snippet
+from app.services.retrieval import (
+    RetrievalFilter,
+    lookup_chunks,
+    lookup_chunks_async,
+    search_chunks_with_meta,
+)
+from app.services.retrieval.chunk_store import StoredChunk
+from app.services.text_utils import llm_excerpt_from_forms, snippet_from_forms
 
 router = APIRouter(prefix="/rag", tags=["rag"])
 
 logger = logging.getLogger(__name__)
 
 
-def _build_sources(
-    db: Session,
+def _sources_from_chunks(
     hits: list[tuple[int, float]],
+    chunk_map: dict[int, StoredChunk],
     *,
     query: str,
 ) -> tuple[list[RagSource], list[float], list[str]]:
-    if not hits:
-        return [], [], []
-    chunk_ids = [chunk_id for chunk_id, _ in hits]
-    rows = (
-        db.query(DocumentChunk, Document.id, Document.title)
-        .join(Document, Document.id == DocumentChunk.document_id)
-        .filter(Document.status == "published")
-        .filter(DocumentChunk.id.in_(chunk_ids))
-        .all()
-    )
-    chunk_map = {
-        chunk.id: (chunk, doc_id, title) for chunk, doc_id, title in rows
-    }
     sources: list[RagSource] = []
     scores: list[float] = []
     llm_excerpts: list[str] = []
     for idx, (chunk_id, score) in enumerate(hits, start=1):
-        mapped = chunk_map.get(chunk_id)
-        if not mapped:
+        chunk = chunk_map.get(chunk_id)
+        if chunk is None:
             continue
-        chunk, doc_id, title = mapped
         llm_excerpts.append(
-            make_llm_excerpt(
-                chunk.text,
+            llm_excerpt_from_forms(
+                chunk.excerpt_text,
+                chunk.excerpt_search,
                 query=query,
                 max_length=settings.llm_excerpt_chars,
             )
@@ -59,16 +56,40 @@ def _build_sources(
         sources.append(
             RagSource(
                 source_no=idx,
-                doc_id=doc_id,
-                title=title,
-                chunk_id=chunk.id,
-                snippet=make_snippet(chunk.text, query=query),
+                doc_id=chunk.doc_id,
+                title=chunk.title,
+                chunk_id=chunk.chunk_id,
+                snippet=snippet_from_forms(chunk.snippet_text, chunk.snippet_search, query=query),
             )
         )
         scores.append(score)
     return sources, scores, llm_excerpts
 
 
+def _build_sources(
+    db: Session,
+    hits: list[tuple[int, float]],
+    *,
+    query: str,
+) -> tuple[list[RagSource], list[float], list[str]]:
+    if not hits:
+        return [], [], []
+    chunk_map = lookup_chunks(db, [chunk_id for chunk_id, _ in hits])
+    return _sources_from_chunks(hits, chunk_map, query=query)
+
+
+async def _build_sources_async(
+    db: AsyncSession,
+    hits: list[tuple[int, float]],
+    *,
+    query: str,
+) -> tuple[list[RagSource], list[float], list[str]]:
+    if not hits:
+        return [], [], []
+    chunk_map = await lookup_chunks_async(db, [chunk_id for chunk_id, _ in hits])
+    return _sources_from_chunks(hits, chunk_map, query=query)
+
+
 def _generate_answer(
     question: str,
     sources: list[RagSource],
@@ -100,13 +121,87 @@ def _generate_answer(
     return result.answer, sources, result
 
 
+def _answer_question(
+    db: Session,
+    question: str,
+    *,
+    retrieval_filter: RetrievalFilter | None = None,
+) -> tuple[str, list[RagSource], LLMResult, str]:
+    """Retrieve and generate; returns the answer, UI sources, LLM result and retriever label.
+
+    ``db`` is closed before the LLM call, so its connection goes back to the
+    pool instead of idling for seconds; the session reconnects if used again.
+    """
+    hits, retriever = search_chunks_with_meta(
+        db,
+        question,
+        limit=settings.retrieve_k_for_llm,
+        retrieval_filter=retrieval_filter,
+    )
+    with timing.stage("sources"):
+        sources, scores, llm_excerpts = _build_sources(db, hits, query=question)
+    db.close()
+    with timing.stage("llm"):
+        answer, final_sources, llm_result = _generate_answer(
+            question,
+            sources,
+            scores,
+            llm_excerpts,
+        )
+    return answer, final_sources[: settings.ui_sources_k], llm_result, retriever
+
+
+def _retrieve(
+    db: Session,
+    question: str,
+    retrieval_filter: RetrievalFilter | None,
+) -> tuple[list[tuple[int, float]], str]:
+    # Neighbor expansion and the Postgres retrievers read the database while
+    # scoring; the session is closed right after, returning its connection.
+    try:
+        return search_chunks_with_meta(
+            db,
+            question,
+            limit=settings.retrieve_k_for_llm,
+            retrieval_filter=retrieval_filter,
+        )
+    finally:
+        db.close()
+
+
+def _citation_rows(version_id: int, sources: list[RagSource]) -> list[dict[str, object]]:
+    return [
+        {
+            "query_version_id": version_id,
+            "source_no": source.source_no,
+            "document_id": source.doc_id,
+            "chunk_id": source.chunk_id,
+            "snippet": source.snippet,
+        }
+        for source in sources
+    ]
+
+
 def _store_citations(
     db: Session,
-    version: QueryVersion,
+    version_id: int,
     sources: list[RagSource],
 ) -> int:
+    """Bulk-insert citations in a savepoint; returns how many were skipped.
+
+    Sources come from chunks that were just retrieved, so the insert is tried
+    as-is. Only if a chunk was deleted in the meantime (foreign key failure)
+    are the surviving chunk ids looked up and the insert retried without the
+    missing ones.
+    """
     if not sources:
         return 0
+    try:
+        with db.begin_nested():
+            db.execute(insert(Citation), _citation_rows(version_id, sources))
+        return 0
+    except IntegrityError:
+        pass
     chunk_ids = {source.chunk_id for source in sources}
     existing_chunk_ids = {
         chunk_id
@@ -116,94 +211,200 @@ def _store_citations(
     }
     valid_sources = [source for source in sources if source.chunk_id in existing_chunk_ids]
     skipped_count = len(sources) - len(valid_sources)
-    citations = [
-        Citation(
-            query_version_id=version.id,
-            source_no=source.source_no,
-            document_id=source.doc_id,
-            chunk_id=source.chunk_id,
-            snippet=source.snippet,
+    if valid_sources:
+        try:
+            with db.begin_nested():
+                db.execute(insert(Citation), _citation_rows(version_id, valid_sources))
+        except IntegrityError:
+            skipped_count = len(sources)
+    if skipped_count:
+        logger.warning(
+            "Skipped citations for query_version_id=%s skipped_count=%s",
+            version_id,
+            skipped_count,
         )
-        for source in valid_sources
-    ]
-    if citations:
-        db.add_all(citations)
     return skipped_count
 
 
+def _persist_answer(
+    db: Session,
+    *,
+    query_id: int | None,
+    user_id: int,
+    question: str,
+    version_no: int,
+    answer: str,
+    sources: list[RagSource],
+) -> tuple[int, int]:
+    """Write the query (if new), its version and citations in one transaction.
+
+    With write-behind enabled the rows are queued for the history writer instead.
+    """
+    writer = get_history_writer()
+    if writer is not None:
+        return _queue_answer(
+            writer,
+            query_id=query_id,
+            user_id=user_id,
+            question=question,
+            version_no=version_no,
+            answer=answer,
+            sources=sources,
+        )
+    if query_id is None:
+        query_id = db.execute(
+            insert(Query)
+            .values(user_id=user_id, question=question, latest_version_no=version_no)
+            .returning(Query.id)
+        ).scalar_one()
+    else:
+        db.execute(
+            update(Query)
+            .where(Query.id == query_id, Query.latest_version_no < version_no)
+            .values(latest_version_no=version_no)
+        )
+    version_id = db.execute(
+        insert(QueryVersion)
+        .values(query_id=query_id, version_no=version_no, answer=answer)
+        .returning(QueryVersion.id)
+    ).scalar_one()
+    _store_citations(db, version_id, sources)
+    db.commit()
+    return query_id, version_id
+
+
+def _queue_answer(
+    writer: HistoryWriter,
+    *,
+    query_id: int | None,
+    user_id: int,
+    question: str,
+    version_no: int,
+    answer: str,
+    sources: list[RagSource],
+) -> tuple[int, int]:
+    new_query = query_id is None
+    if query_id is None:
+        query_id = writer.allocate_query_id()
+    version_id = writer.allocate_version_id()
+    writer.submit(
+        HistoryRecord(
+            query_id=query_id,
+            user_id=user_id,
+            question=question,
+            version_id=version_id,
+            version_no=version_no,
+            answer=answer,
+            new_query=new_query,
+            citations=_citation_rows(version_id, sources),
+        )
+    )
+    return query_id, version_id
+
+
+async def _persist_answer_async(
+    db: AsyncSession,
+    *,
+    query_id: int | None,
+    user_id: int,
+    question: str,
+    version_no: int,
+    answer: str,
+    sources: list[RagSource],
+) -> tuple[int, int]:
+    fields = {
+        "query_id": query_id,
+        "user_id": user_id,
+        "question": question,
+        "version_no": version_no,
+        "answer": answer,
+        "sources": sources,
+    }
+    writer = get_history_writer()
+    if writer is not None:
+        # Id allocation and the spill-file fsync block; keep them off the event loop.
+        return await run_in_threadpool(_queue_answer, writer, **fields)
+    return await db.run_sync(_persist_answer, **fields)
+
+
 def _apply_diagnostics(
     response: Response,
     llm_result: LLMResult,
     retriever: str,
-) -> None:
+) -> dict[str, float]:
     response.headers["X-LLM-Provider"] = llm_result.provider
     response.headers["X-LLM-Model"] = llm_result.model
     response.headers["X-Retriever"] = retriever
     if llm_result.error:
         response.headers["X-Ollama-Error"] = llm_result.error
+    timings_ms = timing.current_ms()
+    if timings_ms:
+        response.headers["Server-Timing"] = timing.server_timing_header(timings_ms)
+    return timings_ms
 
 
 @router.post("/ask", response_model=RagAnswerResponse)
-def ask_question(
+async def ask_question(
     payload: RagAskRequest,
     response: Response,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user()),
+    async_db: AsyncSession = Depends(get_async_db),
+    user: User = Depends(get_current_user_async()),
 ) -> RagAnswerResponse:
     question = payload.question.strip()
     if not question:
         raise HTTPException(status_code=400, detail="Question is required")
-    hits, retriever = search_chunks_with_meta(
-        db,
-        question,
-        limit=settings.retrieve_k_for_llm,
-    )
-    sources, scores, llm_excerpts = _build_sources(db, hits, query=question)
-    answer, final_sources, llm_result = _generate_answer(
-        question,
-        sources,
-        scores,
-        llm_excerpts,
+    retrieval_filter = (
+        RetrievalFilter(doc_ids=frozenset(payload.doc_ids)) if payload.doc_ids else None
     )
+    user_id, is_admin = user.id, user.is_admin
+    # Each step below checks out at most one connection and returns it before
+    # the next, so the request never holds two, nor one during the LLM call.
+    await async_db.close()
+    # Retrieval is CPU-bound and the LLM client blocks; only they take a worker thread.
+    hits, retriever = await run_in_threadpool(_retrieve, db, question, retrieval_filter)
+    with timing.stage("sources"):
+        sources, scores, llm_excerpts = await _build_sources_async(
+            async_db, hits, query=question
+        )
+    await async_db.close()
+    with timing.stage("llm"):
+        answer, final_sources, llm_result = await run_in_threadpool(
+            _generate_answer,
+            question,
+            sources,
+            scores,
+            llm_excerpts,
+        )
     ui_sources = final_sources[: settings.ui_sources_k]
 
-    query = Query(user_id=user.id, question=question)
-    db.add(query)
-    db.commit()
-    db.refresh(query)
-
-    version = QueryVersion(query_id=query.id, version_no=1, answer=answer)
-    db.add(version)
-    db.commit()
-    db.refresh(version)
-
-    if ui_sources:
-        skipped_count = _store_citations(db, version, ui_sources)
-        try:
-            db.commit()
-        except IntegrityError:
-            db.rollback()
-            logger.warning(
-                "Failed to store citations for query_version_id=%s skipped_count=%s",
-                version.id,
-                skipped_count,
-            )
+    with timing.stage("db"):
+        query_id, version_id = await _persist_answer_async(
+            async_db,
+            query_id=None,
+            user_id=user_id,
+            question=question,
+            version_no=1,
+            answer=answer,
+            sources=ui_sources,
+        )
 
     if llm_result.error:
         logger.warning(
             "RAG answer fallback used query_id=%s user_id=%s error=%s",
-            query.id,
-            user.id,
+            query_id,
+            user_id,
             llm_result.error,
         )
 
-    _apply_diagnostics(response, llm_result, retriever)
+    timings_ms = _apply_diagnostics(response, llm_result, retriever)
     return RagAnswerResponse(
-        query_id=query.id,
-        version_id=version.id,
-        version_no=version.version_no,
+        query_id=query_id,
+        version_id=version_id,
+        version_no=1,
         answer=answer,
         sources=ui_sources,
+        timings=timings_ms if is_admin else None,
     )
 
 
@@ -213,65 +414,53 @@ def _rerun_question(
     db: Session,
     user: User,
 ) -> RagAnswerResponse:
+    writer = get_history_writer()
     query = db.query(Query).filter(Query.id == query_id).first()
+    if query is None and writer is not None and writer.pending_version_no(query_id):
+        # Asked moments ago and still queued.
+        writer.flush()
+        query = db.query(Query).filter(Query.id == query_id).first()
     if query is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Query not found")
     if query.user_id != user.id and not user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
-    latest_version = (
-        db.query(func.max(QueryVersion.version_no))
-        .filter(QueryVersion.query_id == query.id)
-        .scalar()
-    )
-    next_version_no = int(latest_version or 0) + 1
-
-    hits, retriever = search_chunks_with_meta(
-        db,
-        query.question,
-        limit=settings.retrieve_k_for_llm,
-    )
-    sources, scores, llm_excerpts = _build_sources(db, hits, query=query.question)
-    answer, final_sources, llm_result = _generate_answer(
-        query.question,
-        sources,
-        scores,
-        llm_excerpts,
-    )
-    ui_sources = final_sources[: settings.ui_sources_k]
-
-    version = QueryVersion(query_id=query.id, version_no=next_version_no, answer=answer)
-    db.add(version)
-    db.commit()
-    db.refresh(version)
-
-    if ui_sources:
-        skipped_count = _store_citations(db, version, ui_sources)
-        try:
-            db.commit()
-        except IntegrityError:
-            db.rollback()
-            logger.warning(
-                "Failed to store citations for query_version_id=%s skipped_count=%s",
-                version.id,
-                skipped_count,
-            )
+    latest_version = query.latest_version_no
+    if writer is not None:
+        latest_version = max(latest_version, writer.pending_version_no(query.id))
+    next_version_no = latest_version + 1
+
+    answer, ui_sources, llm_result, retriever = _answer_question(db, query.question)
+
+    # Read before the commit below expires the instances.
+    user_id, is_admin = user.id, user.is_admin
+    with timing.stage("db"):
+        _, version_id = _persist_answer(
+            db,
+            query_id=query_id,
+            user_id=user_id,
+            question=query.question,
+            version_no=next_version_no,
+            answer=answer,
+            sources=ui_sources,
+        )
 
     if llm_result.error:
         logger.warning(
             "RAG rerun fallback used query_id=%s user_id=%s error=%s",
-            query.id,
-            user.id,
+            query_id,
+            user_id,
             llm_result.error,
         )
 
-    _apply_diagnostics(response, llm_result, retriever)
+    timings_ms = _apply_diagnostics(response, llm_result, retriever)
     return RagAnswerResponse(
-        query_id=query.id,
-        version_id=version.id,
-        version_no=version.version_no,
+        query_id=query_id,
+        version_id=version_id,
+        version_no=next_version_no,
         answer=answer,
         sources=ui_sources,
+        timings=timings_ms if is_admin else None,
     )
 
 
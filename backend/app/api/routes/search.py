@@ -1,54 +1,71 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user, get_db
-from app.models.document import Document, DocumentChunk
+from app.api.deps import get_async_db, get_current_user_async, get_db
 from app.schemas.rag import SearchResult
-from app.services.retrieval import search_chunks
-from app.services.text_utils import make_snippet
+from app.services.retrieval import RetrievalFilter, lookup_chunks_async, search_chunks
+from app.services.retrieval.chunk_store import StoredChunk
+from app.services.text_utils import snippet_from_forms
 
 router = APIRouter(tags=["search"])
 
 
-@router.get("/search", response_model=list[SearchResult])
-def search_documents(
-    q: str,
-    limit: int = 20,
-    db: Session = Depends(get_db),
-    _: object = Depends(get_current_user()),
-) -> list[SearchResult]:
-    query = q.strip()
-    if not query:
-        raise HTTPException(status_code=400, detail="Query is required")
-    hits = search_chunks(db, query, limit)
-    if not hits:
-        return []
+def _retrieve(
+    db: Session,
+    query: str,
+    limit: int,
+    retrieval_filter: RetrievalFilter | None,
+) -> list[tuple[int, float]]:
+    # Neighbor expansion and the Postgres retrievers read the database while
+    # scoring; the session is closed right after, returning its connection.
+    try:
+        return search_chunks(db, query, limit, retrieval_filter=retrieval_filter)
+    finally:
+        db.close()
 
-    chunk_ids = [chunk_id for chunk_id, _ in hits]
-    rows = (
-        db.query(DocumentChunk, Document.id, Document.title)
-        .join(Document, Document.id == DocumentChunk.document_id)
-        .filter(Document.status == "published")
-        .filter(DocumentChunk.id.in_(chunk_ids))
-        .all()
-    )
-    chunk_map = {
-        chunk.id: (chunk, doc_id, title) for chunk, doc_id, title in rows
-    }
 
+def _search_results(
+    hits: list[tuple[int, float]],
+    chunk_map: dict[int, StoredChunk],
+    query: str,
+) -> list[SearchResult]:
     results: list[SearchResult] = []
     for chunk_id, score in hits:
-        mapped = chunk_map.get(chunk_id)
-        if not mapped:
+        chunk = chunk_map.get(chunk_id)
+        if chunk is None:
             continue
-        chunk, doc_id, title = mapped
         results.append(
             SearchResult(
-                doc_id=doc_id,
-                title=title,
-                chunk_id=chunk.id,
-                snippet=make_snippet(chunk.text, query=query),
+                doc_id=chunk.doc_id,
+                title=chunk.title,
+                chunk_id=chunk.chunk_id,
+                snippet=snippet_from_forms(chunk.snippet_text, chunk.snippet_search, query=query),
                 score=score,
             )
         )
     return results
+
+
+@router.get("/search", response_model=list[SearchResult])
+async def search_documents(
+    q: str,
+    limit: int = 20,
+    doc_id: list[int] | None = Query(default=None),
+    db: Session = Depends(get_db),
+    async_db: AsyncSession = Depends(get_async_db),
+    _: object = Depends(get_current_user_async()),
+) -> list[SearchResult]:
+    query = q.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Query is required")
+    retrieval_filter = RetrievalFilter(doc_ids=frozenset(doc_id)) if doc_id else None
+    # A user lookup leaves its connection checked out; hand it back during retrieval.
+    await async_db.close()
+    # Scoring is CPU-bound; only it takes a worker thread.
+    hits = await run_in_threadpool(_retrieve, db, query, limit, retrieval_filter)
+    if not hits:
+        return []
+    chunk_map = await lookup_chunks_async(async_db, [chunk_id for chunk_id, _ in hits])
+    return _search_results(hits, chunk_map, query)
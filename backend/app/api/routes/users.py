@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 
 from app.api.deps import get_current_user, get_db
 from app.models.user import User
+from app.services.user_cache import user_cache
 from app.schemas.user import UserResponse, UserUpdate
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -17,5 +18,6 @@ def update_me(
     user.display_name = payload.display_name
     db.add(user)
     db.commit()
+    user_cache.invalidate(user.email)
     db.refresh(user)
     return UserResponse.model_validate(user)
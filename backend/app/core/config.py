@@ -8,6 +8,11 @@ class Settings(BaseSettings):
     app_name: str = "LyceumDocBot API"
     secret_key: str = Field(validation_alias="SECRET_KEY")
     access_token_expire_minutes: int = 60 * 24
+    auth_user_cache_ttl_seconds: float = Field(
+        default=30.0,
+        validation_alias="AUTH_USER_CACHE_TTL_SECONDS",
+    )
+    auth_user_cache_size: int = Field(default=1024, validation_alias="AUTH_USER_CACHE_SIZE")
     cors_origins: list[str] = Field(
         default_factory=list,
         validation_alias="CORS_ORIGINS",
@@ -15,10 +20,19 @@ class Settings(BaseSettings):
     database_url: str = Field(
         validation_alias="DATABASE_URL",
     )
+    db_pool_size: int = Field(default=20, validation_alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=10, validation_alias="DB_MAX_OVERFLOW")
+    db_pool_timeout_seconds: float = Field(default=30.0, validation_alias="DB_POOL_TIMEOUT_SECONDS")
+    db_pool_recycle_seconds: int = Field(default=1800, validation_alias="DB_POOL_RECYCLE_SECONDS")
+    db_pool_pre_ping: bool = Field(default=True, validation_alias="DB_POOL_PRE_PING")
     admin_email: str = Field(validation_alias="ADMIN_EMAIL")
     admin_password: str = Field(validation_alias="ADMIN_PASSWORD")
     docs_path: str = Field(default="/data/documents", validation_alias="DOCS_PATH")
     indexes_path: str = Field(default="/data/indexes", validation_alias="INDEXES_PATH")
+    docs_cache_max_age_seconds: int = Field(
+        default=60,
+        validation_alias="DOCS_CACHE_MAX_AGE_SECONDS",
+    )
     llm_provider: str = Field(default="stub", validation_alias="LLM_PROVIDER")
     ollama_base_url: str = Field(
         default="http://ollama:11434",
@@ -42,6 +56,39 @@ class Settings(BaseSettings):
         default="intfloat/multilingual-e5-base",
         validation_alias="EMBEDDING_MODEL_NAME",
     )
+    embedding_backend: str = Field(default="torch", validation_alias="EMBEDDING_BACKEND")
+    embedding_onnx_path: str = Field(
+        default="/data/models/multilingual-e5-base-onnx",
+        validation_alias="EMBEDDING_ONNX_PATH",
+    )
+    embedding_batching: bool = Field(default=True, validation_alias="EMBEDDING_BATCHING")
+    embedding_batch_wait_ms: float = Field(default=5.0, validation_alias="EMBEDDING_BATCH_WAIT_MS")
+    embedding_max_batch: int = Field(default=32, validation_alias="EMBEDDING_MAX_BATCH")
+    embedding_batch_timeout_seconds: float = Field(
+        default=10.0,
+        validation_alias="EMBEDDING_BATCH_TIMEOUT_SECONDS",
+    )
+    embedding_torch_threads: int = Field(default=0, validation_alias="EMBEDDING_TORCH_THREADS")
+    embedding_onnx_threads: int = Field(default=0, validation_alias="EMBEDDING_ONNX_THREADS")
+    embedding_token_budget: int = Field(default=16384, validation_alias="EMBEDDING_TOKEN_BUDGET")
+    embedding_build_max_batch: int = Field(default=128, validation_alias="EMBEDDING_BUILD_MAX_BATCH")
+    index_build_slice_size: int = Field(default=1024, validation_alias="INDEX_BUILD_SLICE_SIZE")
+    vector_backend: str = Field(default="faiss", validation_alias="VECTOR_BACKEND")
+    pgvector_ef_search: int = Field(default=100, validation_alias="PGVECTOR_EF_SEARCH")
+    lexical_retriever: str = Field(default="bm25", validation_alias="LEXICAL_RETRIEVER")
+    bm25_tokenize_workers: int = Field(default=2, validation_alias="BM25_TOKENIZE_WORKERS")
+    bm25_pruning: bool = Field(default=True, validation_alias="BM25_PRUNING")
+    bm25_token_cache: bool = Field(default=True, validation_alias="BM25_TOKEN_CACHE")
+    bm25_query_cache_size: int = Field(default=4096, validation_alias="BM25_QUERY_CACHE_SIZE")
+    history_write_behind: bool = Field(default=False, validation_alias="HISTORY_WRITE_BEHIND")
+    history_spill_path: str = Field(
+        default="/data/history/pending.jsonl",
+        validation_alias="HISTORY_SPILL_PATH",
+    )
+    history_flush_interval_ms: int = Field(default=500, validation_alias="HISTORY_FLUSH_INTERVAL_MS")
+    history_flush_max_batch: int = Field(default=200, validation_alias="HISTORY_FLUSH_MAX_BATCH")
+    history_id_block_size: int = Field(default=100, validation_alias="HISTORY_ID_BLOCK_SIZE")
+    warmup_on_startup: bool = Field(default=True, validation_alias="WARMUP_ON_STARTUP")
 
     @field_validator("cors_origins", mode="before")
     @classmethod
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from prometheus_client import Counter, Gauge, Histogram
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0)
+BUILD_BUCKETS = (0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 3600.0)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Time spent in each stage of search and answer requests (auth, retrieval, LLM, DB).",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "rag_llm_request_seconds",
+    "Wall-clock latency of answer generation, including retries and fallbacks.",
+    ["provider", "model"],
+    buckets=LLM_BUCKETS,
+)
+LLM_EVAL_SECONDS = Histogram(
+    "rag_llm_eval_seconds",
+    "Evaluation time reported by Ollama (prompt_eval_duration / eval_duration).",
+    ["model", "phase"],
+    buckets=LLM_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "rag_llm_tokens_total",
+    "Tokens reported by Ollama (prompt_eval_count / eval_count).",
+    ["model", "kind"],
+)
+LLM_FALLBACKS = Counter(
+    "rag_llm_fallback_total",
+    "Answers that fell back to the sources list, by X-Ollama-Error type.",
+    ["error"],
+)
+INDEX_BUILD_SECONDS = Histogram(
+    "rag_index_build_seconds",
+    "Duration of full retrieval index builds.",
+    buckets=BUILD_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "rag_cache_requests_total",
+    "In-process cache lookups by cache and result (hit/miss).",
+    ["cache", "result"],
+)
+
+DB_POOL_WAIT_SECONDS = Histogram(
+    "rag_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the database pool.",
+    ["pool"],
+    buckets=POOL_WAIT_BUCKETS,
+)
+DB_POOL_TIMEOUTS = Counter(
+    "rag_db_pool_timeouts_total",
+    "Pool checkouts that gave up after DB_POOL_TIMEOUT_SECONDS.",
+    ["pool"],
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "rag_db_pool_connections",
+    "Connections checked out of the pool, and its capacity (pool size + max overflow).",
+    ["pool", "state"],
+)
+
+
+def record_cache(cache: str, hit: bool, count: int = 1) -> None:
+    if count:
+        CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc(count)
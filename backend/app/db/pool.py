@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
+
+from app.core import metrics
+from app.core.config import settings
+
+
+class _InstrumentedPoolMixin:
+    """Reports checkout wait time and how many connections are in use."""
+
+    metrics_label = ""
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except PoolTimeoutError:
+            metrics.DB_POOL_TIMEOUTS.labels(pool=self.metrics_label).inc()
+            raise
+        finally:
+            metrics.DB_POOL_WAIT_SECONDS.labels(pool=self.metrics_label).observe(
+                time.perf_counter() - start
+            )
+        self._report_usage()
+        return entry
+
+    def _do_return_conn(self, record: ConnectionPoolEntry) -> None:
+        super()._do_return_conn(record)
+        self._report_usage()
+
+    def _report_usage(self) -> None:
+        metrics.DB_POOL_CONNECTIONS.labels(pool=self.metrics_label, state="checked_out").set(
+            self.checkedout()
+        )
+        metrics.DB_POOL_CONNECTIONS.labels(pool=self.metrics_label, state="capacity").set(
+            self.size() + max(self._max_overflow, 0)
+        )
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    metrics_label = "sync"
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+
+def pool_options(url: str, *, asyncio: bool = False) -> dict[str, Any]:
+    """``create_engine`` keyword arguments for the pool configured in settings.
+
+    SQLite keeps SQLAlchemy's default pools, which do not take sizing options.
+    """
+    options: dict[str, Any] = {"pool_pre_ping": settings.db_pool_pre_ping}
+    if make_url(url).get_backend_name() == "sqlite":
+        return options
+    options.update(
+        poolclass=InstrumentedAsyncQueuePool if asyncio else InstrumentedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        pool_recycle=settings.db_pool_recycle_seconds,
+    )
+    return options
@@ -1,17 +1,44 @@
 from functools import lru_cache
 
 from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.db.pool import pool_options
+
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
 
 
 @lru_cache
 def get_engine() -> Engine:
-    return create_engine(settings.database_url, pool_pre_ping=True)
+    return create_engine(settings.database_url, **pool_options(settings.database_url))
 
 
 @lru_cache
 def get_sessionmaker() -> sessionmaker:
     return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+def async_database_url(url: str) -> str:
+    """``url`` with its driver swapped for the asyncio one (asyncpg, aiosqlite)."""
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(
+        hide_password=False
+    )
+
+
+@lru_cache
+def get_async_engine() -> AsyncEngine:
+    url = async_database_url(settings.database_url)
+    return create_async_engine(url, **pool_options(url, asyncio=True))
+
+
+@lru_cache
+def get_async_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    # Expired attributes would need lazy loads, which async sessions cannot do implicitly.
+    return async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
@@ -11,6 +11,7 @@ from app.api.routes import (
     export,
     health,
     history,
+    metrics,
     rag,
     search,
     users,
@@ -18,9 +19,12 @@ from app.api.routes import (
 from app.core.config import settings
 from app.core.errors import AuthError
 from app.core.security import get_password_hash
-from app.db.session import get_sessionmaker
+from app.db.session import get_engine, get_sessionmaker
 from app.middleware.charset import CharsetJSONMiddleware
+from app.middleware.timing import RequestTimingMiddleware
 from app.models.user import User
+from app.services import history_writer
+from app.services.retrieval import warmup
 from app.services.storage import ensure_storage_dirs
 
 app = FastAPI(
@@ -38,6 +42,7 @@ app.add_middleware(
     allow_headers=["Authorization", "Content-Type"],
 )
 app.add_middleware(CharsetJSONMiddleware)
+app.add_middleware(RequestTimingMiddleware)
 
 
 @app.exception_handler(AuthError)
@@ -69,6 +74,24 @@ def seed_admin() -> None:
         db.close()
 
 
+@app.on_event("startup")
+def warm_retrieval() -> None:
+    if settings.warmup_on_startup:
+        warmup.start_warmup()
+    else:
+        warmup.mark_ready()
+
+
+@app.on_event("startup")
+def start_history_writer() -> None:
+    history_writer.start_history_writer(get_engine())
+
+
+@app.on_event("shutdown")
+def stop_history_writer() -> None:
+    history_writer.stop_history_writer()
+
+
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(documents.router)
@@ -77,5 +100,6 @@ app.include_router(rag.router)
 app.include_router(history.router)
 app.include_router(export.router)
 app.include_router(health.router)
+app.include_router(metrics.router)
 app.include_router(admin_documents.router)
 app.include_router(admin_users.router)
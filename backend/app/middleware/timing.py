@@ -0,0 +1,13 @@
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core import timing
+
+
+class RequestTimingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next) -> Response:
+        # Dependencies and endpoints run in copies of this context, so they all
+        # share the dict created here.
+        timing.start_request()
+        return await call_next(request)
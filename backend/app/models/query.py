@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer, Text, func
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, Text, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base_class import Base
@@ -8,6 +8,11 @@ from app.db.base_class import Base
 
 class Query(Base):
     __tablename__ = "queries"
+    __table_args__ = (
+        # Keyset pagination of the history list, per user and for admins.
+        Index("ix_queries_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_queries_created_at", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(
@@ -17,6 +22,10 @@ class Query(Base):
         index=True,
     )
     question: Mapped[str] = mapped_column(Text, nullable=False)
+    # Highest QueryVersion.version_no, kept in step by the writers of query_versions.
+    latest_version_no: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
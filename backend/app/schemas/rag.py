@@ -44,6 +44,7 @@ class DocumentChunkResponse(BaseModel):
 
 class RagAskRequest(BaseModel):
     question: str = Field(min_length=1)
+    doc_ids: list[int] | None = None
 
 
 class RagSource(BaseModel):
@@ -60,6 +61,7 @@ class RagAnswerResponse(BaseModel):
     version_no: int
     answer: str
     sources: list[RagSource]
+    timings: dict[str, float] | None = None
 
 
 class HistoryItem(BaseModel):
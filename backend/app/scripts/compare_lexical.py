@@ -0,0 +1,96 @@
+"""Compare Postgres full-text ranking with the in-memory BM25 on the same queries.
+
+Run with LEXICAL_RETRIEVER=bm25 against a PostgreSQL database migrated to
+0005_chunk_search_vector:
+
+    python -m app.scripts.compare_lexical --history 200 --k 20
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from sqlalchemy import select
+
+from app.db.session import get_sessionmaker
+from app.models.query import Query
+from app.services.retrieval import bm25, ensure_index, pg_fulltext, rrf
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare BM25 and Postgres full-text top-k.")
+    parser.add_argument("--query", action="append", default=[], help="Query text (repeatable).")
+    parser.add_argument("--queries-file", type=Path, help="File with one query per line.")
+    parser.add_argument("--history", type=int, default=0, help="Use the N most recent questions.")
+    parser.add_argument("--k", type=int, default=20, help="Hits compared per query.")
+    args = parser.parse_args()
+
+    db = get_sessionmaker()()
+    try:
+        if db.get_bind().dialect.name != "postgresql":
+            parser.error("Postgres full-text search needs a PostgreSQL DATABASE_URL.")
+        queries = list(args.query)
+        if args.queries_file:
+            lines = args.queries_file.read_text(encoding="utf-8").splitlines()
+            queries.extend(line.strip() for line in lines if line.strip())
+        if args.history:
+            queries.extend(
+                db.scalars(
+                    select(Query.question).order_by(Query.created_at.desc()).limit(args.history)
+                )
+            )
+        if not queries:
+            parser.error("Pass --query, --queries-file or --history.")
+
+        index_data = ensure_index(db)
+        if index_data.bm25 is None:
+            parser.error("No BM25 in memory; run with LEXICAL_RETRIEVER=bm25.")
+
+        overlaps: list[float] = []
+        top1_agree = 0
+        bm25_times: list[float] = []
+        fulltext_times: list[float] = []
+        for query in queries:
+            start = time.perf_counter()
+            bm25_hits = bm25.bm25_search(index_data, query, args.k, sort_hits=rrf.sort_hits)
+            bm25_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            fulltext_hits = pg_fulltext.fulltext_search(
+                db, index_data, query, args.k, sort_hits=rrf.sort_hits
+            )
+            fulltext_times.append(time.perf_counter() - start)
+
+            bm25_ids = [idx for idx, _ in bm25_hits]
+            fulltext_ids = [idx for idx, _ in fulltext_hits]
+            compared = max(len(bm25_ids), len(fulltext_ids))
+            overlap = len(set(bm25_ids) & set(fulltext_ids)) / compared if compared else 1.0
+            overlaps.append(overlap)
+            if bm25_ids[:1] == fulltext_ids[:1]:
+                top1_agree += 1
+            print(
+                f"overlap@{args.k}={overlap:.2f} bm25={len(bm25_ids)} "
+                f"fulltext={len(fulltext_ids)} query={query[:80]!r}"
+            )
+    finally:
+        db.close()
+
+    count = len(queries)
+    print()
+    print(
+        f"queries={count} mean overlap@{args.k}={sum(overlaps) / count:.3f} "
+        f"top1 agreement={top1_agree / count:.3f}"
+    )
+    for name, times in (("bm25", bm25_times), ("fulltext", fulltext_times)):
+        print(
+            f"{name:>8} p50={_percentile(times, 0.5) * 1000:.1f}ms "
+            f"p95={_percentile(times, 0.95) * 1000:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
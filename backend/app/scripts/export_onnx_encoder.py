@@ -0,0 +1,58 @@
+"""Export the embedding model to ONNX with dynamic int8 quantization.
+
+Requires ``optimum[onnxruntime]`` in the environment running the export; the
+API itself only needs ``onnxruntime`` and ``transformers`` to serve the result.
+"""
+import argparse
+import json
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+
+from app.core.config import settings
+from app.services.retrieval.encoders import ONNX_EXPORT_INFO_FILENAME
+from app.services.retrieval.faiss_index import effective_model_name
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the embedding model to quantized ONNX.")
+    parser.add_argument("--model", default=effective_model_name(), help="SentenceTransformer model name.")
+    parser.add_argument(
+        "--output",
+        default=settings.embedding_onnx_path,
+        help="Target directory (EMBEDDING_ONNX_PATH).",
+    )
+    parser.add_argument(
+        "--no-quantize",
+        action="store_true",
+        help="Keep fp32 weights instead of dynamic int8 quantization.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as export_dir:
+        model = ORTModelForFeatureExtraction.from_pretrained(args.model, export=True)
+        model.save_pretrained(export_dir)
+        AutoTokenizer.from_pretrained(args.model).save_pretrained(output)
+        if args.no_quantize:
+            shutil.copy(Path(export_dir) / "model.onnx", output / "model.onnx")
+        else:
+            quantizer = ORTQuantizer.from_pretrained(export_dir)
+            config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=output, quantization_config=config)
+    info = {"model_name": args.model, "quantized": not args.no_quantize}
+    (output / ONNX_EXPORT_INFO_FILENAME).write_text(json.dumps(info), encoding="utf-8")
+
+    print(f"ONNX encoder written to {output}")
+
+
+if __name__ == "__main__":
+    main()
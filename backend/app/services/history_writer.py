@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import bindparam, insert, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.models.query import Citation, Query, QueryVersion
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HistoryRecord:
+    """One answer to persist: the query row (only for a new query), its version and citations."""
+
+    query_id: int
+    user_id: int
+    question: str
+    version_id: int
+    version_no: int
+    answer: str
+    new_query: bool
+    citations: list[dict[str, object]] = field(default_factory=list)
+
+
+class SequenceIdAllocator:
+    """Hands out primary keys reserved in blocks from the tables' Postgres sequences."""
+
+    def __init__(self, engine: Engine, *, block_size: int) -> None:
+        self._engine = engine
+        self._block_size = max(1, block_size)
+        self._blocks: dict[str, list[int]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, table: str) -> int:
+        with self._lock:
+            block = self._blocks.get(table)
+            if not block:
+                with self._engine.connect() as connection:
+                    block = list(
+                        connection.execute(
+                            text(
+                                "SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                                "FROM generate_series(1, :count)"
+                            ),
+                            {"table": table, "count": self._block_size},
+                        ).scalars()
+                    )
+                block.reverse()
+                self._blocks[table] = block
+            return block.pop()
+
+
+class HistoryWriter:
+    """Write-behind buffer for query history.
+
+    ``submit`` appends the record to a spill file (fsynced) and queues it; a
+    background thread bulk-inserts queued records every ``interval`` seconds.
+    After each flush the spill file is rewritten with only the records still
+    queued, and it is replayed on start, so a crash loses nothing that was
+    acknowledged.
+    Records the database rejects even without citations (e.g. their user was
+    deleted) are moved to a ``.failed.jsonl`` file next to it.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        *,
+        allocate_id: Callable[[str], int],
+        spill_path: Path,
+        interval: float,
+        max_batch: int,
+    ) -> None:
+        self._engine = engine
+        self._allocate_id = allocate_id
+        self._spill_path = spill_path
+        self._failed_path = spill_path.with_suffix(".failed.jsonl")
+        self._interval = interval
+        self._max_batch = max(1, max_batch)
+        self._pending: list[HistoryRecord] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._spill = None
+
+    def start(self) -> None:
+        self._spill_path.parent.mkdir(parents=True, exist_ok=True)
+        replayed = self._read_spill()
+        self._spill = open(self._spill_path, "a", encoding="utf-8")
+        if replayed:
+            logger.info("Replaying %s history records from %s", len(replayed), self._spill_path)
+            with self._lock:
+                self._pending.extend(replayed)
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def allocate_query_id(self) -> int:
+        return self._allocate_id(Query.__tablename__)
+
+    def allocate_version_id(self) -> int:
+        return self._allocate_id(QueryVersion.__tablename__)
+
+    def submit(self, record: HistoryRecord) -> None:
+        line = json.dumps(asdict(record), ensure_ascii=False)
+        with self._lock:
+            stopped = self._spill is None
+            if not stopped:
+                self._spill.write(line + "\n")
+                self._spill.flush()
+                os.fsync(self._spill.fileno())
+                self._pending.append(record)
+                batch_full = len(self._pending) >= self._max_batch
+        if stopped:
+            # Submitted during shutdown: nothing will flush the queue any more.
+            self._insert([record])
+        elif batch_full:
+            self._wake.set()
+
+    def pending_version_no(self, query_id: int) -> int:
+        """Highest queued (not yet inserted) version number of ``query_id``, or 0."""
+        with self._lock:
+            return max(
+                (record.version_no for record in self._pending if record.query_id == query_id),
+                default=0,
+            )
+
+    def flush(self) -> None:
+        with self._lock:
+            batch = self._pending
+            self._pending = []
+        if not batch:
+            return
+        try:
+            self._insert(batch)
+        except Exception as exc:  # noqa: BLE001 - the spill file still holds the batch
+            logger.warning("History flush failed; will retry.", exc_info=exc)
+            with self._lock:
+                self._pending[:0] = batch
+            return
+        with self._lock:
+            if self._spill is not None:
+                self._rewrite_spill()
+
+    def _rewrite_spill(self) -> None:
+        """Replace the spill file with the records still queued; the caller holds the lock."""
+        temp_path = self._spill_path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            for record in self._pending:
+                handle.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self._spill_path)
+        self._spill.close()
+        self._spill = open(self._spill_path, "a", encoding="utf-8")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:  # noqa: BLE001 - the thread must outlive any one flush
+                logger.exception("History flush failed unexpectedly; will retry.")
+
+    def _read_spill(self) -> list[HistoryRecord]:
+        if not self._spill_path.exists():
+            return []
+        records: list[HistoryRecord] = []
+        with open(self._spill_path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    records.append(HistoryRecord(**json.loads(line)))
+                except (TypeError, ValueError):
+                    # A torn last line from a crash mid-write.
+                    logger.warning("Skipping unreadable history spill line.")
+        return records
+
+    def _insert_stmt(self, model: type):
+        # Replayed records may already be in the database.
+        if self._engine.dialect.name == "postgresql":
+            return postgresql.insert(model).on_conflict_do_nothing()
+        if self._engine.dialect.name == "sqlite":
+            return sqlite.insert(model).on_conflict_do_nothing()
+        return insert(model)
+
+    def _insert(self, batch: list[HistoryRecord]) -> None:
+        try:
+            with self._engine.begin() as connection:
+                self._insert_records(connection, batch, with_citations=True)
+            return
+        except IntegrityError:
+            pass
+        # A cited chunk was deleted in the meantime: keep the answers, and
+        # drop citations only for the records that fail.
+        for record in batch:
+            try:
+                with self._engine.begin() as connection:
+                    self._insert_records(connection, [record], with_citations=True)
+            except IntegrityError:
+                logger.warning(
+                    "Skipped citations for query_version_id=%s skipped_count=%s",
+                    record.version_id,
+                    len(record.citations),
+                )
+                try:
+                    with self._engine.begin() as connection:
+                        self._insert_records(connection, [record], with_citations=False)
+                except IntegrityError as exc:
+                    logger.error(
+                        "Dropping history record query_version_id=%s; saved to %s",
+                        record.version_id,
+                        self._failed_path,
+                        exc_info=exc,
+                    )
+                    self._save_failed(record)
+
+    def _save_failed(self, record: HistoryRecord) -> None:
+        with open(self._failed_path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+
+    def _insert_records(
+        self,
+        connection: Connection,
+        batch: list[HistoryRecord],
+        *,
+        with_citations: bool,
+    ) -> None:
+        queries = [
+            {
+                "id": record.query_id,
+                "user_id": record.user_id,
+                "question": record.question,
+                "latest_version_no": record.version_no,
+            }
+            for record in batch
+            if record.new_query
+        ]
+        versions = [
+            {
+                "id": record.version_id,
+                "query_id": record.query_id,
+                "version_no": record.version_no,
+                "answer": record.answer,
+            }
+            for record in batch
+        ]
+        if queries:
+            connection.execute(self._insert_stmt(Query), queries)
+        connection.execute(self._insert_stmt(QueryVersion), versions)
+        reruns = [
+            {"target_id": record.query_id, "target_version_no": record.version_no}
+            for record in batch
+            if not record.new_query
+        ]
+        if reruns:
+            connection.execute(
+                update(Query)
+                .where(
+                    Query.id == bindparam("target_id"),
+                    Query.latest_version_no < bindparam("target_version_no"),
+                )
+                .values(latest_version_no=bindparam("target_version_no")),
+                reruns,
+            )
+        if with_citations:
+            versions_with_citations = [record.version_id for record in batch if record.citations]
+            if versions_with_citations:
+                # Replays must not duplicate citations of versions already stored.
+                connection.execute(
+                    Citation.__table__.delete().where(
+                        Citation.query_version_id.in_(versions_with_citations)
+                    )
+                )
+                citations = [citation for record in batch for citation in record.citations]
+                connection.execute(insert(Citation), citations)
+
+
+_writer: HistoryWriter | None = None
+
+
+def get_history_writer() -> HistoryWriter | None:
+    return _writer
+
+
+def start_history_writer(engine: Engine) -> None:
+    """Start write-behind when enabled; it needs Postgres sequences to pre-allocate ids."""
+    global _writer
+    if not settings.history_write_behind or _writer is not None:
+        return
+    if engine.dialect.name != "postgresql":
+        logger.warning("HISTORY_WRITE_BEHIND requires PostgreSQL; writing history synchronously.")
+        return
+    writer = HistoryWriter(
+        engine,
+        allocate_id=SequenceIdAllocator(engine, block_size=settings.history_id_block_size),
+        spill_path=Path(settings.history_spill_path),
+        interval=settings.history_flush_interval_ms / 1000,
+        max_batch=settings.history_flush_max_batch,
+    )
+    writer.start()
+    _writer = writer
+
+
+def stop_history_writer() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
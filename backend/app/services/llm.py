@@ -8,6 +8,7 @@ from typing import Sequence
 import requests
 from requests import exceptions as request_exceptions
 
+from app.core import metrics
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -167,6 +168,18 @@ def _is_missing_model_error(exc: request_exceptions.HTTPError) -> bool:
     return False
 
 
+def _record_ollama_stats(data: dict[str, object], *, model: str) -> None:
+    for key, kind in (("prompt_eval_count", "prompt"), ("eval_count", "completion")):
+        value = data.get(key)
+        if isinstance(value, int) and value >= 0:
+            metrics.LLM_TOKENS.labels(model=model, kind=kind).inc(value)
+    # Ollama reports durations in nanoseconds.
+    for key, phase in (("prompt_eval_duration", "prompt"), ("eval_duration", "generation")):
+        value = data.get(key)
+        if isinstance(value, int) and value >= 0:
+            metrics.LLM_EVAL_SECONDS.labels(model=model, phase=phase).observe(value / 1e9)
+
+
 def _ollama_request(prompt: str, *, model: str) -> str:
     max_attempts = 2
     backoff_base = 0.4
@@ -181,6 +194,7 @@ def _ollama_request(prompt: str, *, model: str) -> str:
             )
             response.raise_for_status()
             data = response.json()
+            _record_ollama_stats(data, model=model)
             return (data.get("response") or "").strip()
         except request_exceptions.Timeout as exc:
             last_exc = exc
@@ -212,6 +226,59 @@ def _ollama_request(prompt: str, *, model: str) -> str:
     raise RuntimeError("Ollama request failed unexpectedly.")
 
 
+def _generate_with_ollama(
+    question: str,
+    sources: Sequence[SourceItem],
+) -> LLMResult:
+    prompt_sources = top_sources_for_prompt(sources, k=settings.llm_sources_k)
+    prompt_sources = trim_sources_by_char_budget(prompt_sources, settings.llm_sources_char_limit)
+    prompt = _build_prompt(question, prompt_sources)
+    try:
+        answer = _ollama_request(prompt, model=settings.ollama_model)
+        return LLMResult(
+            answer=answer,
+            provider="ollama",
+            model=settings.ollama_model,
+        )
+    except request_exceptions.HTTPError as exc:
+        if _is_missing_model_error(exc) and settings.ollama_fallback_model:
+            fallback_model = settings.ollama_fallback_model
+            logger.warning(
+                "Ollama model %s not found; falling back to %s.",
+                settings.ollama_model,
+                fallback_model,
+            )
+            try:
+                answer = _ollama_request(prompt, model=fallback_model)
+                return LLMResult(
+                    answer=answer,
+                    provider="ollama",
+                    model=fallback_model,
+                )
+            except (request_exceptions.RequestException, ValueError) as fallback_exc:
+                logger.warning(
+                    "Ollama fallback request failed; falling back to sources.",
+                    exc_info=fallback_exc,
+                )
+                error = f"{fallback_exc.__class__.__name__}"
+                answer = build_failure_answer(sources)
+                return LLMResult(
+                    answer=answer,
+                    provider="stub",
+                    model="stub",
+                    error=error,
+                )
+        logger.warning("Ollama request failed; falling back to sources.", exc_info=exc)
+        error = f"{exc.__class__.__name__}"
+        answer = build_failure_answer(sources)
+        return LLMResult(answer=answer, provider="stub", model="stub", error=error)
+    except (request_exceptions.RequestException, ValueError) as exc:
+        logger.warning("Ollama request failed; falling back to sources.", exc_info=exc)
+        error = f"{exc.__class__.__name__}"
+        answer = build_failure_answer(sources)
+        return LLMResult(answer=answer, provider="stub", model="stub", error=error)
+
+
 def generate_answer_with_meta(
     question: str,
     sources: Sequence[SourceItem],
@@ -220,53 +287,15 @@ def generate_answer_with_meta(
         return LLMResult(answer=NO_SOURCES_ANSWER, provider="stub", model="stub")
     provider = settings.llm_provider.lower()
     if provider == "ollama":
-        prompt_sources = top_sources_for_prompt(sources, k=settings.llm_sources_k)
-        prompt_sources = trim_sources_by_char_budget(prompt_sources, settings.llm_sources_char_limit)
-        prompt = _build_prompt(question, prompt_sources)
-        try:
-            answer = _ollama_request(prompt, model=settings.ollama_model)
-            return LLMResult(
-                answer=answer,
-                provider="ollama",
-                model=settings.ollama_model,
-            )
-        except request_exceptions.HTTPError as exc:
-            if _is_missing_model_error(exc) and settings.ollama_fallback_model:
-                fallback_model = settings.ollama_fallback_model
-                logger.warning(
-                    "Ollama model %s not found; falling back to %s.",
-                    settings.ollama_model,
-                    fallback_model,
-                )
-                try:
-                    answer = _ollama_request(prompt, model=fallback_model)
-                    return LLMResult(
-                        answer=answer,
-                        provider="ollama",
-                        model=fallback_model,
-                    )
-                except (request_exceptions.RequestException, ValueError) as fallback_exc:
-                    logger.warning(
-                        "Ollama fallback request failed; falling back to sources.",
-                        exc_info=fallback_exc,
-                    )
-                    error = f"{fallback_exc.__class__.__name__}"
-                    answer = build_failure_answer(sources)
-                    return LLMResult(
-                        answer=answer,
-                        provider="stub",
-                        model="stub",
-                        error=error,
-                    )
-            logger.warning("Ollama request failed; falling back to sources.", exc_info=exc)
-            error = f"{exc.__class__.__name__}"
-            answer = build_failure_answer(sources)
-            return LLMResult(answer=answer, provider="stub", model="stub", error=error)
-        except (request_exceptions.RequestException, ValueError) as exc:
-            logger.warning("Ollama request failed; falling back to sources.", exc_info=exc)
-            error = f"{exc.__class__.__name__}"
-            answer = build_failure_answer(sources)
-            return LLMResult(answer=answer, provider="stub", model="stub", error=error)
+        start = time.perf_counter()
+        result = _generate_with_ollama(question, sources)
+        metrics.LLM_REQUEST_SECONDS.labels(
+            provider=result.provider,
+            model=result.model,
+        ).observe(time.perf_counter() - start)
+        if result.error:
+            metrics.LLM_FALLBACKS.labels(error=result.error).inc()
+        return result
     answer = build_failure_answer(sources)
     return LLMResult(answer=answer, provider="stub", model="stub")
 
@@ -2,14 +2,20 @@ from __future__ import annotations
 
 from .api import (
     ensure_index,
+    lookup_chunks,
+    lookup_chunks_async,
     mark_index_dirty,
     retrieve_chunks,
     search_chunks,
     search_chunks_with_meta,
 )
+from .filters import RetrievalFilter
 
 __all__ = [
+    "RetrievalFilter",
     "ensure_index",
+    "lookup_chunks",
+    "lookup_chunks_async",
     "mark_index_dirty",
     "retrieve_chunks",
     "search_chunks",
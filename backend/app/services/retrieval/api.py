@@ -2,15 +2,24 @@ from __future__ import annotations
 
 import logging
 import os
+import threading
 import time
+from contextlib import nullcontext
 from typing import Any
 
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.core import metrics, timing
+from app.core.config import settings
 from app.models.document import Document, DocumentChunk
 from app.services.document_processing import CLEANING_VERSION
-from . import bm25, faiss_index, postprocess, rrf
+from . import bm25, corpus, faiss_index, filters, pg_fulltext, pgvector_store, postprocess, rrf
+from .chunk_store import ChunkStore, ChunkStoreWriter, StoredChunk, load_chunk_store
+from .encoders import Encoder
+from .filters import RetrievalFilter
 from app.services.retrieval.index_store import (
     IndexData,
     clear_index_files,
@@ -29,6 +38,7 @@ RRF_C = 60
 logger = logging.getLogger(__name__)
 
 _index_cache: IndexData | None = None
+_index_lock = threading.Lock()
 
 
 def _safe_int_env(key: str, default: int) -> int:
@@ -115,16 +125,16 @@ def _fetch_chunk_texts(
     return {chunk.id: chunk.text for chunk in chunks}
 
 
-def _build_index(db: Session, model: faiss_index.SentenceTransformer | None) -> IndexData:
+def _build_index(
+    db: Session,
+    model: Encoder | None,
+    *,
+    with_bm25: bool = True,
+    with_pgvector: bool = False,
+) -> IndexData:
     paths = index_paths()
-    chunks = (
-        db.query(DocumentChunk)
-        .join(Document, Document.id == DocumentChunk.document_id)
-        .filter(Document.status == "published")
-        .order_by(DocumentChunk.id.asc())
-        .all()
-    )
-    if not chunks:
+    total = corpus.count_published_chunks(db)
+    if not total:
         if paths:
             clear_index_files(paths)
             paths["dirty"].unlink(missing_ok=True)
@@ -138,22 +148,65 @@ def _build_index(db: Session, model: faiss_index.SentenceTransformer | None) ->
             corpus_version=(0, 0),
         )
 
-    texts = [chunk.text for chunk in chunks]
-    meta = [
-        {
-            "doc_id": chunk.document_id,
-            "chunk_id": chunk.id,
-            "chunk_index": chunk.chunk_index,
-        }
-        for chunk in chunks
-    ]
-    bm25_index = bm25.build_bm25(texts)
     model_name = faiss_index.effective_model_name()
-    use_faiss, index, embeddings = faiss_index.build_faiss_index(
-        texts,
-        model,
-        model_name=model_name,
-        paths=paths,
+    writer = None
+    vector_writer = None
+    if with_pgvector:
+        vector_writer = pgvector_store.create_writer(
+            db,
+            model,
+            model_name=model_name,
+            total=total,
+        )
+        if paths:
+            # FAISS files from an earlier build would not match the new metadata.
+            paths["index"].unlink(missing_ok=True)
+            paths["embeddings"].unlink(missing_ok=True)
+    else:
+        writer = faiss_index.FaissIndexWriter.create(
+            model,
+            model_name=model_name,
+            total=total,
+            paths=paths,
+        )
+    bm25_builder = bm25.BM25Builder()
+    chunk_writer = ChunkStoreWriter(paths)
+    meta: list[dict[str, int]] = []
+    overflow = False
+    with bm25.corpus_tokenizer() if with_bm25 else nullcontext() as tokenize_texts:
+        for rows in corpus.iter_published_chunk_slices(db, settings.index_build_slice_size):
+            # Chunks published after the count was taken do not fit the
+            # preallocated embeddings; they are picked up by the next rebuild.
+            if len(meta) + len(rows) > total:
+                rows = rows[: total - len(meta)]
+                overflow = True
+            if not rows:
+                break
+            texts = [row.text for row in rows]
+            meta.extend(
+                {
+                    "doc_id": row.document_id,
+                    "chunk_id": row.id,
+                    "chunk_index": row.chunk_index,
+                }
+                for row in rows
+            )
+            if with_bm25:
+                for tokens in tokenize_texts(texts):
+                    bm25_builder.add(tokens)
+            chunk_writer.add(rows)
+            if writer is not None:
+                writer.add(texts)
+            if vector_writer is not None:
+                vector_writer.add(rows)
+
+    index = embeddings = None
+    if writer is not None:
+        index, embeddings = writer.finish()
+    if vector_writer is not None:
+        logger.info("Stored embeddings for %s new chunks in pgvector.", vector_writer.embedded)
+    chunk_store = chunk_writer.finish(
+        corpus.published_document_titles(db), corpus_version(meta)
     )
     fingerprint = current_fingerprint(
         model_name,
@@ -161,27 +214,38 @@ def _build_index(db: Session, model: faiss_index.SentenceTransformer | None) ->
         tokenizer_version=bm25.BM25_TOKENIZER_VERSION,
         cleaning_version=CLEANING_VERSION,
         embedding_prefix_mode=faiss_index.is_e5(model_name),
+        embedding_backend=faiss_index.embedding_backend_name(model),
+        vector_store="pgvector" if with_pgvector else "faiss",
     )
     if paths:
         save_meta(paths, meta, fingerprint)
-        paths["dirty"].unlink(missing_ok=True)
+        if overflow or len(meta) != total:
+            logger.warning(
+                "Published chunks changed during index build (expected=%s indexed=%s); marking index dirty.",
+                total,
+                len(meta),
+            )
+            paths["dirty"].touch(exist_ok=True)
+        else:
+            paths["dirty"].unlink(missing_ok=True)
     return IndexData(
         backend=model_name if model is not None else "none",
-        use_faiss=use_faiss and index is not None,
+        use_faiss=index is not None,
         index=index,
         embeddings=embeddings,
         meta=meta,
-        bm25=bm25_index,
+        bm25=bm25_builder.build() if with_bm25 else None,
         corpus_version=corpus_version(meta),
+        chunk_store=chunk_store,
     )
 
 
-def _load_index(model: faiss_index.SentenceTransformer | None) -> IndexData | None:
+def _load_index(model: Encoder | None, *, with_faiss: bool = True) -> IndexData | None:
     paths = index_paths()
     if not paths or paths["dirty"].exists():
         return None
     meta, fingerprint = load_meta(paths)
-    embeddings = faiss_index.load_embeddings(paths)
+    embeddings = faiss_index.load_embeddings(paths) if with_faiss else None
     model_name = faiss_index.effective_model_name()
     current = current_fingerprint(
         model_name,
@@ -189,6 +253,8 @@ def _load_index(model: faiss_index.SentenceTransformer | None) -> IndexData | No
         tokenizer_version=bm25.BM25_TOKENIZER_VERSION,
         cleaning_version=CLEANING_VERSION,
         embedding_prefix_mode=faiss_index.is_e5(model_name),
+        embedding_backend=faiss_index.embedding_backend_name(model),
+        vector_store="faiss" if with_faiss else "pgvector",
     )
     if fingerprint is None or fingerprint != current:
         paths["dirty"].touch(exist_ok=True)
@@ -205,14 +271,8 @@ def _load_index(model: faiss_index.SentenceTransformer | None) -> IndexData | No
             corpus_version=(0, 0),
         )
 
-    index = faiss_index.load_faiss_index(paths)
-    if (
-        model is not None
-        and faiss_index.FAISS_AVAILABLE
-        and faiss_index.faiss is not None
-        and faiss_index.NUMPY_AVAILABLE
-        and index is not None
-    ):
+    index = faiss_index.load_faiss_index(paths) if with_faiss else None
+    if model is not None and faiss_index.NUMPY_AVAILABLE and index is not None:
         return IndexData(
             backend=model_name,
             use_faiss=True,
@@ -233,6 +293,23 @@ def _load_index(model: faiss_index.SentenceTransformer | None) -> IndexData | No
     )
 
 
+def _load_chunk_store(db: Session, index_data: IndexData) -> ChunkStore | None:
+    paths = index_paths()
+    if not paths or not index_data.meta:
+        return None
+    store = load_chunk_store(paths, index_data.corpus_version)
+    if store is not None:
+        return store
+    # Index files from before the chunk store existed: write it from the DB once.
+    indexed = {meta_item["chunk_id"] for meta_item in index_data.meta}
+    chunk_writer = ChunkStoreWriter(paths)
+    for rows in corpus.iter_published_chunk_slices(db, settings.index_build_slice_size):
+        chunk_writer.add(row for row in rows if row.id in indexed)
+    return chunk_writer.finish(
+        corpus.published_document_titles(db), index_data.corpus_version
+    )
+
+
 def _validate_index_data(index_data: IndexData) -> None:
     try:
         meta_len = len(index_data.meta)
@@ -256,35 +333,120 @@ def _validate_index_data(index_data: IndexData) -> None:
         logger.warning("Index self-check failed; consider rebuilding the index.")
 
 
+def _cached_index(db: Session) -> IndexData | None:
+    """The cached index if it can be served as is, checked without the lock."""
+    index_data = _index_cache
+    if index_data is None or index_data.backend != faiss_index.loaded_backend():
+        return None
+    paths = index_paths()
+    if paths and paths["dirty"].exists():
+        return None
+    if index_data.bm25 is None and not pg_fulltext.enabled(db):
+        return None
+    return index_data
+
+
 def ensure_index(db: Session) -> IndexData:
+    cached = _cached_index(db)
+    if cached is not None:
+        metrics.record_cache("index", hit=True)
+        return cached
+    # Loads and builds are serialized so requests arriving during warm-up wait
+    # for the in-flight one instead of starting their own; the cache is
+    # checked again once the lock is held.
+    with _index_lock:
+        return _ensure_index_locked(db)
+
+
+def _ensure_index_locked(db: Session) -> IndexData:
     global _index_cache
     backend, model = faiss_index.get_embedding_backend()
     paths = index_paths()
+    # Full-text search in Postgres replaces the in-memory BM25 entirely.
+    with_bm25 = not pg_fulltext.enabled(db)
+    with_pgvector = pgvector_store.enabled(db)
     if (
         _index_cache
         and _index_cache.backend == backend
         and not (paths and paths["dirty"].exists())
     ):
-        if _index_cache.bm25 is None:
+        if _index_cache.bm25 is None and with_bm25:
             _index_cache = bm25.attach_bm25(db, _index_cache)
             _index_cache.corpus_version = corpus_version(_index_cache.meta)
         _validate_index_data(_index_cache)
+        metrics.record_cache("index", hit=True)
         return _index_cache
 
-    loaded = _load_index(model)
+    metrics.record_cache("index", hit=False)
+    loaded = _load_index(model, with_faiss=not with_pgvector)
     if loaded is not None:
-        loaded = bm25.attach_bm25(db, loaded)
+        if with_bm25:
+            loaded = bm25.attach_bm25(db, loaded)
         loaded.corpus_version = corpus_version(loaded.meta)
+        loaded.chunk_store = _load_chunk_store(db, loaded)
         _validate_index_data(loaded)
         _index_cache = loaded
         return loaded
 
-    built = _build_index(db, model)
+    build_start = time.perf_counter()
+    built = _build_index(db, model, with_bm25=with_bm25, with_pgvector=with_pgvector)
+    metrics.INDEX_BUILD_SECONDS.observe(time.perf_counter() - build_start)
     _validate_index_data(built)
     _index_cache = built
     return built
 
 
+def _stored_chunks(chunk_ids: list[int]) -> tuple[dict[int, StoredChunk], list[int]]:
+    index_data = _index_cache
+    store = index_data.chunk_store if index_data is not None else None
+    found = store.get_many(chunk_ids) if store is not None else {}
+    return found, [chunk_id for chunk_id in chunk_ids if chunk_id not in found]
+
+
+def _published_chunks_statement(chunk_ids: list[int]):
+    return (
+        select(DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.text, Document.title)
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .where(Document.status == "published")
+        .where(DocumentChunk.id.in_(chunk_ids))
+    )
+
+
+def _add_chunk_rows(found: dict[int, StoredChunk], rows: Any) -> None:
+    for chunk_id, doc_id, text, title in rows:
+        found[chunk_id] = StoredChunk.from_text(
+            chunk_id=chunk_id,
+            doc_id=doc_id,
+            title=title,
+            text=text,
+        )
+
+
+def lookup_chunks(db: Session, chunk_ids: list[int]) -> dict[int, StoredChunk]:
+    """Text, document id and title of published chunks, by chunk id.
+
+    Served from the index's chunk store; only chunks it does not hold (or
+    every chunk, before an index is loaded) are read from the database.
+    """
+    found, missing = _stored_chunks(chunk_ids)
+    if missing:
+        metrics.record_cache("chunk_store", hit=False, count=len(missing))
+        _add_chunk_rows(found, db.execute(_published_chunks_statement(missing)).all())
+    metrics.record_cache("chunk_store", hit=True, count=len(chunk_ids) - len(missing))
+    return found
+
+
+async def lookup_chunks_async(db: AsyncSession, chunk_ids: list[int]) -> dict[int, StoredChunk]:
+    """``lookup_chunks`` for async routes: chunk store misses are read on ``db``."""
+    found, missing = _stored_chunks(chunk_ids)
+    if missing:
+        metrics.record_cache("chunk_store", hit=False, count=len(missing))
+        rows = (await db.execute(_published_chunks_statement(missing))).all()
+        _add_chunk_rows(found, rows)
+    metrics.record_cache("chunk_store", hit=True, count=len(chunk_ids) - len(missing))
+    return found
+
+
 def mark_index_dirty() -> None:
     global _index_cache
     _index_cache = None
@@ -297,13 +459,15 @@ def _retriever_label(
     has_vector: bool,
     use_rrf: bool,
     use_neighbors: bool,
+    lexical: str = "bm25",
+    vector: str = "faiss",
 ) -> str:
     if has_bm25 and has_vector:
-        label = "bm25_faiss_rrf" if use_rrf else "bm25_faiss"
+        label = f"{lexical}_{vector}_rrf" if use_rrf else f"{lexical}_{vector}"
     elif has_bm25:
-        label = "bm25_only"
+        label = f"{lexical}_only"
     elif has_vector:
-        label = "faiss_only"
+        label = f"{vector}_only"
     else:
         label = "none"
     if not use_neighbors:
@@ -326,20 +490,32 @@ def retrieve_chunks(
     vec_top_k: int = VECTOR_TOP_K,
     rrf_c: int = RRF_C,
     debug: bool | None = None,
+    retrieval_filter: RetrievalFilter | None = None,
 ) -> tuple[list[tuple[int, float]], str]:
     debug_enabled, debug_top, debug_text_chars = _debug_config(debug)
-    index_data = ensure_index(db)
-
-    has_bm25 = use_bm25 and index_data.bm25 is not None
-    has_vector = use_faiss and index_data.use_faiss and index_data.index is not None
+    with timing.stage("index"):
+        index_data = ensure_index(db)
+
+    use_fulltext = use_bm25 and pg_fulltext.enabled(db)
+    has_bm25 = use_bm25 and (use_fulltext or index_data.bm25 is not None)
+    use_pgvector = use_faiss and pgvector_store.enabled(db) and index_data.backend != "none"
+    has_vector = use_pgvector or (
+        use_faiss and index_data.use_faiss and index_data.index is not None
+    )
     retriever = _retriever_label(
         has_bm25=has_bm25,
         has_vector=has_vector,
         use_rrf=use_rrf,
         use_neighbors=use_neighbors,
+        lexical="pgfts" if use_fulltext else "bm25",
+        vector="pgvector" if use_pgvector else "faiss",
     )
     if not index_data.meta:
         return [], retriever
+    allowed = filters.allowed_mask(index_data, retrieval_filter)
+    max_candidates = len(index_data.meta) if allowed is None else allowed.count(1)
+    if not max_candidates:
+        return [], retriever
 
     fingerprint: dict[str, Any] | None = None
     if debug_enabled:
@@ -356,35 +532,52 @@ def retrieve_chunks(
             fingerprint,
         )
 
-    max_candidates = len(index_data.meta)
     candidates = min(max_candidates, max(80, limit * 10))
     bm25_hits: list[tuple[int, float]] = []
     vector_hits: list[tuple[int, float]] = []
 
-    if debug_enabled:
-        bm25_start = time.perf_counter()
-    if has_bm25:
+    bm25_start = time.perf_counter()
+    if use_fulltext:
+        bm25_hits = pg_fulltext.fulltext_search(
+            db,
+            index_data,
+            query,
+            min(bm25_top_k, candidates),
+            sort_hits=rrf.sort_hits,
+            retrieval_filter=retrieval_filter,
+            allowed=allowed,
+        )
+    elif has_bm25:
         bm25_hits = bm25.bm25_search(
             index_data,
             query,
             min(bm25_top_k, candidates),
             sort_hits=rrf.sort_hits,
+            allowed=allowed,
         )
-    if debug_enabled:
-        bm25_time = time.perf_counter() - bm25_start
-        vector_start = time.perf_counter()
-    if has_vector:
+    bm25_time = time.perf_counter() - bm25_start
+    vector_start = time.perf_counter()
+    if use_pgvector:
+        vector_hits = pgvector_store.vector_search(
+            db,
+            index_data,
+            query,
+            min(vec_top_k, candidates),
+            sort_hits=rrf.sort_hits,
+            retrieval_filter=retrieval_filter,
+            allowed=allowed,
+        )
+    elif has_vector:
         vector_hits = faiss_index.vector_search(
             index_data,
             query,
             min(vec_top_k, candidates),
             sort_hits=rrf.sort_hits,
+            allowed=allowed,
         )
-    if debug_enabled:
-        vector_time = time.perf_counter() - vector_start
+    vector_time = time.perf_counter() - vector_start
 
-    if debug_enabled:
-        rrf_start = time.perf_counter()
+    rrf_start = time.perf_counter()
     if has_bm25 and has_vector and use_rrf:
         fused = rrf.rrf_fuse(
             bm25_hits,
@@ -396,12 +589,10 @@ def retrieve_chunks(
     else:
         fused = bm25_hits or vector_hits
     fused = fused[: min(candidates, len(fused))]
-    if debug_enabled:
-        rrf_time = time.perf_counter() - rrf_start
+    rrf_time = time.perf_counter() - rrf_start
 
     if use_neighbors and fused:
-        if debug_enabled:
-            neighbor_start = time.perf_counter()
+        neighbor_start = time.perf_counter()
         expanded, seed_n, neighbors_added, deduped_count = postprocess.expand_neighbors_with_lookup(
             fused,
             index_data.meta,
@@ -409,14 +600,21 @@ def retrieve_chunks(
             neighbors_window=neighbors_window,
             neighbor_lookup=postprocess.neighbor_lookup(db, neighbors_window=neighbors_window),
         )
-        if debug_enabled:
-            neighbor_time = time.perf_counter() - neighbor_start
+        if allowed is not None:
+            expanded = [(idx, score) for idx, score in expanded if allowed[idx]]
+        neighbor_time = time.perf_counter() - neighbor_start
     else:
         expanded = fused
         neighbors_added = 0
         deduped_count = len(expanded)
         neighbor_time = 0.0
 
+    if has_bm25:
+        timing.record("fulltext" if use_fulltext else "bm25", bm25_time)
+    timing.record("fusion", rrf_time)
+    if use_neighbors and fused:
+        timing.record("neighbors", neighbor_time)
+
     if debug_enabled:
         bm25_indices = {idx for idx, _ in bm25_hits}
         vector_indices = {idx for idx, _ in vector_hits}
@@ -537,10 +735,18 @@ def search_chunks_with_meta(
     db: Session,
     query: str,
     limit: int,
+    *,
+    retrieval_filter: RetrievalFilter | None = None,
 ) -> tuple[list[tuple[int, float]], str]:
-    return retrieve_chunks(db, query, limit)
+    return retrieve_chunks(db, query, limit, retrieval_filter=retrieval_filter)
 
 
-def search_chunks(db: Session, query: str, limit: int) -> list[tuple[int, float]]:
-    hits, _ = search_chunks_with_meta(db, query, limit)
+def search_chunks(
+    db: Session,
+    query: str,
+    limit: int,
+    *,
+    retrieval_filter: RetrievalFilter | None = None,
+) -> list[tuple[int, float]]:
+    hits, _ = search_chunks_with_meta(db, query, limit, retrieval_filter=retrieval_filter)
     return hits
@@ -1,46 +1,47 @@
 from __future__ import annotations
 
-import importlib.util
+import bisect
+import heapq
+import logging
+import math
+import multiprocessing
+import os
 import re
-from typing import Any, Callable, TYPE_CHECKING
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, TYPE_CHECKING
 
 from sqlalchemy.orm import Session
 
-from app.models.document import Document, DocumentChunk
+from app.core.config import settings
+from . import corpus, providers, rrf
+from .index_store import mark_dirty_file
+from .token_cache import CorpusTokenCache, QueryTokenCache, corpus_token_cache
 
 if TYPE_CHECKING:
     from app.services.retrieval.index_store import IndexData
 
-BM25Okapi = None
-BM25_AVAILABLE = False
-if importlib.util.find_spec("rank_bm25") is not None:
-    from rank_bm25 import BM25Okapi  # type: ignore[import-untyped]
-
-    BM25_AVAILABLE = True
-
-np = None
-NUMPY_AVAILABLE = False
-if importlib.util.find_spec("numpy") is not None:
-    import numpy as np
-
-    NUMPY_AVAILABLE = True
-
-_NLP = None
-if importlib.util.find_spec("spacy") is not None:
-    try:
-        import spacy  # type: ignore
-
-        _NLP = spacy.load("ru_core_news_sm")
-    except (OSError, RuntimeError, ValueError):
-        _NLP = None
+logger = logging.getLogger(__name__)
 
 TOKEN_RE = re.compile(r"[0-9A-Za-zА-Яа-яЁё]+")
 CYRILLIC_RE = re.compile(r"^[а-я]+$")
 BM25_TOKENIZER_VERSION = "v2-yoe-soft-hyphen-char4gram-qfull-doccapped12"
 
+# Same parameters as rank_bm25.BM25Okapi, which this index replaces.
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
+TOKENIZE_BATCH_SIZE = 256
+_NORMALIZE_TABLE = str.maketrans({"ё": "е", "\u00ad": None})
+
+_query_token_cache = QueryTokenCache(settings.bm25_query_cache_size)
+
 
 def _normalize_token_text(text: str) -> str:
-    return text.lower().replace("ё", "е").replace("\u00ad", "")
+    return text.lower().translate(_NORMALIZE_TABLE)
 
 
 def _char_ngrams(token: str, n: int = 4, cap: int | None = None) -> list[str]:
@@ -52,20 +53,24 @@ def _char_ngrams(token: str, n: int = 4, cap: int | None = None) -> list[str]:
     return grams
 
 
-def tokenize_with_heading(
-    text: str,
-    heading: str | None = None,
-    path: str | None = None,
+def _raw_tokens(text: str) -> list[str]:
+    nlp = providers.spacy_nlp()
+    if nlp is not None:
+        return _doc_tokens(nlp(text))
+    return TOKEN_RE.findall(text)
+
+
+def _doc_tokens(doc: Any) -> list[str]:
+    return [(token.lemma_ or token.text) for token in doc if token.text.strip()]
+
+
+def _assemble_tokens(
+    raw_tokens: list[str],
+    heading_tokens: list[str],
+    path_tokens: list[str],
     *,
-    for_query: bool = False,
+    for_query: bool,
 ) -> list[str]:
-    raw_tokens: list[str]
-    if _NLP is not None:
-        raw_tokens = [
-            (token.lemma_ or token.text) for token in _NLP(text) if token.text.strip()
-        ]
-    else:
-        raw_tokens = TOKEN_RE.findall(text)
     base_tokens: list[str] = []
     for token in raw_tokens:
         normalized = _normalize_token_text(token)
@@ -74,12 +79,6 @@ def tokenize_with_heading(
         if normalized.isdigit():
             continue
         base_tokens.append(normalized)
-    heading_tokens: list[str] = []
-    path_tokens: list[str] = []
-    if heading:
-        heading_tokens = tokenize_with_heading(heading, for_query=for_query)
-    if path:
-        path_tokens = tokenize_with_heading(path, for_query=for_query)
     tokens = base_tokens + heading_tokens * 2 + path_tokens
     ngrams: list[str] = []
     for token in base_tokens:
@@ -90,46 +89,400 @@ def tokenize_with_heading(
     return tokens + ngrams
 
 
+def tokenize_with_heading(
+    text: str,
+    heading: str | None = None,
+    path: str | None = None,
+    *,
+    for_query: bool = False,
+) -> list[str]:
+    heading_tokens: list[str] = []
+    path_tokens: list[str] = []
+    if heading:
+        heading_tokens = tokenize_with_heading(heading, for_query=for_query)
+    if path:
+        path_tokens = tokenize_with_heading(path, for_query=for_query)
+    return _assemble_tokens(
+        _raw_tokens(text), heading_tokens, path_tokens, for_query=for_query
+    )
+
+
 def tokenize(text: str, *, for_query: bool = False) -> list[str]:
     return tokenize_with_heading(text, for_query=for_query)
 
 
-def build_bm25(texts: list[str]) -> Any | None:
-    if not texts or not BM25_AVAILABLE or BM25Okapi is None:
-        return None
-    tokenized_corpus = [tokenize(text) for text in texts]
-    return BM25Okapi(tokenized_corpus)
+def tokenizer_signature() -> str:
+    """Cache key component: tokens differ between the spaCy and regex paths."""
+    # The package can be installed while its model fails to load.
+    return f"{BM25_TOKENIZER_VERSION}:{'spacy' if providers.spacy_nlp() is not None else 'regex'}"
+
+
+def tokenize_query(query: str) -> list[str]:
+    version = tokenizer_signature()
+    tokens = _query_token_cache.get(query, version)
+    if tokens is None:
+        tokens = tokenize(query, for_query=True)
+        _query_token_cache.put(query, version, tokens)
+    return tokens
+
+
+def _tokenize_batch(texts: list[str]) -> list[list[str]]:
+    nlp = providers.spacy_nlp()
+    if nlp is None:
+        return [tokenize(text) for text in texts]
+    return [
+        _assemble_tokens(_doc_tokens(doc), [], [], for_query=False)
+        for doc in nlp.pipe(texts, batch_size=TOKENIZE_BATCH_SIZE)
+    ]
+
+
+def _tokenize_workers() -> int:
+    workers = settings.bm25_tokenize_workers
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+@contextmanager
+def tokenizer_pool(workers: int | None = None) -> Iterator[ProcessPoolExecutor | None]:
+    """Worker processes for corpus tokenization, or ``None`` to stay serial.
+
+    Workers are spawned rather than forked so they do not inherit the
+    embedding model or the query batcher thread; each loads spaCy once.
+    """
+    if workers is None:
+        workers = _tokenize_workers()
+    if workers <= 1:
+        yield None
+        return
+    try:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    except (OSError, ValueError) as exc:
+        logger.warning("Tokenizer process pool unavailable; tokenizing serially.", exc_info=exc)
+        yield None
+        return
+    with pool:
+        yield pool
+
+
+def _tokenize_uncached(
+    texts: list[str],
+    pool: ProcessPoolExecutor | None,
+) -> list[list[str]]:
+    batches = [
+        texts[start : start + TOKENIZE_BATCH_SIZE]
+        for start in range(0, len(texts), TOKENIZE_BATCH_SIZE)
+    ]
+    if pool is not None and len(batches) > 1:
+        # map() yields in submission order, so the result lines up with texts.
+        return [tokens for batch in pool.map(_tokenize_batch, batches) for tokens in batch]
+    return [tokens for batch in batches for tokens in _tokenize_batch(batch)]
+
+
+def tokenize_corpus(
+    texts: list[str],
+    *,
+    pool: ProcessPoolExecutor | None = None,
+    cache: CorpusTokenCache | None = None,
+) -> list[list[str]]:
+    if cache is None:
+        return _tokenize_uncached(texts, pool)
+    tokenized = cache.get_many(texts)
+    missing = [idx for idx, tokens in enumerate(tokenized) if tokens is None]
+    if missing:
+        missing_texts = [texts[idx] for idx in missing]
+        fresh = _tokenize_uncached(missing_texts, pool)
+        cache.put_many(missing_texts, fresh)
+        for idx, tokens in zip(missing, fresh, strict=True):
+            tokenized[idx] = tokens
+    return tokenized
+
+
+@contextmanager
+def corpus_tokenizer(workers: int | None = None) -> Iterator[Callable[[list[str]], list[list[str]]]]:
+    """Tokenizer for an index build: process pool plus persistent token cache.
+
+    If a worker process dies, the pool is dropped and the rest of the build
+    is tokenized serially.
+    """
+    with tokenizer_pool(workers) as pool, corpus_token_cache(tokenizer_signature()) as cache:
+        active_pool = pool
+
+        def tokenize_texts(texts: list[str]) -> list[list[str]]:
+            nonlocal active_pool
+            try:
+                return tokenize_corpus(texts, pool=active_pool, cache=cache)
+            except BrokenProcessPool as exc:
+                logger.warning("Tokenizer worker died; tokenizing serially.", exc_info=exc)
+                active_pool = None
+                return tokenize_corpus(texts, cache=cache)
+
+        yield tokenize_texts
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index.
+
+    Scores are identical to ``rank_bm25.BM25Okapi`` (including the epsilon
+    floor for negative idf), but only documents containing a query term are
+    visited and the tokenized corpus is never kept in memory. Terms are
+    mapped to int32 ids once; postings and idf are indexed by term id.
+    """
+
+    def __init__(
+        self,
+        vocabulary: dict[str, int],
+        postings: list[tuple[array, array]],
+        doc_lens: array,
+        idf: array,
+        avgdl: float,
+    ) -> None:
+        self.vocabulary = vocabulary
+        self.postings = postings
+        self.doc_lens = doc_lens
+        self.idf = idf
+        self.avgdl = avgdl
+        self.corpus_size = len(doc_lens)
+        self._length_norm = array(
+            "d",
+            (BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avgdl) for doc_len in doc_lens),
+        )
+        # Largest term-frequency component of each term, the per-term score
+        # upper bound used by MaxScore pruning.
+        self.max_impact = array("d", (self._max_impact(entry) for entry in postings))
+
+    def _max_impact(self, entry: tuple[array, array]) -> float:
+        length_norm = self._length_norm
+        k1_plus_1 = BM25_K1 + 1
+        return max(
+            (freq * k1_plus_1 / (freq + length_norm[doc]) for doc, freq in zip(*entry)),
+            default=0.0,
+        )
+
+    def term_ids(self, tokens: Iterable[str]) -> dict[int, int]:
+        """Query term ids with their multiplicity; out-of-vocabulary tokens are dropped."""
+        counts: dict[int, int] = {}
+        vocabulary = self.vocabulary
+        for token in tokens:
+            term_id = vocabulary.get(token)
+            if term_id is not None:
+                counts[term_id] = counts.get(term_id, 0) + 1
+        return counts
+
+    def _ordered_terms(self, term_counts: dict[int, int]) -> list[tuple[int, float, float]]:
+        """``(term_id, weight, upper_bound)`` by descending upper bound.
+
+        Exhaustive and pruned scoring both add term contributions in this
+        order, so they produce bit-identical scores.
+        """
+        terms = []
+        for term_id, count in term_counts.items():
+            weight = self.idf[term_id] * count
+            terms.append((term_id, weight, weight * self.max_impact[term_id]))
+        terms.sort(key=lambda item: (-item[2], item[0]))
+        return terms
+
+    def _accumulate(
+        self,
+        scores: dict[int, float],
+        term_id: int,
+        weight: float,
+        *,
+        candidates_only: bool = False,
+    ) -> None:
+        length_norm = self._length_norm
+        k1_plus_1 = BM25_K1 + 1
+        docs, freqs = self.postings[term_id]
+        if not candidates_only:
+            for doc, freq in zip(docs, freqs):
+                scores[doc] = scores.get(doc, 0.0) + weight * (
+                    freq * k1_plus_1 / (freq + length_norm[doc])
+                )
+        elif len(scores) * 16 < len(docs):
+            # Few candidates against a long postings list: probe instead of scanning.
+            for doc in scores:
+                pos = bisect.bisect_left(docs, doc)
+                if pos < len(docs) and docs[pos] == doc:
+                    freq = freqs[pos]
+                    scores[doc] += weight * (freq * k1_plus_1 / (freq + length_norm[doc]))
+        else:
+            for doc, freq in zip(docs, freqs):
+                if doc in scores:
+                    scores[doc] += weight * (freq * k1_plus_1 / (freq + length_norm[doc]))
+
+    def score_terms(self, term_counts: dict[int, int]) -> dict[int, float]:
+        scores: dict[int, float] = {}
+        for term_id, weight, _ in self._ordered_terms(term_counts):
+            self._accumulate(scores, term_id, weight)
+        return scores
+
+    def get_scores(self, tokens: Iterable[str]) -> dict[int, float]:
+        return self.score_terms(self.term_ids(tokens))
+
+    def top_k(
+        self,
+        term_counts: dict[int, int],
+        k: int,
+        tie_key: Callable[[int], tuple[int, ...]],
+        *,
+        allowed: bytearray | None = None,
+    ) -> list[tuple[int, float]]:
+        """Best ``k`` positive-scoring documents by ``(-score, tie_key)``, with MaxScore pruning.
+
+        Terms are scored in descending order of their upper bound. Once the
+        bound of the remaining terms is below the current k-th best score, no
+        unseen document can reach the top-k: the remaining (typically long,
+        low-idf) postings lists only update the surviving candidates, and
+        candidates that can no longer catch up are dropped. ``allowed`` masks
+        index positions out of the ranking (see ``filters.allowed_mask``).
+        """
+        if k <= 0 or not term_counts:
+            return []
+        terms = self._ordered_terms(term_counts)
+        scores: dict[int, float] = {}
+        candidates_only = False
+        if allowed is not None:
+            allowed_count = allowed.count(1)
+            if allowed_count * 16 < self.corpus_size:
+                # A narrow filter: score only the allowed documents from the start.
+                scores = {doc: 0.0 for doc, flag in enumerate(allowed) if flag}
+                candidates_only = True
+        # Negative contributions (idf below the epsilon floor) break the bound.
+        prunable = all(weight > 0 for _, weight, _ in terms)
+        remaining = sum(bound for _, _, bound in terms)
+        for term_id, weight, bound in terms:
+            remaining -= bound
+            self._accumulate(scores, term_id, weight, candidates_only=candidates_only)
+            if not prunable:
+                continue
+            if allowed is None or candidates_only:
+                ranked = scores.values()
+            else:
+                ranked = [score for doc, score in scores.items() if allowed[doc]]
+            if len(ranked) < k:
+                continue
+            threshold = heapq.nlargest(k, ranked)[-1]
+            if not candidates_only and _below(remaining, threshold):
+                candidates_only = True
+            if candidates_only:
+                scores = {
+                    doc: score
+                    for doc, score in scores.items()
+                    if not _below(score + remaining, threshold)
+                    and (allowed is None or allowed[doc])
+                }
+        hits = [
+            (doc, score)
+            for doc, score in scores.items()
+            if score > 0 and (allowed is None or allowed[doc])
+        ]
+        hits.sort(key=lambda item: (-item[1], tie_key(item[0])))
+        return hits[:k]
+
+
+def _below(bound: float, threshold: float) -> bool:
+    """``bound < threshold`` with slack for the rounding in running bound sums."""
+    return bound < threshold * (1 - 1e-9)
+
+
+class BM25Builder:
+    """Collects BM25 statistics one document at a time in a single pass."""
+
+    def __init__(self) -> None:
+        self._vocabulary: dict[str, int] = {}
+        self._postings: list[tuple[array, array]] = []
+        self._doc_lens = array("i")
+        self._total_len = 0
+
+    @property
+    def corpus_size(self) -> int:
+        return len(self._doc_lens)
+
+    def add(self, tokens: list[str]) -> None:
+        doc = len(self._doc_lens)
+        self._doc_lens.append(len(tokens))
+        self._total_len += len(tokens)
+        vocabulary = self._vocabulary
+        frequencies: dict[int, int] = {}
+        for token in tokens:
+            term_id = vocabulary.get(token)
+            if term_id is None:
+                term_id = len(self._postings)
+                vocabulary[token] = term_id
+                self._postings.append((array("i"), array("i")))
+            frequencies[term_id] = frequencies.get(term_id, 0) + 1
+        for term_id, freq in frequencies.items():
+            docs, freqs = self._postings[term_id]
+            docs.append(doc)
+            freqs.append(freq)
+
+    def build(self) -> BM25Index | None:
+        corpus_size = len(self._doc_lens)
+        if corpus_size == 0 or self._total_len == 0:
+            return None
+        idf = array("d", bytes(8 * len(self._postings)))
+        idf_sum = 0.0
+        negative: list[int] = []
+        for term_id, (docs, _) in enumerate(self._postings):
+            value = math.log(corpus_size - len(docs) + 0.5) - math.log(len(docs) + 0.5)
+            idf[term_id] = value
+            idf_sum += value
+            if value < 0:
+                negative.append(term_id)
+        eps = BM25_EPSILON * idf_sum / len(idf)
+        for term_id in negative:
+            idf[term_id] = eps
+        return BM25Index(
+            self._vocabulary,
+            self._postings,
+            self._doc_lens,
+            idf,
+            self._total_len / corpus_size,
+        )
+
+
+def build_bm25(texts: list[str]) -> BM25Index | None:
+    builder = BM25Builder()
+    for tokens in tokenize_corpus(texts):
+        builder.add(tokens)
+    return builder.build()
 
 
 def attach_bm25(db: Session, index_data: IndexData) -> IndexData:
-    if not index_data.meta or not BM25_AVAILABLE:
+    if not index_data.meta:
         index_data.bm25 = None
         return index_data
-    chunk_ids = [meta_item["chunk_id"] for meta_item in index_data.meta]
-    chunks = (
-        db.query(DocumentChunk)
-        .join(Document, Document.id == DocumentChunk.document_id)
-        .filter(Document.status == "published")
-        .filter(DocumentChunk.id.in_(chunk_ids))
-        .all()
-    )
-    chunk_map = {chunk.id: chunk for chunk in chunks}
-    texts: list[str] = []
+    meta_by_chunk_id = {meta_item["chunk_id"]: meta_item for meta_item in index_data.meta}
+    builder = BM25Builder()
     ordered_meta: list[dict[str, int]] = []
-    for meta_item in index_data.meta:
-        chunk = chunk_map.get(meta_item["chunk_id"])
-        if chunk is None:
-            continue
-        texts.append(chunk.text)
-        ordered_meta.append(
-            {
-                "doc_id": chunk.document_id,
-                "chunk_id": chunk.id,
-                "chunk_index": chunk.chunk_index,
-            }
+    # Serial: the token cache written by the index build normally covers the
+    # whole corpus, so worker processes would only add start-up time.
+    with corpus_tokenizer(workers=1) as tokenize_texts:
+        for rows in corpus.iter_published_chunk_slices(db, settings.index_build_slice_size):
+            rows = [row for row in rows if row.id in meta_by_chunk_id]
+            tokenized = tokenize_texts([row.text for row in rows])
+            for row, tokens in zip(rows, tokenized, strict=True):
+                builder.add(tokens)
+                ordered_meta.append(
+                    {
+                        "doc_id": row.document_id,
+                        "chunk_id": row.id,
+                        "chunk_index": row.chunk_index,
+                    }
+                )
+    if len(ordered_meta) != len(index_data.meta):
+        logger.warning(
+            "Index metadata references %s chunks that are no longer published; marking index dirty.",
+            len(index_data.meta) - len(ordered_meta),
         )
+        mark_dirty_file()
     index_data.meta = ordered_meta
-    index_data.bm25 = build_bm25(texts)
+    index_data.doc_positions = None
+    index_data.chunk_positions = None
+    index_data.bm25 = builder.build()
     return index_data
 
 
@@ -139,23 +492,28 @@ def bm25_search(
     limit: int,
     *,
     sort_hits: Callable[[list[tuple[int, float]], list[dict[str, int]]], list[tuple[int, float]]],
+    allowed: bytearray | None = None,
 ) -> list[tuple[int, float]]:
     if index_data.bm25 is None:
         return []
-    tokens = tokenize(query, for_query=True)
+    tokens = tokenize_query(query)
     if not tokens:
         return []
+    if limit <= 0:
+        return []
+    if settings.bm25_pruning:
+        meta = index_data.meta
+        hits = index_data.bm25.top_k(
+            index_data.bm25.term_ids(tokens),
+            limit,
+            lambda idx: rrf.tie_break_key(meta[idx]),
+            allowed=allowed,
+        )
+        return sort_hits(hits, meta)
     scores = index_data.bm25.get_scores(tokens)
-    if NUMPY_AVAILABLE and isinstance(scores, np.ndarray):
-        top_k = min(limit, len(scores))
-        if top_k <= 0:
-            return []
-        top_indices = np.argpartition(-scores, top_k - 1)[:top_k]
-        hits = [
-            (int(idx), float(scores[int(idx)]))
-            for idx in top_indices
-            if scores[int(idx)] > 0
-        ]
-    else:
-        hits = [(idx, float(score)) for idx, score in enumerate(scores) if score > 0]
+    hits = [
+        (idx, score)
+        for idx, score in scores.items()
+        if score > 0 and (allowed is None or allowed[idx])
+    ]
     return sort_hits(hits, index_data.meta)[: min(limit, len(hits))]
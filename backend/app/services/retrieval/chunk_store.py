@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import io
+import json
+import logging
+import mmap
+import os
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable
+
+from app.services.document_processing import CLEANING_VERSION
+from app.services.text_utils import excerpt_forms, snippet_forms
+
+logger = logging.getLogger(__name__)
+
+CHUNK_STORE_VERSION = 2
+CHUNK_STORE_FIELDS = ("text", "snippet_text", "snippet_search", "excerpt_text", "excerpt_search")
+
+
+@dataclass(frozen=True)
+class StoredChunk:
+    """A chunk with the display and search forms used for snippets and LLM excerpts."""
+
+    chunk_id: int
+    doc_id: int
+    title: str | None
+    text: str
+    snippet_text: str
+    snippet_search: str
+    excerpt_text: str
+    excerpt_search: str
+
+    @classmethod
+    def from_text(
+        cls,
+        *,
+        chunk_id: int,
+        doc_id: int,
+        title: str | None,
+        text: str,
+    ) -> StoredChunk:
+        return cls(chunk_id, doc_id, title, *chunk_fields(text))
+
+
+class ChunkStore:
+    """Read-only chunk texts and document titles, looked up by chunk id.
+
+    Texts (raw plus the precomputed snippet and excerpt forms) live in one
+    UTF-8 blob (memory-mapped when loaded from disk) with an int64 offsets
+    table, so a lookup is a dict probe plus a slice.
+    """
+
+    def __init__(
+        self,
+        blob: Any,
+        offsets: array,
+        chunk_ids: array,
+        doc_ids: array,
+        titles: dict[int, str | None],
+        corpus_version: tuple[int, int],
+    ) -> None:
+        self._blob = blob
+        self._offsets = offsets
+        self._doc_ids = doc_ids
+        self._titles = titles
+        self._positions = {chunk_id: pos for pos, chunk_id in enumerate(chunk_ids)}
+        self.corpus_version = corpus_version
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def _field(self, pos: int, field: int) -> str:
+        slot = pos * len(CHUNK_STORE_FIELDS) + field
+        return self._blob[self._offsets[slot] : self._offsets[slot + 1]].decode("utf-8")
+
+    def get(self, chunk_id: int) -> StoredChunk | None:
+        pos = self._positions.get(chunk_id)
+        if pos is None:
+            return None
+        doc_id = self._doc_ids[pos]
+        return StoredChunk(
+            chunk_id,
+            doc_id,
+            self._titles.get(doc_id),
+            *(self._field(pos, field) for field in range(len(CHUNK_STORE_FIELDS))),
+        )
+
+    def get_many(self, chunk_ids: Iterable[int]) -> dict[int, StoredChunk]:
+        found: dict[int, StoredChunk] = {}
+        for chunk_id in chunk_ids:
+            chunk = self.get(chunk_id)
+            if chunk is not None:
+                found[chunk_id] = chunk
+        return found
+
+
+class ChunkStoreWriter:
+    """Appends chunks in index order; ``finish`` writes the store next to the index."""
+
+    def __init__(self, paths: dict[str, Path] | None) -> None:
+        self._paths = paths
+        self._blob_tmp: Path | None = None
+        if paths:
+            self._blob_tmp = paths["chunks"].with_name(f"{paths['chunks'].name}.tmp")
+            self._blob: Any = open(self._blob_tmp, "wb")
+        else:
+            self._blob = io.BytesIO()
+        self._size = 0
+        self._offsets = array("q", [0])
+        self._chunk_ids = array("q")
+        self._doc_ids = array("q")
+
+    def add(self, rows: Iterable[Any]) -> None:
+        for row in rows:
+            self._chunk_ids.append(row.id)
+            self._doc_ids.append(row.document_id)
+            for value in chunk_fields(row.text):
+                encoded = value.encode("utf-8")
+                self._blob.write(encoded)
+                self._size += len(encoded)
+                self._offsets.append(self._size)
+
+    def finish(
+        self,
+        titles: dict[int, str | None],
+        corpus_version: tuple[int, int],
+    ) -> ChunkStore | None:
+        if self._paths is None:
+            blob = self._blob.getvalue()
+            return ChunkStore(
+                blob, self._offsets, self._chunk_ids, self._doc_ids, titles, corpus_version
+            )
+        self._blob.close()
+        os.replace(self._blob_tmp, self._paths["chunks"])
+        with open(self._paths["chunk_offsets"], "wb") as handle:
+            self._chunk_ids.tofile(handle)
+            self._doc_ids.tofile(handle)
+            self._offsets.tofile(handle)
+        header = {
+            "version": CHUNK_STORE_VERSION,
+            "fields": list(CHUNK_STORE_FIELDS),
+            "cleaning_version": CLEANING_VERSION,
+            "count": len(self._chunk_ids),
+            "corpus_version": list(corpus_version),
+            "titles": {str(doc_id): title for doc_id, title in titles.items()},
+        }
+        self._paths["chunk_header"].write_text(
+            json.dumps(header, ensure_ascii=False), encoding="utf-8"
+        )
+        return load_chunk_store(self._paths, corpus_version)
+
+
+def chunk_fields(text: str) -> tuple[str, ...]:
+    """Values of ``CHUNK_STORE_FIELDS``, computed once per chunk at build time."""
+    return (text, *snippet_forms(text), *excerpt_forms(text))
+
+
+def load_chunk_store(
+    paths: dict[str, Path],
+    corpus_version: tuple[int, int],
+) -> ChunkStore | None:
+    """Open the stored chunks if they were written for this ``corpus_version``."""
+    try:
+        header = json.loads(paths["chunk_header"].read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if (
+        header.get("version") != CHUNK_STORE_VERSION
+        or header.get("fields") != list(CHUNK_STORE_FIELDS)
+        or header.get("cleaning_version") != CLEANING_VERSION
+        or tuple(header.get("corpus_version", ())) != tuple(corpus_version)
+    ):
+        return None
+    count = int(header.get("count", 0))
+    try:
+        chunk_ids = array("q")
+        doc_ids = array("q")
+        offsets = array("q")
+        with open(paths["chunk_offsets"], "rb") as handle:
+            chunk_ids.fromfile(handle, count)
+            doc_ids.fromfile(handle, count)
+            offsets.fromfile(handle, count * len(CHUNK_STORE_FIELDS) + 1)
+        blob: Any = b""
+        if offsets[-1] > 0:
+            with open(paths["chunks"], "rb") as handle:
+                blob = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(blob) < offsets[-1]:
+                blob.close()
+                return None
+    except (OSError, EOFError, ValueError) as exc:
+        logger.warning("Failed to load chunk store.", exc_info=exc)
+        return None
+    titles = {int(doc_id): title for doc_id, title in header.get("titles", {}).items()}
+    return ChunkStore(blob, offsets, chunk_ids, doc_ids, titles, tuple(corpus_version))
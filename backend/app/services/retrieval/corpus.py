@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import Any, Iterator
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.document import Document, DocumentChunk
+
+
+def _published_chunks(db: Session, *columns: Any):
+    return (
+        db.query(*columns)
+        .select_from(DocumentChunk)
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .filter(Document.status == "published")
+    )
+
+
+def count_published_chunks(db: Session) -> int:
+    return int(_published_chunks(db, func.count(DocumentChunk.id)).scalar() or 0)
+
+
+def iter_published_chunk_slices(db: Session, slice_size: int) -> Iterator[list[Any]]:
+    """Stream published chunks in ``chunk_id`` order as lists of row tuples.
+
+    Rows carry ``id``, ``document_id``, ``chunk_index`` and ``text`` only, and
+    are fetched with ``yield_per`` so memory stays bounded by ``slice_size``.
+    """
+    slice_size = max(1, slice_size)
+    query = (
+        _published_chunks(
+            db,
+            DocumentChunk.id,
+            DocumentChunk.document_id,
+            DocumentChunk.chunk_index,
+            DocumentChunk.text,
+        )
+        .order_by(DocumentChunk.id.asc())
+        .yield_per(slice_size)
+    )
+    rows: list[Any] = []
+    for row in query:
+        rows.append(row)
+        if len(rows) >= slice_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def published_document_titles(db: Session) -> dict[int, str | None]:
+    rows = db.query(Document.id, Document.title).filter(Document.status == "published")
+    return {doc_id: title for doc_id, title in rows}
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """Single worker thread that micro-batches encode requests.
+
+    Requests arriving within ``max_wait_ms`` of the first queued one are
+    encoded together (up to ``max_batch`` texts), so concurrent queries share
+    one forward pass instead of competing for the same CPU cores.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[list[str]], Sequence[Any]],
+        *,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = "embedding-worker",
+    ) -> None:
+        self._encode = encode
+        self._max_batch = max(1, max_batch)
+        self._max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._name = name
+        self._queue: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._ensure_started()
+        self._queue.put((text, future))
+        return future
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._thread is not None:
+                logger.warning("%s thread died; restarting it.", self._name)
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+
+    def _collect_batch(self) -> list[tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self) -> None:
+        while True:
+            batch: list[tuple[str, Future]] = []
+            try:
+                batch = self._collect_batch()
+                if batch:
+                    embeddings = self._encode([text for text, _ in batch])
+                    results = list(zip(batch, embeddings, strict=True))
+                    for (_, future), embedding in results:
+                        future.set_result(embedding)
+            except Exception as exc:  # noqa: BLE001 - surfaced to every waiting caller
+                logger.warning("Batched embedding failed for %s texts.", len(batch), exc_info=exc)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
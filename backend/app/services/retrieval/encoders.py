@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import json
+import logging
+from pathlib import Path
+from typing import Any, Protocol
+
+from app.core.config import settings
+from . import providers
+
+np = None
+NUMPY_AVAILABLE = False
+if importlib.util.find_spec("numpy") is not None:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+
+logger = logging.getLogger(__name__)
+
+ENCODER_BACKENDS = ("torch", "onnx")
+# Preferred first: the int8 model written by app.scripts.export_onnx_encoder.
+ONNX_MODEL_FILENAMES = ("model_quantized.onnx", "model.onnx")
+# Written next to the model by app.scripts.export_onnx_encoder.
+ONNX_EXPORT_INFO_FILENAME = "export.json"
+
+
+class Encoder(Protocol):
+    backend: str
+    # Recorded in the index fingerprint: changes whenever embeddings would.
+    identity: str
+    max_seq_length: int
+    tokenizer: Any
+
+    def encode(self, texts: list[str], *, batch_size: int = 32) -> Any:
+        """Return L2-normalized float32 embeddings, one row per text."""
+
+    def dimension(self) -> int:
+        ...
+
+
+class TorchEncoder:
+    backend = "torch"
+    identity = "torch"
+
+    def __init__(self, model: Any) -> None:
+        self.model = model
+        self.tokenizer = model.tokenizer
+        self.max_seq_length = int(model.max_seq_length or 512)
+
+    def encode(self, texts: list[str], *, batch_size: int = 32) -> Any:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            normalize_embeddings=True,
+        ).astype("float32")
+
+    def dimension(self) -> int:
+        return int(self.model.get_sentence_embedding_dimension())
+
+
+class OnnxEncoder:
+    """Runs a SentenceTransformer exported to ONNX with mean pooling.
+
+    Matches the Transformer -> mean Pooling -> Normalize stack of the e5
+    models, so embeddings stay comparable with the torch backend.
+    """
+
+    backend = "onnx"
+
+    def __init__(
+        self,
+        model_dir: str | Path,
+        *,
+        model_name: str | None = None,
+        num_threads: int = 0,
+        max_seq_length: int = 512,
+    ) -> None:
+        ort = providers.onnxruntime()
+        tokenizer_cls = providers.auto_tokenizer_cls()
+        if ort is None or tokenizer_cls is None or not NUMPY_AVAILABLE:
+            raise RuntimeError("onnxruntime, transformers and numpy are required for the ONNX encoder.")
+        model_dir = Path(model_dir)
+        model_file = onnx_model_file(model_dir)
+        if model_name is not None:
+            check_onnx_export(model_dir, model_name)
+        options = ort.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self._session = ort.InferenceSession(
+            str(model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {item.name for item in self._session.get_inputs()}
+        self.tokenizer = tokenizer_cls.from_pretrained(str(model_dir))
+        self.max_seq_length = max_seq_length
+        self.model_file = model_file
+        self.identity = onnx_identity(model_file)
+        self._dimension: int | None = None
+
+    def encode(self, texts: list[str], *, batch_size: int = 32) -> Any:
+        batches = []
+        for start in range(0, len(texts), max(1, batch_size)):
+            encoded = self.tokenizer(
+                texts[start : start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {
+                name: encoded[name].astype(np.int64)
+                for name in self._input_names
+                if name in encoded
+            }
+            if "token_type_ids" in self._input_names and "token_type_ids" not in feeds:
+                feeds["token_type_ids"] = np.zeros_like(encoded["input_ids"], dtype=np.int64)
+            hidden = self._session.run(None, feeds)[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            batches.append(pooled / np.clip(norms, 1e-12, None))
+        if not batches:
+            return np.zeros((0, self.dimension()), dtype="float32")
+        return np.vstack(batches).astype("float32")
+
+    def dimension(self) -> int:
+        if self._dimension is None:
+            declared = self._session.get_outputs()[0].shape[-1]
+            if isinstance(declared, int):
+                self._dimension = declared
+            else:
+                self._dimension = int(self.encode(["dimension probe"]).shape[1])
+        return self._dimension
+
+
+def onnx_model_file(model_dir: Path) -> Path:
+    model_file = next(
+        (model_dir / name for name in ONNX_MODEL_FILENAMES if (model_dir / name).exists()),
+        None,
+    )
+    if model_file is None:
+        raise OSError(f"No ONNX model found in {model_dir}")
+    return model_file
+
+
+def onnx_identity(model_file: Path) -> str:
+    """File name and content hash, so another export (or quantization) changes it."""
+    digest = hashlib.sha256()
+    with model_file.open("rb") as handle:
+        while block := handle.read(1024 * 1024):
+            digest.update(block)
+    return f"onnx:{model_file.name}:{digest.hexdigest()[:16]}"
+
+
+def check_onnx_export(model_dir: Path, model_name: str) -> None:
+    """Raise ValueError if the export was made from a different model."""
+    info_path = model_dir / ONNX_EXPORT_INFO_FILENAME
+    if not info_path.exists():
+        logger.warning(
+            "%s has no %s; cannot check it was exported from %s.",
+            model_dir,
+            ONNX_EXPORT_INFO_FILENAME,
+            model_name,
+        )
+        return
+    exported = json.loads(info_path.read_text(encoding="utf-8")).get("model_name")
+    if exported != model_name:
+        raise ValueError(
+            f"ONNX export in {model_dir} is of {exported}, not EMBEDDING_MODEL_NAME={model_name}"
+        )
+
+
+def configured_backend() -> str:
+    backend = settings.embedding_backend.lower()
+    if backend not in ENCODER_BACKENDS:
+        logger.warning("Unknown EMBEDDING_BACKEND=%s; using torch.", settings.embedding_backend)
+        return "torch"
+    return backend
+
+
+def load_encoder(model_name: str) -> Encoder | None:
+    if configured_backend() == "onnx":
+        try:
+            return OnnxEncoder(
+                settings.embedding_onnx_path,
+                model_name=model_name,
+                num_threads=settings.embedding_onnx_threads,
+            )
+        except (OSError, RuntimeError, ValueError) as exc:
+            logger.warning("ONNX encoder unavailable; falling back to torch.", exc_info=exc)
+    sentence_transformer = providers.sentence_transformer_cls()
+    if sentence_transformer is None:
+        return None
+    providers.configure_torch_threads(settings.embedding_torch_threads)
+    return TorchEncoder(sentence_transformer(model_name, device="cpu"))
@@ -3,18 +3,20 @@ from __future__ import annotations
 import importlib.util
 import logging
 import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import Any, Callable, TYPE_CHECKING
 
+from app.core import timing
+from app.core.config import settings
+from . import providers
+from .embedding_worker import EmbeddingBatcher
+from .encoders import Encoder, load_encoder
+
 if TYPE_CHECKING:
     from app.services.retrieval.index_store import IndexData
 
-SentenceTransformer = None
-SENTENCE_TRANSFORMERS_AVAILABLE = False
-if importlib.util.find_spec("sentence_transformers") is not None:
-    from sentence_transformers import SentenceTransformer
-
-    SENTENCE_TRANSFORMERS_AVAILABLE = True
-
 np = None
 NUMPY_AVAILABLE = False
 if importlib.util.find_spec("numpy") is not None:
@@ -22,18 +24,13 @@ if importlib.util.find_spec("numpy") is not None:
 
     NUMPY_AVAILABLE = True
 
-faiss = None
-FAISS_AVAILABLE = False
-if importlib.util.find_spec("faiss") is not None:
-    import faiss  # type: ignore
-
-    FAISS_AVAILABLE = True
-
 logger = logging.getLogger(__name__)
 
-_model: SentenceTransformer | None = None
+_model: Encoder | None = None
 _model_failed = False
 _model_name: str | None = None
+_query_batcher: EmbeddingBatcher | None = None
+_query_batcher_lock = threading.Lock()
 
 
 def effective_model_name() -> str:
@@ -45,7 +42,7 @@ def is_e5(model_name: str) -> bool:
 
 
 def embedding_dim(
-    model: SentenceTransformer | None,
+    model: Encoder | None,
     embeddings: Any | None,
 ) -> str | int:
     if embeddings is not None:
@@ -55,13 +52,17 @@ def embedding_dim(
             pass
     if model is not None:
         try:
-            return model.get_sentence_embedding_dimension()
+            return model.dimension()
         except (AttributeError, RuntimeError, ValueError):
             return "unknown"
     return "none"
 
 
-def get_model() -> SentenceTransformer | None:
+def embedding_backend_name(model: Encoder | None) -> str:
+    return model.identity if model is not None else "none"
+
+
+def get_model() -> Encoder | None:
     global _model
     global _model_failed
     global _model_name
@@ -69,20 +70,32 @@ def get_model() -> SentenceTransformer | None:
     if _model is not None and _model_name == model_name:
         return _model
     if _model is None or _model_name != model_name:
-        if _model_failed or not SENTENCE_TRANSFORMERS_AVAILABLE:
+        if _model_failed:
             return None
         try:
-            _model = SentenceTransformer(model_name, device="cpu")
-            _model_name = model_name
+            _model = load_encoder(model_name)
+            _model_name = model_name if _model is not None else None
         except (OSError, RuntimeError, ValueError) as exc:
             _model_failed = True
             _model = None
             _model_name = None
-            logger.warning("SentenceTransformer unavailable.", exc_info=exc)
+            logger.warning("Embedding encoder unavailable.", exc_info=exc)
     return _model
 
 
-def get_embedding_backend() -> tuple[str, SentenceTransformer | None]:
+def loaded_backend() -> str | None:
+    """``get_embedding_backend()[0]`` if the encoder was already loaded (or failed), else None.
+
+    Never loads the encoder, so it is safe to call without the index lock.
+    """
+    if _model is not None and _model_name == effective_model_name():
+        return _model_name
+    if _model_failed:
+        return "none"
+    return None
+
+
+def get_embedding_backend() -> tuple[str, Encoder | None]:
     model = get_model()
     model_name = effective_model_name()
     if model is None:
@@ -92,7 +105,7 @@ def get_embedding_backend() -> tuple[str, SentenceTransformer | None]:
 
 def embed_texts(
     texts: list[str],
-    model: SentenceTransformer,
+    model: Encoder,
     *,
     is_query: bool,
     model_name: str,
@@ -100,34 +113,197 @@ def embed_texts(
     if is_e5(model_name):
         prefix = "query: " if is_query else "passage: "
         texts = [f"{prefix}{text}" for text in texts]
-    return model.encode(
+    return model.encode(texts, batch_size=32)
+
+
+def plan_length_batches(
+    lengths: list[int],
+    *,
+    token_budget: int,
+    max_batch: int,
+) -> list[list[int]]:
+    """Group text positions by length so each batch pads to a similar size.
+
+    A batch costs ``len(batch) * longest`` padded tokens, which is kept within
+    ``token_budget``; a single over-long text still gets its own batch.
+    """
+    order = sorted(range(len(lengths)), key=lambda idx: lengths[idx])
+    batches: list[list[int]] = []
+    current: list[int] = []
+    for idx in order:
+        longest = max(1, lengths[idx])
+        if current and (
+            len(current) >= max_batch or longest * (len(current) + 1) > token_budget
+        ):
+            batches.append(current)
+            current = []
+        current.append(idx)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _token_lengths(texts: list[str], model: Encoder) -> list[int]:
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        # Rough multilingual estimate when the encoder exposes no tokenizer.
+        return [min(model.max_seq_length, len(text) // 3 + 2) for text in texts]
+    encoded = tokenizer(
         texts,
-        batch_size=32,
-        show_progress_bar=False,
-        normalize_embeddings=True,
-    ).astype("float32")
+        add_special_tokens=True,
+        truncation=True,
+        max_length=model.max_seq_length,
+    )
+    return [len(ids) for ids in encoded["input_ids"]]
 
 
-def build_faiss_index(
+def embed_passages(
     texts: list[str],
-    model: SentenceTransformer | None,
+    model: Encoder,
     *,
     model_name: str,
-    paths: dict[str, Any] | None,
-) -> tuple[bool, Any | None, Any | None]:
-    use_faiss = bool(
-        model is not None and FAISS_AVAILABLE and faiss is not None and NUMPY_AVAILABLE
+) -> Any:
+    if is_e5(model_name):
+        texts = [f"passage: {text}" for text in texts]
+    batches = plan_length_batches(
+        _token_lengths(texts, model),
+        token_budget=settings.embedding_token_budget,
+        max_batch=settings.embedding_build_max_batch,
     )
-    if not use_faiss or model is None:
-        return False, None, None
-    embeddings = embed_texts(texts, model, is_query=False, model_name=model_name)
-    index = faiss.IndexFlatIP(embeddings.shape[1])
-    index.add(embeddings)
-    if paths:
-        faiss.write_index(index, str(paths["index"]))
-        if NUMPY_AVAILABLE:
-            np.save(paths["embeddings"], embeddings)
-    return True, index, embeddings
+    embeddings = np.empty((len(texts), model.dimension()), dtype="float32")
+    for batch in batches:
+        embeddings[batch] = model.encode([texts[idx] for idx in batch], batch_size=len(batch))
+    return embeddings
+
+
+class BuildProgress:
+    def __init__(self, total: int, *, interval: float = 10.0) -> None:
+        self.total = total
+        self.done = 0
+        self._interval = interval
+        self._start = time.perf_counter()
+        self._last_log = self._start
+
+    def advance(self, count: int) -> None:
+        self.done += count
+        now = time.perf_counter()
+        if now - self._last_log < self._interval and self.done < self.total:
+            return
+        self._last_log = now
+        elapsed = max(now - self._start, 1e-9)
+        logger.info(
+            "Embedding progress %s/%s chunks (%.0f%%) %.1f chunks/s elapsed=%.1fs",
+            self.done,
+            self.total,
+            100.0 * self.done / max(self.total, 1),
+            self.done / elapsed,
+            elapsed,
+        )
+
+
+class FaissIndexWriter:
+    """Embeds the corpus slice by slice into a FAISS index.
+
+    Embeddings go straight into a preallocated ``.npy`` memmap (renamed into
+    place on ``finish``), so a build never holds more than one slice of
+    vectors in addition to the index itself.
+    """
+
+    def __init__(
+        self,
+        model: Encoder,
+        faiss: Any,
+        *,
+        model_name: str,
+        total: int,
+        paths: dict[str, Any] | None,
+    ) -> None:
+        dim = model.dimension()
+        self._model = model
+        self._model_name = model_name
+        self._faiss = faiss
+        self._paths = paths
+        self._tmp_path = None
+        self.index = faiss.IndexFlatIP(dim)
+        if paths:
+            self._tmp_path = paths["embeddings"].with_name(f"{paths['embeddings'].name}.tmp")
+            self.embeddings = np.lib.format.open_memmap(
+                self._tmp_path,
+                mode="w+",
+                dtype="float32",
+                shape=(total, dim),
+            )
+        else:
+            self.embeddings = np.empty((total, dim), dtype="float32")
+        self.count = 0
+        self._progress = BuildProgress(total)
+
+    @classmethod
+    def create(
+        cls,
+        model: Encoder | None,
+        *,
+        model_name: str,
+        total: int,
+        paths: dict[str, Any] | None,
+    ) -> FaissIndexWriter | None:
+        if model is None or not NUMPY_AVAILABLE:
+            return None
+        faiss = providers.faiss()
+        if faiss is None:
+            return None
+        return cls(model, faiss, model_name=model_name, total=total, paths=paths)
+
+    def add(self, texts: list[str]) -> None:
+        vectors = embed_passages(texts, self._model, model_name=self._model_name)
+        end = self.count + len(vectors)
+        self.embeddings[self.count : end] = vectors
+        self.index.add(vectors)
+        self.count = end
+        self._progress.advance(len(vectors))
+
+    def finish(self) -> tuple[Any, Any]:
+        if self._paths:
+            self.embeddings.flush()
+            os.replace(self._tmp_path, self._paths["embeddings"])
+            self._faiss.write_index(self.index, str(self._paths["index"]))
+        return self.index, self.embeddings[: self.count]
+
+
+def _encode_queries(texts: list[str]) -> Any:
+    model = get_model()
+    if model is None:
+        raise RuntimeError("Embedding model is not available.")
+    return embed_texts(texts, model, is_query=True, model_name=effective_model_name())
+
+
+def _get_query_batcher() -> EmbeddingBatcher:
+    global _query_batcher
+    with _query_batcher_lock:
+        if _query_batcher is None:
+            _query_batcher = EmbeddingBatcher(
+                _encode_queries,
+                max_batch=settings.embedding_max_batch,
+                max_wait_ms=settings.embedding_batch_wait_ms,
+                name="query-embedding-worker",
+            )
+        return _query_batcher
+
+
+def embed_query(query: str, model: Encoder) -> Any:
+    if settings.embedding_batching:
+        future = _get_query_batcher().submit(query)
+        try:
+            return future.result(timeout=settings.embedding_batch_timeout_seconds)
+        except FutureTimeoutError:
+            future.cancel()
+            logger.warning("Batched query embedding timed out; encoding directly.")
+    return embed_texts(
+        [query],
+        model,
+        is_query=True,
+        model_name=effective_model_name(),
+    )[0]
 
 
 def load_embeddings(paths: dict[str, Any]) -> Any | None:
@@ -143,7 +319,8 @@ def load_embeddings(paths: dict[str, Any]) -> Any | None:
 
 
 def load_faiss_index(paths: dict[str, Any]) -> Any | None:
-    if not (FAISS_AVAILABLE and faiss is not None):
+    faiss = providers.faiss()
+    if faiss is None:
         return None
     if not paths["index"].exists():
         return None
@@ -156,6 +333,7 @@ def vector_search(
     limit: int,
     *,
     sort_hits: Callable[[list[tuple[int, float]], list[dict[str, int]]], list[tuple[int, float]]],
+    allowed: bytearray | None = None,
 ) -> list[tuple[int, float]]:
     if not index_data.meta or not index_data.use_faiss or index_data.index is None:
         return []
@@ -164,17 +342,21 @@ def vector_search(
     model = get_model()
     if model is None or not NUMPY_AVAILABLE:
         return []
-    model_name = effective_model_name()
-    query_embedding = embed_texts(
-        [query],
-        model,
-        is_query=True,
-        model_name=model_name,
-    )[0]
+    search_kwargs: dict[str, Any] = {}
+    k = min(limit, len(index_data.meta))
+    if allowed is not None:
+        faiss = providers.faiss()
+        mask = np.frombuffer(allowed, dtype=np.uint8)
+        k = min(k, int(np.count_nonzero(mask)))
+        if k == 0 or faiss is None:
+            return []
+        bitmap = np.packbits(mask, bitorder="little")
+        search_kwargs["params"] = faiss.SearchParameters(sel=faiss.IDSelectorBitmap(bitmap))
+    with timing.stage("embed"):
+        query_embedding = embed_query(query, model)
     query_vector = np.expand_dims(query_embedding, axis=0)
-    scores, indices = index_data.index.search(
-        query_vector, min(limit, len(index_data.meta))
-    )
+    with timing.stage("faiss"):
+        scores, indices = index_data.index.search(query_vector, k, **search_kwargs)
     hits = []
     for idx, score in zip(indices[0], scores[0], strict=False):
         if idx == -1:
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.services.retrieval.index_store import IndexData
+
+
+@dataclass(frozen=True)
+class RetrievalFilter:
+    """Restricts retrieval to a subset of the indexed documents.
+
+    Applied inside BM25 scoring and the FAISS search (as an id selector), so
+    callers get ``limit`` matching hits instead of filtering a top-k afterwards.
+    """
+
+    doc_ids: frozenset[int] | None = None
+    exclude_doc_ids: frozenset[int] = frozenset()
+
+    @property
+    def is_empty(self) -> bool:
+        return self.doc_ids is None and not self.exclude_doc_ids
+
+
+def doc_positions(index_data: IndexData) -> dict[int, list[int]]:
+    if index_data.doc_positions is None:
+        positions: dict[int, list[int]] = {}
+        for idx, meta_item in enumerate(index_data.meta):
+            positions.setdefault(meta_item["doc_id"], []).append(idx)
+        index_data.doc_positions = positions
+    return index_data.doc_positions
+
+
+def sql_doc_filter(
+    retrieval_filter: RetrievalFilter | None,
+    column: str,
+) -> tuple[str, dict[str, list[int]]] | None:
+    """``AND`` clauses restricting ``column`` (a document id) for raw SQL retrievers.
+
+    Returns the clauses and their expanding parameters, or ``None`` when the
+    filter can match no document.
+    """
+    clauses: list[str] = []
+    params: dict[str, list[int]] = {}
+    if retrieval_filter is not None and retrieval_filter.doc_ids is not None:
+        if not retrieval_filter.doc_ids:
+            return None
+        clauses.append(f"AND {column} IN :filter_doc_ids")
+        params["filter_doc_ids"] = sorted(retrieval_filter.doc_ids)
+    if retrieval_filter is not None and retrieval_filter.exclude_doc_ids:
+        clauses.append(f"AND {column} NOT IN :filter_exclude_doc_ids")
+        params["filter_exclude_doc_ids"] = sorted(retrieval_filter.exclude_doc_ids)
+    return " ".join(clauses), params
+
+
+def chunk_positions(index_data: IndexData) -> dict[int, int]:
+    if index_data.chunk_positions is None:
+        index_data.chunk_positions = {
+            meta_item["chunk_id"]: idx for idx, meta_item in enumerate(index_data.meta)
+        }
+    return index_data.chunk_positions
+
+
+def allowed_mask(
+    index_data: IndexData,
+    retrieval_filter: RetrievalFilter | None,
+) -> bytearray | None:
+    """One byte per index position (1 = allowed), or ``None`` when nothing is filtered."""
+    if retrieval_filter is None or retrieval_filter.is_empty:
+        return None
+    positions = doc_positions(index_data)
+    if retrieval_filter.doc_ids is not None:
+        mask = bytearray(len(index_data.meta))
+        for doc_id in retrieval_filter.doc_ids:
+            for idx in positions.get(doc_id, ()):
+                mask[idx] = 1
+    else:
+        mask = bytearray(b"\x01") * len(index_data.meta)
+    for doc_id in retrieval_filter.exclude_doc_ids:
+        for idx in positions.get(doc_id, ()):
+            mask[idx] = 0
+    return mask
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
 
@@ -12,6 +12,10 @@ INDEX_FILENAME = "index.faiss"
 META_FILENAME = "meta.json"
 DIRTY_FILENAME = "dirty.flag"
 EMBEDDINGS_FILENAME = "embeddings.npy"
+TOKEN_CACHE_FILENAME = "tokens.sqlite"
+CHUNKS_FILENAME = "chunks.bin"
+CHUNK_OFFSETS_FILENAME = "chunks.offsets"
+CHUNK_HEADER_FILENAME = "chunks.json"
 
 
 @dataclass
@@ -23,6 +27,11 @@ class IndexData:
     meta: list[dict[str, int]]
     bm25: Any | None
     corpus_version: tuple[int, int]
+    # doc_id -> index positions, built lazily by filters.doc_positions.
+    doc_positions: dict[int, list[int]] | None = field(default=None, repr=False)
+    # chunk_id -> index position, built lazily by filters.chunk_positions.
+    chunk_positions: dict[int, int] | None = field(default=None, repr=False)
+    chunk_store: Any | None = field(default=None, repr=False)
 
 
 def index_paths() -> dict[str, Path] | None:
@@ -35,6 +44,10 @@ def index_paths() -> dict[str, Path] | None:
         "meta": base / META_FILENAME,
         "dirty": base / DIRTY_FILENAME,
         "embeddings": base / EMBEDDINGS_FILENAME,
+        "tokens": base / TOKEN_CACHE_FILENAME,
+        "chunks": base / CHUNKS_FILENAME,
+        "chunk_offsets": base / CHUNK_OFFSETS_FILENAME,
+        "chunk_header": base / CHUNK_HEADER_FILENAME,
     }
 
 
@@ -45,7 +58,7 @@ def mark_dirty_file() -> None:
 
 
 def clear_index_files(paths: dict[str, Path]) -> None:
-    for key in ("index", "meta", "embeddings"):
+    for key in ("index", "meta", "embeddings", "chunks", "chunk_offsets", "chunk_header"):
         try:
             paths[key].unlink(missing_ok=True)
         except OSError:
@@ -85,14 +98,21 @@ def current_fingerprint(
     tokenizer_version: str,
     cleaning_version: str,
     embedding_prefix_mode: bool,
+    embedding_backend: str,
+    vector_store: str = "faiss",
 ) -> dict[str, str | int | bool]:
-    return {
+    fingerprint: dict[str, str | int | bool] = {
         "embedding_model_name": model_name,
+        "embedding_backend": embedding_backend,
         "embedding_prefix_mode": embedding_prefix_mode,
         "embedding_dim": embedding_dim,
         "tokenizer_version": tokenizer_version,
         "CLEANING_VERSION": cleaning_version,
     }
+    # Only recorded when not the default, so existing FAISS indexes stay valid.
+    if vector_store != "faiss":
+        fingerprint["vector_store"] = vector_store
+    return fingerprint
 
 
 def corpus_version(meta: list[dict[str, int]]) -> tuple[int, int]:
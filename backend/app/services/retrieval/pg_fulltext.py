@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import logging
+from typing import Callable
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from .filters import RetrievalFilter, chunk_positions, sql_doc_filter
+from .index_store import IndexData
+
+logger = logging.getLogger(__name__)
+
+# Must match the text search configuration of document_chunks.search_vector
+# (alembic revision 0005_chunk_search_vector).
+FULLTEXT_CONFIG = "russian"
+# ts_rank_cd normalization: divide by 1 + log(document length), like BM25's
+# length normalization dampens long chunks.
+RANK_NORMALIZATION = 1
+
+_warned_unavailable = False
+
+# plainto_tsquery ANDs the lexemes; BM25 scores any chunk sharing a term, so
+# the lexemes are OR-ed instead.
+_SEARCH_SQL = f"""
+    WITH q AS (
+        SELECT replace(plainto_tsquery('{FULLTEXT_CONFIG}', :query)::text, '&', '|')::tsquery AS query
+    )
+    SELECT
+        document_chunks.id,
+        ts_rank_cd(document_chunks.search_vector, q.query, {RANK_NORMALIZATION}) AS score
+    FROM document_chunks
+    JOIN documents ON documents.id = document_chunks.document_id
+    CROSS JOIN q
+    WHERE documents.status = 'published'
+      AND document_chunks.search_vector @@ q.query
+      {{filters}}
+    ORDER BY score DESC, document_chunks.id ASC
+    LIMIT :limit
+"""
+
+
+def enabled(db: Session) -> bool:
+    """Whether lexical retrieval goes to Postgres instead of the in-memory BM25."""
+    global _warned_unavailable
+    if settings.lexical_retriever.lower() != "postgres":
+        return False
+    if db.get_bind().dialect.name == "postgresql":
+        return True
+    if not _warned_unavailable:
+        logger.warning("LEXICAL_RETRIEVER=postgres requires PostgreSQL; using BM25.")
+        _warned_unavailable = True
+    return False
+
+
+def fulltext_search(
+    db: Session,
+    index_data: IndexData,
+    query: str,
+    limit: int,
+    *,
+    sort_hits: Callable[[list[tuple[int, float]], list[dict[str, int]]], list[tuple[int, float]]],
+    retrieval_filter: RetrievalFilter | None = None,
+    allowed: bytearray | None = None,
+) -> list[tuple[int, float]]:
+    """Top ``limit`` chunks by ``ts_rank_cd``, as (index position, score) like ``bm25_search``.
+
+    Filters are applied in SQL so the limit counts matching chunks only.
+    Chunks missing from the loaded index (published after the last build) are
+    dropped, as BM25 would not know them either.
+    """
+    if limit <= 0 or not query.strip():
+        return []
+    doc_filter = sql_doc_filter(retrieval_filter, "document_chunks.document_id")
+    if doc_filter is None:
+        return []
+    clauses, doc_params = doc_filter
+    statement = text(_SEARCH_SQL.format(filters=clauses)).bindparams(
+        *(bindparam(name, expanding=True) for name in doc_params)
+    )
+    positions = chunk_positions(index_data)
+    hits: list[tuple[int, float]] = []
+    params = {"query": query, "limit": limit, **doc_params}
+    for chunk_id, score in db.execute(statement, params):
+        idx = positions.get(chunk_id)
+        if idx is None or (allowed is not None and not allowed[idx]):
+            continue
+        hits.append((idx, float(score)))
+    return sort_hits(hits, index_data.meta)
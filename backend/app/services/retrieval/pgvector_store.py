@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Callable, Iterable
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.core import timing
+from app.core.config import settings
+from . import faiss_index
+from .encoders import Encoder
+from .filters import RetrievalFilter, chunk_positions, sql_doc_filter
+from .index_store import IndexData
+
+logger = logging.getLogger(__name__)
+
+_available: bool | None = None
+
+# Embeddings are L2-normalized, so ranking by inner product (``<#>`` is its
+# negation) matches the FAISS IndexFlatIP backend.
+_SEARCH_SQL = """
+    SELECT
+        chunk_embeddings.chunk_id,
+        -(chunk_embeddings.embedding <#> CAST(:embedding AS vector)) AS score
+    FROM chunk_embeddings
+    JOIN document_chunks ON document_chunks.id = chunk_embeddings.chunk_id
+    JOIN documents ON documents.id = document_chunks.document_id
+    WHERE chunk_embeddings.model = :model
+      AND documents.status = 'published'
+      {filters}
+    ORDER BY chunk_embeddings.embedding <#> CAST(:embedding AS vector)
+    LIMIT :limit
+"""
+# pgvector keeps the declared dimension of a vector column in atttypmod.
+_DIMENSION_SQL = text(
+    "SELECT atttypmod FROM pg_attribute "
+    "WHERE attrelid = 'chunk_embeddings'::regclass AND attname = 'embedding'"
+)
+_STORED_SQL = text(
+    "SELECT chunk_id FROM chunk_embeddings WHERE model = :model AND chunk_id IN :chunk_ids"
+).bindparams(bindparam("chunk_ids", expanding=True))
+_UPSERT_SQL = text(
+    """
+    INSERT INTO chunk_embeddings (chunk_id, model, embedding)
+    VALUES (:chunk_id, :model, CAST(:embedding AS vector))
+    ON CONFLICT (chunk_id) DO UPDATE SET model = EXCLUDED.model, embedding = EXCLUDED.embedding
+    """
+)
+
+
+def _vector_literal(vector: Iterable[float]) -> str:
+    return "[" + ",".join(f"{float(value):.7g}" for value in vector) + "]"
+
+
+def _model_key(model_name: str, model: Encoder) -> str:
+    """Value of ``chunk_embeddings.model``: another ONNX export must not reuse vectors."""
+    if model.identity == "torch":
+        return model_name
+    return f"{model_name}#{model.identity}"
+
+
+def enabled(db: Session) -> bool:
+    """Whether vector search is served from the ``chunk_embeddings`` table."""
+    global _available
+    if settings.vector_backend.lower() != "pgvector":
+        return False
+    if _available is None:
+        _available = (
+            db.get_bind().dialect.name == "postgresql"
+            and db.execute(text("SELECT to_regclass('chunk_embeddings')")).scalar() is not None
+        )
+        if not _available:
+            logger.warning(
+                "VECTOR_BACKEND=pgvector needs PostgreSQL with the chunk_embeddings table "
+                "(alembic upgrade pgvector@head); using FAISS."
+            )
+        else:
+            _available = _dimension_matches(db)
+    return _available
+
+
+def _dimension_matches(db: Session) -> bool:
+    model = faiss_index.get_model()
+    if model is None:
+        # Nothing can be embedded either way; vector_search returns no hits.
+        return True
+    column = db.execute(_DIMENSION_SQL).scalar()
+    if column is None or column <= 0 or column == model.dimension():
+        return True
+    logger.warning(
+        "chunk_embeddings.embedding has %s dimensions but the encoder produces %s "
+        "(alembic -x pgvector_dim=N); using FAISS.",
+        column,
+        model.dimension(),
+    )
+    return False
+
+
+class PgVectorWriter:
+    """Stores passage embeddings during an index build, embedding only chunks
+    that have no vector for the current model yet.
+
+    Each slice is committed on its own connection, so the build's streaming
+    read of the corpus is not disturbed and finished slices survive a failed
+    build.
+    """
+
+    def __init__(self, engine: Engine, model: Encoder, *, model_name: str, total: int) -> None:
+        self._engine = engine
+        self._model = model
+        self._model_name = model_name
+        self._model_key = _model_key(model_name, model)
+        self._progress = faiss_index.BuildProgress(total)
+        self.embedded = 0
+
+    def add(self, rows: list[Any]) -> None:
+        if not rows:
+            return
+        with self._engine.begin() as connection:
+            stored = set(
+                connection.execute(
+                    _STORED_SQL,
+                    {"model": self._model_key, "chunk_ids": [row.id for row in rows]},
+                ).scalars()
+            )
+            missing = [row for row in rows if row.id not in stored]
+            if missing:
+                vectors = faiss_index.embed_passages(
+                    [row.text for row in missing],
+                    self._model,
+                    model_name=self._model_name,
+                )
+                connection.execute(
+                    _UPSERT_SQL,
+                    [
+                        {
+                            "chunk_id": row.id,
+                            "model": self._model_key,
+                            "embedding": _vector_literal(vector),
+                        }
+                        for row, vector in zip(missing, vectors, strict=True)
+                    ],
+                )
+        self.embedded += len(missing)
+        self._progress.advance(len(rows))
+
+
+def create_writer(
+    db: Session,
+    model: Encoder | None,
+    *,
+    model_name: str,
+    total: int,
+) -> PgVectorWriter | None:
+    if model is None or not faiss_index.NUMPY_AVAILABLE:
+        return None
+    bind = db.get_bind()
+    return PgVectorWriter(
+        getattr(bind, "engine", bind),
+        model,
+        model_name=model_name,
+        total=total,
+    )
+
+
+def vector_search(
+    db: Session,
+    index_data: IndexData,
+    query: str,
+    limit: int,
+    *,
+    sort_hits: Callable[[list[tuple[int, float]], list[dict[str, int]]], list[tuple[int, float]]],
+    retrieval_filter: RetrievalFilter | None = None,
+    allowed: bytearray | None = None,
+) -> list[tuple[int, float]]:
+    """HNSW search over ``chunk_embeddings``, as (index position, score) like FAISS.
+
+    Document filters are applied in SQL; HNSW filters while it scans, so a
+    narrow filter can return fewer than ``limit`` hits unless
+    PGVECTOR_EF_SEARCH is raised.
+    """
+    if not index_data.meta or limit <= 0:
+        return []
+    model = faiss_index.get_model()
+    if model is None or not faiss_index.NUMPY_AVAILABLE:
+        return []
+    doc_filter = sql_doc_filter(retrieval_filter, "document_chunks.document_id")
+    if doc_filter is None:
+        return []
+    clauses, doc_params = doc_filter
+    statement = text(_SEARCH_SQL.format(filters=clauses)).bindparams(
+        *(bindparam(name, expanding=True) for name in doc_params)
+    )
+    with timing.stage("embed"):
+        query_embedding = faiss_index.embed_query(query, model)
+    params = {
+        "embedding": _vector_literal(query_embedding),
+        "model": _model_key(faiss_index.effective_model_name(), model),
+        "limit": limit,
+        **doc_params,
+    }
+    with timing.stage("pgvector"):
+        # HNSW returns at most ef_search rows; SET LOCAL ends with the transaction.
+        ef_search = max(settings.pgvector_ef_search, limit)
+        db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+        rows = db.execute(statement, params).all()
+    positions = chunk_positions(index_data)
+    hits: list[tuple[int, float]] = []
+    for chunk_id, score in rows:
+        idx = positions.get(chunk_id)
+        if idx is None or (allowed is not None and not allowed[idx]):
+            continue
+        hits.append((idx, float(score)))
+    return sort_hits(hits, index_data.meta)
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import importlib.util
+import logging
+from functools import lru_cache
+from typing import Any
+
+# Availability is checked with find_spec so importing this module never pulls
+# in torch, faiss or spaCy; the libraries are imported on first use.
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+FAISS_AVAILABLE = importlib.util.find_spec("faiss") is not None
+SPACY_AVAILABLE = importlib.util.find_spec("spacy") is not None
+TORCH_AVAILABLE = importlib.util.find_spec("torch") is not None
+ONNXRUNTIME_AVAILABLE = importlib.util.find_spec("onnxruntime") is not None
+TRANSFORMERS_AVAILABLE = importlib.util.find_spec("transformers") is not None
+
+SPACY_MODEL_NAME = "ru_core_news_sm"
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def sentence_transformer_cls() -> Any | None:
+    if not SENTENCE_TRANSFORMERS_AVAILABLE:
+        return None
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer
+
+
+@lru_cache(maxsize=1)
+def onnxruntime() -> Any | None:
+    if not ONNXRUNTIME_AVAILABLE:
+        return None
+    import onnxruntime as onnxruntime_module  # type: ignore
+
+    return onnxruntime_module
+
+
+@lru_cache(maxsize=1)
+def auto_tokenizer_cls() -> Any | None:
+    if not TRANSFORMERS_AVAILABLE:
+        return None
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer
+
+
+def configure_torch_threads(num_threads: int) -> None:
+    if num_threads <= 0 or not TORCH_AVAILABLE:
+        return
+    import torch
+
+    torch.set_num_threads(num_threads)
+
+
+@lru_cache(maxsize=1)
+def faiss() -> Any | None:
+    if not FAISS_AVAILABLE:
+        return None
+    import faiss as faiss_module  # type: ignore
+
+    return faiss_module
+
+
+@lru_cache(maxsize=1)
+def spacy_nlp() -> Any | None:
+    if not SPACY_AVAILABLE:
+        return None
+    try:
+        import spacy  # type: ignore
+
+        return spacy.load(SPACY_MODEL_NAME)
+    except (OSError, RuntimeError, ValueError) as exc:
+        logger.warning("spaCy model %s unavailable.", SPACY_MODEL_NAME, exc_info=exc)
+        return None
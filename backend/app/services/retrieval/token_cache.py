@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from app.core import metrics
+from app.core.config import settings
+from .index_store import index_paths
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SEPARATOR = "\x1f"
+# SQLite's default limit on bound parameters is 999 on older builds.
+_LOOKUP_BATCH = 500
+
+
+def text_key(text: str, version: str) -> bytes:
+    return hashlib.blake2b(
+        f"{version}\0{text}".encode("utf-8"), digest_size=16
+    ).digest()
+
+
+class QueryTokenCache:
+    """Thread-safe LRU of query tokenizations, keyed on text and tokenizer version."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._items: OrderedDict[tuple[str, str], tuple[str, ...]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str, version: str) -> list[str] | None:
+        key = (version, text)
+        with self._lock:
+            tokens = self._items.get(key)
+            if tokens is not None:
+                self._items.move_to_end(key)
+        metrics.record_cache("bm25_query_tokens", hit=tokens is not None)
+        return list(tokens) if tokens is not None else None
+
+    def put(self, text: str, version: str, tokens: list[str]) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[(version, text)] = tuple(tokens)
+            self._items.move_to_end((version, text))
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+class CorpusTokenCache:
+    """Chunk tokenizations persisted next to the index, so a rebuild only
+    re-tokenizes chunks whose text (or the tokenizer) changed.
+
+    Keys looked up or written are remembered; ``prune`` drops every other
+    entry once a pass over the whole corpus has finished.
+    """
+
+    def __init__(self, path: Path, version: str) -> None:
+        self.version = version
+        self._seen: set[bytes] = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens "
+            "(key BLOB PRIMARY KEY, version TEXT NOT NULL, tokens TEXT NOT NULL)"
+        )
+        # Entries from an older tokenizer can never hit again.
+        self._conn.execute("DELETE FROM tokens WHERE version != ?", (version,))
+        self._conn.commit()
+
+    def get_many(self, texts: list[str]) -> list[list[str] | None]:
+        keys = [text_key(text, self.version) for text in texts]
+        self._seen.update(keys)
+        found: dict[bytes, str] = {}
+        try:
+            for start in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[start : start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, tokens FROM tokens WHERE key IN ({placeholders})",
+                    batch,
+                )
+                found.update(rows)
+        except sqlite3.Error as exc:
+            logger.warning("Token cache lookup failed.", exc_info=exc)
+        results: list[list[str] | None] = []
+        for key in keys:
+            value = found.get(key)
+            if value is None:
+                results.append(None)
+            else:
+                results.append(value.split(TOKEN_SEPARATOR) if value else [])
+        hits = sum(1 for item in results if item is not None)
+        metrics.record_cache("bm25_corpus_tokens", hit=True, count=hits)
+        metrics.record_cache("bm25_corpus_tokens", hit=False, count=len(results) - hits)
+        return results
+
+    def put_many(self, texts: list[str], tokenized: list[list[str]]) -> None:
+        rows = [
+            (text_key(text, self.version), self.version, TOKEN_SEPARATOR.join(tokens))
+            for text, tokens in zip(texts, tokenized, strict=True)
+        ]
+        self._seen.update(key for key, _, _ in rows)
+        try:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tokens (key, version, tokens) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+        except sqlite3.Error as exc:
+            logger.warning("Token cache write failed.", exc_info=exc)
+
+    def prune(self) -> int:
+        """Delete entries of chunks that were not part of this pass (deleted or edited)."""
+        try:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen (key BLOB PRIMARY KEY)")
+            self._conn.execute("DELETE FROM seen")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO seen (key) VALUES (?)",
+                ((key,) for key in self._seen),
+            )
+            removed = self._conn.execute(
+                "DELETE FROM tokens WHERE key NOT IN (SELECT key FROM seen)"
+            ).rowcount
+            self._conn.execute("DELETE FROM seen")
+            self._conn.commit()
+        except sqlite3.Error as exc:
+            logger.warning("Token cache prune failed.", exc_info=exc)
+            return 0
+        return removed
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+@contextmanager
+def corpus_token_cache(version: str) -> Iterator[CorpusTokenCache | None]:
+    paths = index_paths()
+    if not settings.bm25_token_cache or not paths:
+        yield None
+        return
+    try:
+        cache = CorpusTokenCache(paths["tokens"], version)
+    except sqlite3.Error as exc:
+        logger.warning("Token cache unavailable; tokenizing without it.", exc_info=exc)
+        yield None
+        return
+    try:
+        yield cache
+        # Only after a complete pass: an aborted build saw part of the corpus.
+        cache.prune()
+    finally:
+        cache.close()
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from app.db.session import get_sessionmaker
+from . import faiss_index
+from .api import ensure_index
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def mark_ready() -> None:
+    _ready.set()
+
+
+def run_warmup(db: Session) -> None:
+    start = time.perf_counter()
+    try:
+        model = faiss_index.get_model()
+        if model is not None:
+            # The first encode initializes torch kernels and the tokenizer.
+            faiss_index.embed_texts(
+                ["warmup"],
+                model,
+                is_query=True,
+                model_name=faiss_index.effective_model_name(),
+            )
+        index_data = ensure_index(db)
+        logger.info(
+            "Retrieval warm-up finished in %.2fs backend=%s chunks=%s",
+            time.perf_counter() - start,
+            index_data.backend,
+            len(index_data.meta),
+        )
+    except Exception:
+        # Requests still load the model and index lazily, so a failed warm-up
+        # must not keep the instance out of rotation forever.
+        logger.exception("Retrieval warm-up failed; continuing with lazy loading.")
+    finally:
+        mark_ready()
+
+
+def _warmup_worker() -> None:
+    db = get_sessionmaker()()
+    try:
+        run_warmup(db)
+    finally:
+        db.close()
+
+
+def start_warmup() -> threading.Thread:
+    thread = threading.Thread(target=_warmup_worker, name="retrieval-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -115,35 +115,56 @@ def clean_text_v3(
     return cleaned.strip()
 
 
-def make_snippet(text: str, query: str | None = None, max_length: int = 200) -> str:
+def snippet_forms(text: str) -> tuple[str, str]:
+    """Display text for snippets and its search-normalized form."""
     cleaned = " ".join(text.split()).replace("\u00ad", "")
+    return cleaned, _normalize_search_text(cleaned)
+
+
+def excerpt_forms(text: str) -> tuple[str, str]:
+    """Cleaned text for LLM excerpts and its search-normalized form."""
+    cleaned = clean_text_v3(text, keep_newlines=True)
+    return cleaned, _normalize_search_text(cleaned)
+
+
+def _query_tokens(query: str) -> list[str]:
+    raw_tokens = TOKEN_RE.findall(query)
+    normalized_tokens = [
+        _normalize_search_text(token)
+        for token in raw_tokens
+        if 3 <= len(token) <= 30
+    ]
+    alpha_tokens = [token for token in normalized_tokens if token.isalpha()]
+    tokens = alpha_tokens or normalized_tokens
+    return sorted(tokens, key=len, reverse=True)
+
+
+def make_snippet(text: str, query: str | None = None, max_length: int = 200) -> str:
+    cleaned, normalized = snippet_forms(text)
+    return snippet_from_forms(cleaned, normalized, query=query, max_length=max_length)
+
+
+def snippet_from_forms(
+    cleaned: str,
+    normalized: str,
+    *,
+    query: str | None = None,
+    max_length: int = 200,
+) -> str:
     if not cleaned:
         return ""
     if query:
-        lower_text = _normalize_search_text(cleaned)
-        lower_query = _normalize_search_text(query)
-        idx = lower_text.find(lower_query)
+        idx = normalized.find(_normalize_search_text(query))
+        if idx == -1:
+            for token in _query_tokens(query):
+                idx = normalized.find(token)
+                if idx != -1:
+                    break
         if idx != -1:
             start = max(0, idx - max_length // 4)
             end = min(len(cleaned), start + max_length)
             snippet = cleaned[start:end]
             return snippet if start == 0 else f"...{snippet}"
-        raw_tokens = TOKEN_RE.findall(query)
-        normalized_tokens = [
-            _normalize_search_text(token)
-            for token in raw_tokens
-            if 3 <= len(token) <= 30
-        ]
-        if normalized_tokens:
-            alpha_tokens = [token for token in normalized_tokens if token.isalpha()]
-            tokens = alpha_tokens or normalized_tokens
-            for token in sorted(tokens, key=len, reverse=True):
-                idx = lower_text.find(token)
-                if idx != -1:
-                    start = max(0, idx - max_length // 4)
-                    end = min(len(cleaned), start + max_length)
-                    snippet = cleaned[start:end]
-                    return snippet if start == 0 else f"...{snippet}"
     return cleaned[:max_length]
 
 
@@ -152,7 +173,17 @@ def make_llm_excerpt(
     query: str | None = None,
     max_length: int = 1200,
 ) -> str:
-    cleaned = clean_text_v3(text, keep_newlines=True)
+    cleaned, normalized = excerpt_forms(text)
+    return llm_excerpt_from_forms(cleaned, normalized, query=query, max_length=max_length)
+
+
+def llm_excerpt_from_forms(
+    cleaned: str,
+    normalized_text: str,
+    *,
+    query: str | None = None,
+    max_length: int = 1200,
+) -> str:
     if not cleaned:
         return ""
 
@@ -174,24 +205,14 @@ def make_llm_excerpt(
         return excerpt
 
     if query:
-        normalized_text = _normalize_search_text(cleaned)
         normalized_query = _normalize_search_text(query)
         if normalized_query:
             idx = normalized_text.find(normalized_query)
             if idx != -1:
                 return build_window(idx, idx + len(normalized_query))
-        raw_tokens = TOKEN_RE.findall(query)
-        normalized_tokens = [
-            _normalize_search_text(token)
-            for token in raw_tokens
-            if 3 <= len(token) <= 30
-        ]
-        if normalized_tokens:
-            alpha_tokens = [token for token in normalized_tokens if token.isalpha()]
-            tokens = alpha_tokens or normalized_tokens
-            for token in sorted(tokens, key=len, reverse=True):
-                idx = normalized_text.find(token)
-                if idx != -1:
-                    return build_window(idx, idx + len(token))
+        for token in _query_tokens(query):
+            idx = normalized_text.find(token)
+            if idx != -1:
+                return build_window(idx, idx + len(token))
 
     return build_window(0, min(len(cleaned), max_length))
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core import metrics
+from app.core.config import settings
+from app.models.user import User
+
+
+class UserCache:
+    """Short-TTL cache of authenticated users, keyed on the token subject (email).
+
+    Entries are detached copies of the column values; ``get`` merges them into
+    the request session without a SELECT, so routes can still modify the user.
+    Routes that change a user's flags or password call ``invalidate``; the TTL
+    bounds staleness across worker processes.
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._items: OrderedDict[str, tuple[float, dict[str, object]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.maxsize > 0
+
+    def get(self, db: Session, subject: str) -> User | None:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(subject)
+            if item is not None and item[0] <= now:
+                del self._items[subject]
+                item = None
+            if item is not None:
+                self._items.move_to_end(subject)
+        metrics.record_cache("auth_user", hit=item is not None)
+        if item is None:
+            return None
+        user = User(**item[1])
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    def put(self, subject: str, user: User) -> None:
+        if not self.enabled:
+            return
+        values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        with self._lock:
+            self._items[subject] = (time.monotonic() + self.ttl_seconds, values)
+            self._items.move_to_end(subject)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, subject: str) -> None:
+        with self._lock:
+            self._items.pop(subject, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+user_cache = UserCache(
+    ttl_seconds=settings.auth_user_cache_ttl_seconds,
+    maxsize=settings.auth_user_cache_size,
+)
@@ -1,52 +1,86 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 from app.api import deps
 from app.db.base import Base
 from app.main import app
+from app.services.user_cache import user_cache
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+@pytest.fixture(scope="session")
+def database_path(tmp_path_factory):
+    # A file, so the sync engine and the aiosqlite engine see the same data.
+    path = tmp_path_factory.mktemp("db") / "test.db"
+    engine = create_engine(f"sqlite+pysqlite:///{path}")
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+    engine.dispose()
+    return path
 
 
 @pytest.fixture(scope="session")
-def engine():
+def engine(database_path):
     engine = create_engine(
-        "sqlite+pysqlite:///:memory:",
+        f"sqlite+pysqlite:///{database_path}",
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
     )
-    @event.listens_for(engine, "connect")
-    def _set_sqlite_pragma(dbapi_connection, connection_record):
-        cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA foreign_keys=ON")
-        cursor.close()
+    event.listen(engine, "connect", _set_sqlite_pragmas)
     Base.metadata.create_all(engine)
     yield engine
     Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def async_engine(database_path, engine):
+    # NullPool: each TestClient runs its own event loop, so connections are not reused.
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{database_path}",
+        poolclass=NullPool,
+    )
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return async_engine
 
 
 @pytest.fixture
 def db_session(engine):
-    connection = engine.connect()
-    transaction = connection.begin()
-    SessionLocal = sessionmaker(bind=connection, expire_on_commit=False)
+    SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
     session = SessionLocal()
     yield session
     session.close()
-    transaction.rollback()
-    connection.close()
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
 
 
 @pytest.fixture
-def client(db_session):
+def client(db_session, async_engine):
     def override_get_db():
         yield db_session
 
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncSessionLocal() as session:
+            yield session
+
     app.dependency_overrides[deps.get_db] = override_get_db
+    app.dependency_overrides[deps.get_async_db] = override_get_async_db
     original_startup = list(app.router.on_startup)
     app.router.on_startup.clear()
+    user_cache.clear()
     with TestClient(app) as client:
         yield client
+    user_cache.clear()
     app.dependency_overrides.clear()
     app.router.on_startup = original_startup
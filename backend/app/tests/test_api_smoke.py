@@ -1,3 +1,30 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+from app.core.security import get_password_hash
+from app.api.routes import rag, search
+from app.models.document import Document, DocumentChunk
+from app.models.query import Query
+from app.models.user import User
+from app.services.retrieval import api as retrieval_api, warmup
+
+
+def _auth_headers(client, email="user@example.com"):
+    client.post(
+        "/auth/register",
+        json={
+            "email": email,
+            "display_name": "User",
+            "password": "password123",
+            "confirm_password": "password123",
+        },
+    )
+    login_response = client.post("/auth/login", json={"email": email, "password": "password123"})
+    return {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+
 def test_docs_is_json(client):
     response = client.get("/docs")
     assert response.status_code == 200
@@ -12,6 +39,14 @@ def test_health(client):
     assert response.json() == {"status": "ok"}
 
 
+def test_ready_after_warmup(client, db_session):
+    assert client.get("/ready").status_code == 503
+    warmup.run_warmup(db_session)
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready"}
+
+
 def test_auth_flow(client):
     register_payload = {
         "email": "user@example.com",
@@ -31,3 +66,240 @@ def test_auth_flow(client):
     me_response = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
     assert me_response.status_code == 200
     assert me_response.json()["email"] == "user@example.com"
+
+
+def test_cached_user_invalidated_on_change(client, db_session):
+    db_session.add(
+        User(
+            email="admin@example.com",
+            display_name="Admin",
+            password_hash=get_password_hash("password123"),
+            is_admin=True,
+        )
+    )
+    db_session.commit()
+    admin_headers = _auth_headers(client, email="admin@example.com")
+    headers = _auth_headers(client)
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+
+    response = client.patch("/users/me", json={"display_name": "Renamed"}, headers=headers)
+    assert response.status_code == 200
+    assert client.get("/auth/me", headers=headers).json()["display_name"] == "Renamed"
+
+    assert client.post(f"/admin/users/{user_id}/block", headers=admin_headers).status_code == 200
+    response = client.get("/auth/me", headers=headers)
+    assert response.status_code == 403
+    assert response.json()["error_code"] == "ACCOUNT_BLOCKED"
+
+
+def test_metrics(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "rag_stage_seconds" in response.text
+    assert "rag_llm_fallback_total" in response.text
+
+
+def test_rag_ask_server_timing(client):
+    response = client.post(
+        "/rag/ask",
+        json={"question": "Что такое лицей?"},
+        headers=_auth_headers(client),
+    )
+    assert response.status_code == 200
+    server_timing = response.headers["Server-Timing"]
+    for stage in ("auth", "index", "sources", "llm", "db"):
+        assert f"{stage};dur=" in server_timing
+    assert response.json()["timings"] is None
+
+
+def test_rag_ask_releases_session_before_llm(client, db_session, async_engine, monkeypatch):
+    in_transaction = []
+    checked_out = []
+
+    def checkout(*args):
+        checked_out.append(1)
+
+    def checkin(*args):
+        checked_out.pop()
+
+    def generate(question, sources):
+        in_transaction.append((db_session.in_transaction(), len(checked_out)))
+        return rag.LLMResult(answer="Ответ", provider="stub", model="stub")
+
+    monkeypatch.setattr(rag, "generate_answer_with_meta", generate)
+    headers = _auth_headers(client)
+    event.listen(async_engine.sync_engine, "checkout", checkout)
+    event.listen(async_engine.sync_engine, "checkin", checkin)
+    try:
+        response = client.post(
+            "/rag/ask",
+            json={"question": "Что такое лицей?"},
+            headers=headers,
+        )
+    finally:
+        event.remove(async_engine.sync_engine, "checkout", checkout)
+        event.remove(async_engine.sync_engine, "checkin", checkin)
+    assert response.status_code == 200
+    # Neither the retrieval session nor the async one holds a connection.
+    assert in_transaction == [(False, 0)]
+
+
+def test_search_reads_chunks_on_async_session(client, db_session, monkeypatch):
+    document = Document(
+        original_name="lyceum.txt",
+        stored_filename="/nonexistent/lyceum.txt",
+        mime_type="text/plain",
+        title="Лицей",
+        status="published",
+    )
+    db_session.add(document)
+    db_session.flush()
+    chunk = DocumentChunk(document_id=document.id, chunk_index=0, text="Лицей — учебное заведение.")
+    db_session.add(chunk)
+    db_session.commit()
+    # No chunk store is loaded, so titles and texts come from the database.
+    monkeypatch.setattr(retrieval_api, "_index_cache", None)
+    monkeypatch.setattr(
+        search, "search_chunks", lambda db, query, limit, retrieval_filter: [(chunk.id, 0.5)]
+    )
+
+    response = client.get("/search", params={"q": "лицей"}, headers=_auth_headers(client))
+    assert response.status_code == 200
+    assert [(item["chunk_id"], item["title"], item["score"]) for item in response.json()] == [
+        (chunk.id, "Лицей", 0.5)
+    ]
+
+
+def test_history_after_ask(client):
+    headers = _auth_headers(client)
+    answer = client.post("/rag/ask", json={"question": "Что такое лицей?"}, headers=headers).json()
+
+    history = client.get("/history", headers=headers)
+    assert history.status_code == 200
+    assert [item["query_id"] for item in history.json()] == [answer["query_id"]]
+    assert history.json()[0]["latest_version_no"] == 1
+
+    detail = client.get(f"/history/{answer['query_id']}", headers=headers)
+    assert detail.status_code == 200
+    assert [version["version_id"] for version in detail.json()["versions"]] == [
+        answer["version_id"]
+    ]
+    assert client.get("/history/999999", headers=headers).status_code == 404
+
+
+def test_history_keyset_pages(client, db_session):
+    headers = _auth_headers(client)
+    user = db_session.query(User).filter(User.email == "user@example.com").one()
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    queries = [
+        Query(
+            user_id=user.id,
+            question=f"Question {idx}",
+            latest_version_no=idx,
+            # Two queries share each timestamp, so the cursor must break ties on id.
+            created_at=start + timedelta(minutes=idx // 2),
+        )
+        for idx in range(6)
+    ]
+    db_session.add_all(queries)
+    db_session.commit()
+
+    seen: list[int] = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/history", params=params, headers=headers)
+        assert response.status_code == 200
+        # The last page is full; no cursor may point past it to an empty page.
+        assert response.json()
+        seen.extend(item["query_id"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    expected = sorted(queries, key=lambda query: (query.created_at, query.id), reverse=True)
+    assert seen == [query.id for query in expected]
+    assert client.get("/history", params={"cursor": "bogus"}, headers=headers).status_code == 400
+
+
+def test_document_viewer_pages_and_etag(client, db_session):
+    document = Document(
+        original_name="doc.txt",
+        stored_filename="/nonexistent/doc.txt",
+        mime_type="text/plain",
+        status="published",
+    )
+    db_session.add(document)
+    db_session.flush()
+    db_session.add_all(
+        DocumentChunk(document_id=document.id, chunk_index=idx, text=f"Chunk {idx} " + "x " * 2000)
+        for idx in range(6)
+    )
+    db_session.commit()
+
+    seen: list[int] = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get(f"/docs/{document.id}", params=params)
+        assert response.status_code == 200
+        previews = response.json()["chunks_preview"]
+        # A full last page must not be followed by an empty one.
+        assert previews
+        assert all(len(preview["snippet"]) == 200 for preview in previews)
+        seen.extend(preview["chunk_index"] for preview in previews)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == [0, 1, 2, 3, 4, 5]
+
+    response = client.get(f"/docs/{document.id}")
+    assert response.headers["Cache-Control"].startswith("public")
+    etag = response.headers["ETag"]
+    cached = client.get(f"/docs/{document.id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+
+    document.status = "review"
+    db_session.commit()
+    assert client.get(f"/docs/{document.id}", headers={"If-None-Match": etag}).status_code == 404
+
+
+def test_download_ranges_and_conditional_requests(client, db_session, tmp_path):
+    path = tmp_path / "report.pdf"
+    content = bytes(range(256)) * 40
+    path.write_bytes(content)
+    document = Document(
+        original_name="отчёт.pdf",
+        stored_filename=str(path),
+        mime_type="application/pdf",
+        status="published",
+        content_sha256=hashlib.sha256(content).hexdigest(),
+    )
+    db_session.add(document)
+    db_session.commit()
+    url = f"/docs/{document.id}/download"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["Accept-Ranges"] == "bytes"
+    etag = response.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get(url, headers={"Range": "bytes=100-199", "If-Range": etag})
+    assert partial.status_code == 206
+    assert partial.content == content[100:200]
+    assert partial.headers["Content-Range"] == f"bytes 100-199/{len(content)}"
+    assert "filename*=utf-8''" in partial.headers["Content-Disposition"]
+    assert client.get(url, headers={"Range": "bytes=-10"}).content == content[-10:]
+    stale = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+    unsatisfiable = client.get(url, headers={"Range": f"bytes={len(content)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["Content-Range"] == f"bytes */{len(content)}"
+
+    listing = client.get("/docs")
+    assert [item["id"] for item in listing.json()] == [document.id]
+    assert client.get("/docs", headers={"If-None-Match": listing.headers["ETag"]}).status_code == 304
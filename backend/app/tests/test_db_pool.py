@@ -0,0 +1,33 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.db.pool import InstrumentedQueuePool
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, {"pool": "sync", **labels}) or 0.0
+
+
+def test_instrumented_pool_reports_usage_and_timeouts(tmp_path):
+    engine = create_engine(
+        f"sqlite+pysqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    waits = _sample("rag_db_pool_checkout_wait_seconds_count")
+    timeouts = _sample("rag_db_pool_timeouts_total")
+    try:
+        with engine.connect():
+            assert _sample("rag_db_pool_connections", state="checked_out") == 1
+            assert _sample("rag_db_pool_connections", state="capacity") == 1
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+        assert _sample("rag_db_pool_connections", state="checked_out") == 0
+        assert _sample("rag_db_pool_timeouts_total") == timeouts + 1
+        assert _sample("rag_db_pool_checkout_wait_seconds_count") == waits + 2
+    finally:
+        engine.dispose()
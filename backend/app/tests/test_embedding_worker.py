@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+from app.services.retrieval.embedding_worker import EmbeddingBatcher
+
+
+def test_batcher_groups_concurrent_requests():
+    batch_sizes = []
+    release = threading.Event()
+
+    def encode(texts):
+        release.wait(timeout=5)
+        batch_sizes.append(len(texts))
+        return [f"vec:{text}" for text in texts]
+
+    batcher = EmbeddingBatcher(encode, max_batch=16, max_wait_ms=50)
+    futures = {f"q{idx}": batcher.submit(f"q{idx}") for idx in range(8)}
+    release.set()
+
+    assert {text: future.result(timeout=5) for text, future in futures.items()} == {
+        text: f"vec:{text}" for text in futures
+    }
+    assert sum(batch_sizes) == 8
+    assert len(batch_sizes) < 8
+
+
+def test_batcher_propagates_encode_errors():
+    def encode(texts):
+        raise RuntimeError("model unavailable")
+
+    batcher = EmbeddingBatcher(encode, max_batch=4, max_wait_ms=1)
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        batcher.submit("query").result(timeout=5)
+
+
+def test_batcher_survives_mismatched_results():
+    calls = []
+
+    def encode(texts):
+        calls.append(len(texts))
+        # The first call returns too few embeddings, which zip(strict=True) rejects.
+        return [] if len(calls) == 1 else [f"vec:{text}" for text in texts]
+
+    batcher = EmbeddingBatcher(encode, max_batch=4, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.submit("first").result(timeout=5)
+    assert batcher.submit("second").result(timeout=5) == "vec:second"
@@ -0,0 +1,238 @@
+import itertools
+import json
+from dataclasses import asdict
+
+from sqlalchemy import create_engine, event, func, select
+
+from app.db.base import Base
+from app.models.document import Document, DocumentChunk
+from app.models.query import Citation, Query, QueryVersion
+from app.models.user import User
+from app.services.history_writer import HistoryRecord, HistoryWriter
+
+
+def _engine(tmp_path):
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'history.db'}")
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def _writer(engine, spill_path, counter):
+    return HistoryWriter(
+        engine,
+        allocate_id=lambda table: next(counter),
+        spill_path=spill_path,
+        interval=3600,
+        max_batch=100,
+    )
+
+
+def _seed(engine) -> tuple[int, int, int]:
+    with engine.begin() as connection:
+        user_id = connection.execute(
+            User.__table__.insert().values(
+                email="history@example.com",
+                display_name="User",
+                password_hash="hashed",
+            )
+        ).inserted_primary_key[0]
+        doc_id = connection.execute(
+            Document.__table__.insert().values(
+                original_name="doc.txt",
+                stored_filename="doc.txt",
+                mime_type="text/plain",
+                title="Doc",
+                status="published",
+            )
+        ).inserted_primary_key[0]
+        chunk_id = connection.execute(
+            DocumentChunk.__table__.insert().values(
+                document_id=doc_id, chunk_index=0, text="Example text"
+            )
+        ).inserted_primary_key[0]
+    return user_id, doc_id, chunk_id
+
+
+def _record(writer, user_id, doc_id, chunk_id, *, query_id=None, version_no=1):
+    new_query = query_id is None
+    if query_id is None:
+        query_id = writer.allocate_query_id()
+    version_id = writer.allocate_version_id()
+    return HistoryRecord(
+        query_id=query_id,
+        user_id=user_id,
+        question="What is this?",
+        version_id=version_id,
+        version_no=version_no,
+        answer=f"Answer {version_no}",
+        new_query=new_query,
+        citations=[
+            {
+                "query_version_id": version_id,
+                "source_no": 1,
+                "document_id": doc_id,
+                "chunk_id": chunk_id,
+                "snippet": "Example text",
+            }
+        ],
+    )
+
+
+def _count(engine, model) -> int:
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(model)).scalar_one()
+
+
+def _spilled_versions(spill_path) -> list[int]:
+    lines = spill_path.read_text(encoding="utf-8").splitlines()
+    return [json.loads(line)["version_id"] for line in lines]
+
+
+def test_history_writer_flushes_batch(tmp_path):
+    engine = _engine(tmp_path)
+    user_id, doc_id, chunk_id = _seed(engine)
+    spill_path = tmp_path / "pending.jsonl"
+    writer = _writer(engine, spill_path, itertools.count(1))
+    writer.start()
+    try:
+        first = _record(writer, user_id, doc_id, chunk_id)
+        writer.submit(first)
+        writer.submit(
+            _record(writer, user_id, doc_id, chunk_id, query_id=first.query_id, version_no=2)
+        )
+        assert writer.pending_version_no(first.query_id) == 2
+        assert _count(engine, QueryVersion) == 0
+
+        writer.flush()
+
+        assert writer.pending_version_no(first.query_id) == 0
+        assert _count(engine, Query) == 1
+        with engine.connect() as connection:
+            assert connection.execute(select(Query.latest_version_no)).scalar_one() == 2
+        assert _count(engine, QueryVersion) == 2
+        assert _count(engine, Citation) == 2
+        assert spill_path.read_text(encoding="utf-8") == ""
+    finally:
+        writer.stop()
+
+
+def test_history_writer_replays_spill_file(tmp_path):
+    engine = _engine(tmp_path)
+    user_id, doc_id, chunk_id = _seed(engine)
+    spill_path = tmp_path / "pending.jsonl"
+    counter = itertools.count(1)
+    record = _record(_writer(engine, spill_path, counter), user_id, doc_id, chunk_id)
+    # A crash left an acknowledged record and a torn line behind.
+    spill = json.dumps(asdict(record)) + "\n" + '{"query_id": 1, "user_'
+    spill_path.write_text(spill, encoding="utf-8")
+
+    writer = _writer(engine, spill_path, counter)
+    writer.start()
+    writer.stop()
+
+    assert _count(engine, Query) == 1
+    assert _count(engine, QueryVersion) == 1
+    assert _count(engine, Citation) == 1
+    assert spill_path.read_text(encoding="utf-8") == ""
+
+    # Replaying records that were already inserted is a no-op.
+    spill_path.write_text(spill, encoding="utf-8")
+    writer = _writer(engine, spill_path, counter)
+    writer.start()
+    writer.stop()
+
+    assert _count(engine, QueryVersion) == 1
+    assert _count(engine, Citation) == 1
+
+
+def test_history_writer_trims_spill_per_batch(tmp_path):
+    engine = _engine(tmp_path)
+    user_id, doc_id, chunk_id = _seed(engine)
+    spill_path = tmp_path / "pending.jsonl"
+    writer = _writer(engine, spill_path, itertools.count(1))
+    writer.start()
+    try:
+        flushed = _record(writer, user_id, doc_id, chunk_id)
+        arriving = _record(writer, user_id, doc_id, chunk_id)
+        writer.submit(flushed)
+        insert = writer._insert
+
+        def insert_under_traffic(batch):
+            # Another answer is acknowledged while the batch is being written.
+            writer.submit(arriving)
+            insert(batch)
+
+        writer._insert = insert_under_traffic
+        writer.flush()
+
+        assert _count(engine, QueryVersion) == 1
+        assert _spilled_versions(spill_path) == [arriving.version_id]
+    finally:
+        writer._insert = insert
+        writer.stop()
+    assert _count(engine, QueryVersion) == 2
+    assert spill_path.read_text(encoding="utf-8") == ""
+
+
+def test_history_writer_keeps_batch_after_unexpected_error(tmp_path):
+    engine = _engine(tmp_path)
+    user_id, doc_id, chunk_id = _seed(engine)
+    spill_path = tmp_path / "pending.jsonl"
+    writer = _writer(engine, spill_path, itertools.count(1))
+    writer.start()
+    try:
+        record = _record(writer, user_id, doc_id, chunk_id)
+        writer.submit(record)
+        insert = writer._insert
+
+        def broken_insert(batch):
+            raise TypeError("not serializable")
+
+        writer._insert = broken_insert
+        writer.flush()
+        writer._insert = insert
+
+        assert _count(engine, QueryVersion) == 0
+        assert writer.pending_version_no(record.query_id) == 1
+        assert _spilled_versions(spill_path) == [record.version_id]
+
+        writer.flush()
+
+        assert _count(engine, QueryVersion) == 1
+        assert spill_path.read_text(encoding="utf-8") == ""
+    finally:
+        writer.stop()
+
+
+def test_history_writer_sets_aside_rejected_records(tmp_path):
+    engine = _engine(tmp_path)
+    user_id, doc_id, chunk_id = _seed(engine)
+    spill_path = tmp_path / "pending.jsonl"
+    writer = _writer(engine, spill_path, itertools.count(1))
+    writer.start()
+    try:
+        good = _record(writer, user_id, doc_id, chunk_id)
+        # The user no longer exists, so the query row itself is rejected.
+        orphan = _record(writer, user_id + 100, doc_id, chunk_id)
+        writer.submit(orphan)
+        writer.submit(good)
+        writer.flush()
+
+        assert _count(engine, QueryVersion) == 1
+        assert spill_path.read_text(encoding="utf-8") == ""
+        failed = (tmp_path / "pending.failed.jsonl").read_text(encoding="utf-8").splitlines()
+        assert [json.loads(line)["version_id"] for line in failed] == [orphan.version_id]
+    finally:
+        writer.stop()
+
+    # After stop, submit writes synchronously instead of queueing.
+    late = _record(writer, user_id, doc_id, chunk_id)
+    writer.submit(late)
+    assert _count(engine, QueryVersion) == 2
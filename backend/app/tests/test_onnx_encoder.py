@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from app.services.retrieval import encoders, providers
+
+ONNX_PATH = os.getenv("EMBEDDING_ONNX_PATH")
+
+TEXTS = [
+    "query: Какие документы нужны для поступления в лицей?",
+    "passage: Приём в лицей осуществляется на основании заявления родителей.",
+    "passage: Учебный год начинается 1 сентября и заканчивается в мае.",
+]
+
+
+def test_onnx_identity_tracks_the_export(tmp_path):
+    (tmp_path / "model.onnx").write_bytes(b"fp32 weights")
+    fp32 = encoders.onnx_identity(encoders.onnx_model_file(tmp_path))
+    assert fp32 == encoders.onnx_identity(tmp_path / "model.onnx")
+
+    # The quantized model is preferred and fingerprints differently.
+    (tmp_path / "model_quantized.onnx").write_bytes(b"int8 weights")
+    quantized = encoders.onnx_identity(encoders.onnx_model_file(tmp_path))
+    assert quantized.startswith("onnx:model_quantized.onnx:")
+    assert quantized != fp32
+
+    (tmp_path / "model_quantized.onnx").write_bytes(b"other int8 weights")
+    assert encoders.onnx_identity(tmp_path / "model_quantized.onnx") != quantized
+
+
+def test_onnx_export_must_match_model_name(tmp_path):
+    # Exports without export.json are accepted with a warning.
+    encoders.check_onnx_export(tmp_path, "intfloat/multilingual-e5-base")
+
+    info = {"model_name": "intfloat/multilingual-e5-small", "quantized": True}
+    (tmp_path / encoders.ONNX_EXPORT_INFO_FILENAME).write_text(json.dumps(info))
+    encoders.check_onnx_export(tmp_path, "intfloat/multilingual-e5-small")
+    with pytest.raises(ValueError, match="multilingual-e5-small"):
+        encoders.check_onnx_export(tmp_path, "intfloat/multilingual-e5-base")
+
+
+@pytest.mark.skipif(
+    not (
+        ONNX_PATH
+        and providers.ONNXRUNTIME_AVAILABLE
+        and providers.SENTENCE_TRANSFORMERS_AVAILABLE
+    ),
+    reason="needs EMBEDDING_ONNX_PATH, onnxruntime and sentence-transformers",
+)
+def test_onnx_embeddings_match_torch():
+    np = pytest.importorskip("numpy")
+    model_name = os.getenv("EMBEDDING_MODEL_NAME", "intfloat/multilingual-e5-base")
+    torch_encoder = encoders.TorchEncoder(
+        providers.sentence_transformer_cls()(model_name, device="cpu")
+    )
+    onnx_encoder = encoders.OnnxEncoder(ONNX_PATH, model_name=model_name)
+
+    torch_vectors = torch_encoder.encode(TEXTS)
+    onnx_vectors = onnx_encoder.encode(TEXTS)
+
+    assert onnx_vectors.shape == torch_vectors.shape
+    cosine = np.sum(torch_vectors * onnx_vectors, axis=1)
+    assert cosine.min() > 0.98
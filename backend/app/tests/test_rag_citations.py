@@ -47,10 +47,69 @@ def test_store_citations_skips_missing_chunks(db_session):
         ),
     ]
 
-    skipped_count = rag_routes._store_citations(db_session, version, sources)
+    skipped_count = rag_routes._store_citations(db_session, version.id, sources)
     db_session.commit()
 
     citations = db_session.query(Citation).order_by(Citation.source_no).all()
     assert skipped_count == 1
     assert len(citations) == 1
     assert citations[0].chunk_id == chunk.id
+
+
+def test_persist_answer_single_transaction(db_session):
+    user = User(
+        email="persist@example.com",
+        display_name="User",
+        password_hash="hashed",
+    )
+    document = Document(
+        original_name="doc.txt",
+        stored_filename="doc.txt",
+        mime_type="text/plain",
+        title="Doc",
+        status="published",
+    )
+    chunk = DocumentChunk(document=document, chunk_index=0, text="Example text")
+    db_session.add_all([user, document, chunk])
+    db_session.commit()
+    sources = [
+        RagSource(
+            source_no=1,
+            doc_id=document.id,
+            title=document.title,
+            chunk_id=chunk.id,
+            snippet="Example text",
+        )
+    ]
+
+    query_id, version_id = rag_routes._persist_answer(
+        db_session,
+        query_id=None,
+        user_id=user.id,
+        question="What is this?",
+        version_no=1,
+        answer="Answer",
+        sources=sources,
+    )
+    _, second_version_id = rag_routes._persist_answer(
+        db_session,
+        query_id=query_id,
+        user_id=user.id,
+        question="What is this?",
+        version_no=2,
+        answer="Another answer",
+        sources=[],
+    )
+
+    versions = (
+        db_session.query(QueryVersion)
+        .filter(QueryVersion.query_id == query_id)
+        .order_by(QueryVersion.version_no)
+        .all()
+    )
+    assert [version.id for version in versions] == [version_id, second_version_id]
+    stored_query = db_session.get(Query, query_id)
+    assert stored_query.question == "What is this?"
+    assert stored_query.latest_version_no == 2
+    citations = db_session.query(Citation).filter(Citation.query_version_id == version_id).all()
+    assert [citation.chunk_id for citation in citations] == [chunk.id]
@@ -0,0 +1,359 @@
+import random
+from collections import namedtuple
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.core.config import settings
+from app.services.retrieval import api, bm25, faiss_index, pg_fulltext, pgvector_store, rrf
+from app.services.retrieval.bm25 import (
+    TOKENIZE_BATCH_SIZE,
+    BM25Builder,
+    corpus_tokenizer,
+    tokenize,
+    tokenize_corpus,
+    tokenizer_pool,
+)
+from app.services.retrieval.chunk_store import ChunkStoreWriter, StoredChunk, load_chunk_store
+from app.services.retrieval.faiss_index import plan_length_batches
+from app.services.retrieval.filters import RetrievalFilter, allowed_mask
+from app.services.retrieval.index_store import IndexData
+from app.services.retrieval.token_cache import CorpusTokenCache
+
+
+def test_plan_length_batches_respects_token_budget():
+    lengths = [300, 12, 512, 40, 41, 12, 200, 7, 512, 60]
+    batches = plan_length_batches(lengths, token_budget=600, max_batch=4)
+
+    assert sorted(idx for batch in batches for idx in batch) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) <= 4
+        longest = max(lengths[idx] for idx in batch)
+        assert len(batch) == 1 or longest * len(batch) <= 600
+    flat_lengths = [lengths[idx] for batch in batches for idx in batch]
+    assert flat_lengths == sorted(flat_lengths)
+
+
+# BM25Okapi(corpus).get_scores(query) from rank_bm25 0.2.2, which the index
+# replaced; pinned here so the parity check runs without that package.
+REFERENCE_BM25_CORPUS = [
+    ["налог", "вычет", "имущество"],
+    ["налог", "ставка"],
+    ["договор", "аренда", "имущество", "имущество"],
+    ["ставка", "аренда"],
+    ["вычет"],
+]
+REFERENCE_BM25_QUERY = ["имущество", "ставка", "неизвестно", "имущество"]
+REFERENCE_BM25_SCORES = [
+    0.6048939085325177,
+    0.36375376932023024,
+    0.7916993802852069,
+    0.36375376932023024,
+    0.0,
+]
+
+
+def test_bm25_index_matches_reference_scores():
+    builder = BM25Builder()
+    for tokens in REFERENCE_BM25_CORPUS:
+        builder.add(tokens)
+    index = builder.build()
+
+    scores = index.get_scores(REFERENCE_BM25_QUERY)
+    for doc_idx, expected_score in enumerate(REFERENCE_BM25_SCORES):
+        assert scores.get(doc_idx, 0.0) == pytest.approx(expected_score)
+
+
+def test_bm25_builder_empty_corpus():
+    assert BM25Builder().build() is None
+
+
+def test_tokenize_corpus_pool_preserves_order():
+    words = ["налогообложение", "имущество", "арендатор", "ставка", "вычет"]
+    texts = [
+        f"{words[idx % len(words)]} договор {idx} {words[(idx * 3) % len(words)]}"
+        for idx in range(TOKENIZE_BATCH_SIZE * 2 + 7)
+    ]
+    with tokenizer_pool(workers=2) as pool:
+        assert pool is not None
+        parallel = tokenize_corpus(texts, pool=pool)
+    assert parallel == [tokenize(text) for text in texts]
+
+
+def test_corpus_tokenizer_drops_broken_pool(monkeypatch):
+    class BrokenPool:
+        calls = 0
+
+        def map(self, fn, batches):
+            BrokenPool.calls += 1
+            raise BrokenProcessPool("worker died")
+
+    @contextmanager
+    def broken_pool(workers=None):
+        yield BrokenPool()
+
+    monkeypatch.setattr(bm25, "tokenizer_pool", broken_pool)
+    monkeypatch.setattr(settings, "bm25_token_cache", False)
+    texts = [f"договор аренды {idx}" for idx in range(TOKENIZE_BATCH_SIZE * 2)]
+    with corpus_tokenizer() as tokenize_texts:
+        assert tokenize_texts(texts) == [tokenize(text) for text in texts]
+        assert tokenize_texts(texts) == [tokenize(text) for text in texts]
+    assert BrokenPool.calls == 1
+
+
+def test_corpus_token_cache_reuses_tokens(tmp_path, monkeypatch):
+    texts = ["налоговый вычет за квартиру", "", "договор аренды"]
+    cache = CorpusTokenCache(tmp_path / "tokens.sqlite", "v1")
+    assert tokenize_corpus(texts, cache=cache) == [tokenize(text) for text in texts]
+
+    def fail(_texts):
+        raise AssertionError("cached texts must not be re-tokenized")
+
+    monkeypatch.setattr("app.services.retrieval.bm25._tokenize_batch", fail)
+    assert tokenize_corpus(texts, cache=cache) == [tokenize(text) for text in texts]
+    cache.close()
+
+    # A later pass without the first chunk prunes its entry.
+    current = CorpusTokenCache(tmp_path / "tokens.sqlite", "v1")
+    current.get_many(texts[1:])
+    assert current.prune() == 1
+    assert current.get_many(texts) == [None, [], tokenize(texts[2])]
+    current.close()
+
+    stale = CorpusTokenCache(tmp_path / "tokens.sqlite", "v2")
+    assert stale.get_many(texts) == [None, None, None]
+    stale.close()
+
+
+def test_bm25_top_k_pruning_matches_exhaustive():
+    rng = random.Random(7)
+    vocabulary = [f"t{idx}" for idx in range(40)]
+    weights = [1.0 / (idx + 1) for idx in range(len(vocabulary))]
+    builder = BM25Builder()
+    documents = []
+    for _ in range(400):
+        tokens = rng.choices(vocabulary, weights=weights, k=rng.randint(3, 30))
+        documents.append(tokens)
+    # Duplicate documents produce exact score ties that the tie key must break.
+    documents.extend(documents[:20])
+    for tokens in documents:
+        builder.add(tokens)
+    index = builder.build()
+
+    def tie_key(doc):
+        return (doc % 7, doc)
+
+    for _ in range(30):
+        query = rng.sample(vocabulary, rng.randint(1, 12))
+        term_counts = index.term_ids(query)
+        scores = index.score_terms(term_counts)
+        exhaustive = sorted(
+            ((doc, score) for doc, score in scores.items() if score > 0),
+            key=lambda item: (-item[1], tie_key(item[0])),
+        )
+        for k in (1, 5, 20, 1000):
+            assert index.top_k(term_counts, k, tie_key) == exhaustive[:k]
+
+
+def test_bm25_top_k_respects_allowed_mask():
+    rng = random.Random(11)
+    vocabulary = [f"t{idx}" for idx in range(30)]
+    builder = BM25Builder()
+    for _ in range(300):
+        builder.add(rng.choices(vocabulary, k=rng.randint(3, 20)))
+    index = builder.build()
+
+    def tie_key(doc):
+        return (doc,)
+
+    narrow = bytearray(300)
+    for doc in rng.sample(range(300), 8):
+        narrow[doc] = 1
+    wide = bytearray(b"\x01") * 300
+    for doc in rng.sample(range(300), 120):
+        wide[doc] = 0
+    for allowed in (narrow, wide):
+        for _ in range(10):
+            term_counts = index.term_ids(rng.sample(vocabulary, 6))
+            scores = index.score_terms(term_counts)
+            expected = sorted(
+                ((doc, score) for doc, score in scores.items() if score > 0 and allowed[doc]),
+                key=lambda item: (-item[1], tie_key(item[0])),
+            )[:5]
+            assert index.top_k(term_counts, 5, tie_key, allowed=allowed) == expected
+
+
+def test_allowed_mask_from_filter():
+    index_data = IndexData(
+        backend="none",
+        use_faiss=False,
+        index=None,
+        embeddings=None,
+        meta=[
+            {"doc_id": 1, "chunk_id": 10, "chunk_index": 0},
+            {"doc_id": 2, "chunk_id": 20, "chunk_index": 0},
+            {"doc_id": 1, "chunk_id": 11, "chunk_index": 1},
+            {"doc_id": 3, "chunk_id": 30, "chunk_index": 0},
+        ],
+        bm25=None,
+        corpus_version=(4, 30),
+    )
+    assert allowed_mask(index_data, None) is None
+    assert allowed_mask(index_data, RetrievalFilter(doc_ids=frozenset({1}))) == bytearray(
+        [1, 0, 1, 0]
+    )
+    assert allowed_mask(
+        index_data, RetrievalFilter(exclude_doc_ids=frozenset({1, 3}))
+    ) == bytearray([0, 1, 0, 0])
+
+
+def test_chunk_store_round_trip(tmp_path):
+    paths = {
+        "chunks": tmp_path / "chunks.bin",
+        "chunk_offsets": tmp_path / "chunks.offsets",
+        "chunk_header": tmp_path / "chunks.json",
+    }
+    Row = namedtuple("Row", "id document_id chunk_index text")
+    writer = ChunkStoreWriter(paths)
+    writer.add([Row(10, 1, 0, "Налоговый вычет"), Row(11, 1, 1, "")])
+    writer.add([Row(20, 2, 0, "Договор аренды — квартира")])
+    store = writer.finish({1: "Кодекс", 2: None}, (3, 20))
+
+    assert store.get(10) == StoredChunk.from_text(
+        chunk_id=10, doc_id=1, title="Кодекс", text="Налоговый вычет"
+    )
+    assert store.get(20).excerpt_text == 'Договор аренды - квартира'
+    assert store.get(11).text == ""
+    assert store.get(20).text == "Договор аренды — квартира"
+    assert store.get(99) is None
+    assert load_chunk_store(paths, (3, 20)).get_many([20, 99]).keys() == {20}
+    assert load_chunk_store(paths, (4, 21)) is None
+
+
+def test_postgres_retrievers_need_postgres(db_session, monkeypatch):
+    assert not pg_fulltext.enabled(db_session)
+    assert not pgvector_store.enabled(db_session)
+    monkeypatch.setattr(settings, "lexical_retriever", "postgres")
+    monkeypatch.setattr(settings, "vector_backend", "pgvector")
+    monkeypatch.setattr(pgvector_store, "_available", None)
+    # The test database is SQLite, so retrieval keeps BM25 and FAISS.
+    assert not pg_fulltext.enabled(db_session)
+    assert not pgvector_store.enabled(db_session)
+
+
+def test_ensure_index_cache_hit_skips_lock(db_session, monkeypatch):
+    class _Unlockable:
+        def __enter__(self):
+            raise AssertionError("a cache hit must not take the index lock")
+
+        def __exit__(self, *exc_info):
+            return False
+
+    cached = IndexData(
+        backend="none",
+        use_faiss=False,
+        index=None,
+        embeddings=None,
+        meta=[],
+        bm25=object(),
+        corpus_version=(0, 0),
+    )
+    monkeypatch.setattr(faiss_index, "_model_failed", True)
+    monkeypatch.setattr(api, "_index_cache", cached)
+    monkeypatch.setattr(api, "_index_lock", _Unlockable())
+    assert api.ensure_index(db_session) is cached
+
+
+def test_postgres_fulltext_statement_compiles():
+    executed = []
+
+    class RecordingSession:
+        def execute(self, statement, params):
+            executed.append((statement, params))
+            return [(12, 0.5), (11, 0.25), (99, 0.1)]
+
+    meta = [
+        {"doc_id": 1, "chunk_id": 11, "chunk_index": 0},
+        {"doc_id": 2, "chunk_id": 12, "chunk_index": 0},
+    ]
+    index_data = IndexData(
+        backend="none",
+        use_faiss=False,
+        index=None,
+        embeddings=None,
+        meta=meta,
+        bm25=None,
+        corpus_version=(2, 12),
+    )
+    hits = pg_fulltext.fulltext_search(
+        RecordingSession(),
+        index_data,
+        "налоговый вычет",
+        5,
+        sort_hits=rrf.sort_hits,
+        retrieval_filter=RetrievalFilter(doc_ids=frozenset({1, 2}), exclude_doc_ids=frozenset({3})),
+    )
+    # Chunk 99 is not in the loaded index and is dropped.
+    assert hits == [(1, 0.5), (0, 0.25)]
+
+    statement, params = executed[0]
+    assert params["filter_doc_ids"] == [1, 2]
+    compiled = statement.bindparams(**params).compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={"render_postcompile": True},
+    )
+    sql = " ".join(str(compiled).split())
+    assert (
+        "replace(plainto_tsquery('russian', %(query)s)::text, '&', '|')::tsquery" in sql
+    )
+    assert "document_chunks.document_id IN (%(filter_doc_ids_1)s, %(filter_doc_ids_2)s)" in sql
+    assert "document_chunks.document_id NOT IN (%(filter_exclude_doc_ids_1)s)" in sql
+    assert "LIMIT %(limit)s" in sql
+    assert compiled.params["query"] == "налоговый вычет"
+
+
+def test_pgvector_statement_compiles(monkeypatch):
+    executed = []
+
+    class _Rows(list):
+        def all(self):
+            return list(self)
+
+    class RecordingSession:
+        def execute(self, statement, params=None):
+            executed.append((statement, params))
+            return _Rows([(12, 0.5), (99, 0.1)])
+
+    class _Encoder:
+        identity = "torch"
+
+    monkeypatch.setattr(faiss_index, "NUMPY_AVAILABLE", True)
+    monkeypatch.setattr(faiss_index, "get_model", lambda: _Encoder())
+    monkeypatch.setattr(faiss_index, "embed_query", lambda query, model: [0.5, -0.25])
+    index_data = IndexData(
+        backend="torch",
+        use_faiss=True,
+        index=None,
+        embeddings=None,
+        meta=[{"doc_id": 2, "chunk_id": 12, "chunk_index": 0}],
+        bm25=None,
+        corpus_version=(1, 12),
+    )
+    hits = pgvector_store.vector_search(
+        RecordingSession(),
+        index_data,
+        "налоговый вычет",
+        5,
+        sort_hits=rrf.sort_hits,
+    )
+    assert hits == [(0, 0.5)]
+
+    statement, params = executed[-1]
+    sql = " ".join(str(statement.compile(dialect=postgresql.dialect())).split())
+    # Chunks of unpublished documents keep their embeddings but are not returned.
+    assert "JOIN documents ON documents.id = document_chunks.document_id" in sql
+    assert "documents.status = 'published'" in sql
+    assert params["embedding"] == "[0.5,-0.25]"
+    assert params["model"] == faiss_index.effective_model_name()
@@ -20,7 +20,10 @@ cd /app
 export PYTHONPATH=/app
 
 if [ "${RUN_MIGRATIONS:-0}" = "1" ]; then
-  alembic upgrade head
+  alembic upgrade main@head
+  if [ "${VECTOR_BACKEND:-faiss}" = "pgvector" ]; then
+    alembic -x pgvector_dim="${PGVECTOR_DIM:-768}" upgrade pgvector@head
+  fi
 fi
 
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000
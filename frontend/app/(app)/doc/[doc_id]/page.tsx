@@ -52,6 +52,8 @@ export default function DocPage() {
   const [chunk, setChunk] = useState<ChunkDetail | null>(null);
   const [loadingDoc, setLoadingDoc] = useState(true);
   const [loadingChunk, setLoadingChunk] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
   const chunkId = searchParams.get("chunk");
@@ -73,6 +75,7 @@ export default function DocPage() {
         }
         const data = (await response.json()) as DocumentView;
         setDoc(data);
+        setNextCursor(response.headers.get("X-Next-Cursor"));
       } catch {
         setError("Не удалось загрузить документ");
       } finally {
@@ -106,6 +109,33 @@ export default function DocPage() {
     loadChunk();
   }, [ready, params.doc_id, chunkId, pushToast]);
 
+  const handleLoadMore = async () => {
+    if (!doc || !nextCursor) {
+      return;
+    }
+    setLoadingMore(true);
+    try {
+      const response = await apiFetch(
+        `/docs/${doc.doc_id}?cursor=${encodeURIComponent(nextCursor)}`
+      );
+      if (!response.ok) {
+        pushToast("Не удалось загрузить фрагменты", "error");
+        return;
+      }
+      const data = (await response.json()) as DocumentView;
+      setDoc((current) =>
+        current
+          ? { ...current, chunks_preview: [...current.chunks_preview, ...data.chunks_preview] }
+          : data
+      );
+      setNextCursor(response.headers.get("X-Next-Cursor"));
+    } catch {
+      pushToast("Не удалось загрузить фрагменты", "error");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDownload = async () => {
     if (!doc) {
       return;
@@ -203,6 +233,16 @@ export default function DocPage() {
               </Link>
             ))}
           </div>
+          {nextCursor && (
+            <button
+              type="button"
+              className="button secondary"
+              onClick={handleLoadMore}
+              disabled={loadingMore}
+            >
+              {loadingMore ? "Загрузка..." : "Показать ещё"}
+            </button>
+          )}
         </section>
       )}
     </div>